@@ -0,0 +1,200 @@
+import io
+import os
+import sys
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Size-bounded cache discarding the least recently used entries first.
+    Counts hits and misses.
+
+    Args:
+        maxsize (int): Maximum number of entries.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+    def report(self):
+        return '{0} hits, {1} misses, {2} entries'.format(
+            self.hits, self.misses, len(self.data))
+
+
+class HashIndex(object):
+    """
+    In-memory index of hash values to primary keys. If the table holds
+    more than limit rows, the index is partial: hits are still reliable,
+    misses are not.
+
+    Args:
+        limit (int): Maximum number of entries, None for no limit.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.data = {}
+        self.complete = False
+        # primary key => current hash of records changed after loading
+        self.changed = {}
+        self.entry_size = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def load(self, queryset, hashfield, chunk_size=10000):
+        """
+        Loads hash values and primary keys from queryset, fetching
+        chunk_size rows at a time.
+        """
+        self.data = {}
+        self.changed = {}
+        self.complete = True
+        values = queryset.values_list(hashfield, 'pk')
+        try:
+            rows = values.iterator(chunk_size=chunk_size)
+        except TypeError:
+            rows = values.iterator()
+        for value, pk in rows:
+            if self.limit is not None and len(self.data) >= self.limit:
+                self.complete = False
+                break
+            if value:
+                self.data[value] = pk
+        for value, pk in self.data.items():
+            self.entry_size = sys.getsizeof(value) + sys.getsizeof(pk)
+            break
+
+    def get(self, value):
+        """
+        Returns the primary key of the record with hash value or None.
+        """
+        pk = self.data.get(value)
+        if pk is not None and self.changed.get(pk, value) != value:
+            return None
+        return pk
+
+    def add(self, value, pk, changed=False):
+        """
+        Adds a hash value. Set changed if the record had a different hash
+        before. Beyond the limit the value is dropped and the index
+        becomes partial.
+        """
+        if changed:
+            self.changed[pk] = value
+        if self.limit is None or len(self.data) < self.limit:
+            self.data[value] = pk
+        else:
+            self.complete = False
+
+    def discard(self, value, pk, previous=None):
+        """
+        Reverts add, e.g. if the write was rolled back. previous is the
+        value changed held for pk before.
+        """
+        if self.data.get(value) == pk:
+            del self.data[value]
+        if previous is None:
+            self.changed.pop(pk, None)
+        else:
+            self.changed[pk] = previous
+
+    def memory(self):
+        """
+        Returns:
+            int: Estimated memory usage in bytes.
+        """
+        return (
+            sys.getsizeof(self.data) + sys.getsizeof(self.changed) +
+            len(self.data) * self.entry_size)
+
+    def report(self):
+        return '{0} hashes{1}, ~{2:.1f} MB'.format(
+            len(self.data), '' if self.complete else ' (partial)',
+            self.memory() / 1024.0 / 1024.0)
+
+
+def replace(source, destination):
+    """
+    Renames source to destination, replacing destination if it exists.
+    """
+    try:
+        os.replace(source, destination)
+    except AttributeError:
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+class FingerprintStore(object):
+    """
+    File-backed set of record fingerprints. The fingerprints of the
+    previous run are read by open, the fingerprints added during the
+    current run replace them on close.
+
+    Args:
+        filename (str): Path of the store.
+        output (str): Optional path the fingerprints are written to
+            instead of filename, e.g. to merge them later.
+    """
+
+    def __init__(self, filename, output=None):
+        self.filename = filename
+        self.output = output or filename
+        self.previous = set()
+        # tag => fingerprint
+        self.current = {}
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.previous
+
+    def open(self):
+        self.previous = set()
+        self.current = {}
+        if os.path.exists(self.filename):
+            with io.open(self.filename, encoding='ascii') as fil:
+                self.previous = set(line.strip() for line in fil)
+            self.previous.discard('')
+
+    def add(self, tag, fingerprint):
+        self.current[tag] = fingerprint
+
+    def discard(self, tag):
+        self.current.pop(tag, None)
+
+    def close(self):
+        tmp = '{0}.tmp'.format(self.output)
+        with io.open(tmp, 'w', encoding='ascii') as fil:
+            for fingerprint in self.current.values():
+                fil.write(u'{0}\n'.format(fingerprint))
+        replace(tmp, self.output)
+        self.previous = set()
+        self.current = {}
@@ -0,0 +1,91 @@
+from __future__ import print_function
+
+import io
+import json
+import os
+from collections import namedtuple
+from etl_sync.caches import replace
+
+
+# key identifies the source, line is the number of the next record,
+# offset its byte offset if known, counts the FeedbackCounter results
+Checkpoint = namedtuple('Checkpoint', ['key', 'line', 'offset', 'counts'])
+
+
+class FileCheckpointStore(object):
+    """
+    Stores checkpoints in a JSON file. As the file is not part of
+    database transactions, the Loader saves checkpoints once the
+    transaction is committed.
+
+    Args:
+        filename (str): Path of the store.
+    """
+    transactional = False
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def read(self):
+        if not os.path.exists(self.filename):
+            return {}
+        with io.open(self.filename, encoding='utf-8') as fil:
+            return json.load(fil)
+
+    def write(self, data):
+        tmp = '{0}.tmp'.format(self.filename)
+        with io.open(tmp, 'w', encoding='utf-8') as fil:
+            fil.write(json.dumps(data, indent=2, sort_keys=True))
+        replace(tmp, self.filename)
+
+    def get(self, key):
+        item = self.read().get(key)
+        if item is None:
+            return None
+        return Checkpoint(key, item['line'], item['offset'], item['counts'])
+
+    def save(self, checkpoint):
+        data = self.read()
+        data[checkpoint.key] = {
+            'line': checkpoint.line, 'offset': checkpoint.offset,
+            'counts': checkpoint.counts}
+        self.write(data)
+
+    def delete(self, key):
+        data = self.read()
+        if data.pop(key, None) is not None:
+            self.write(data)
+
+
+class DatabaseCheckpointStore(object):
+    """
+    Stores checkpoints in the etl_sync Checkpoint table of database
+    using. If that is the database loaded to, checkpoints are saved in
+    the same transaction as the records.
+
+    Args:
+        using (str): Database alias.
+    """
+    transactional = True
+
+    def __init__(self, using=None):
+        self.using = using
+
+    def get_queryset(self):
+        from etl_sync.models import Checkpoint as CheckpointModel
+        return CheckpointModel.objects.using(self.using)
+
+    def get(self, key):
+        item = self.get_queryset().filter(key=key).first()
+        if item is None:
+            return None
+        return Checkpoint(
+            key, item.line, item.offset, json.loads(item.counts or '{}'))
+
+    def save(self, checkpoint):
+        self.get_queryset().update_or_create(key=checkpoint.key, defaults={
+            'line': checkpoint.line, 'offset': checkpoint.offset,
+            'counts': json.dumps(checkpoint.counts)})
+
+    def delete(self, key):
+        self.get_queryset().filter(key=key).delete()
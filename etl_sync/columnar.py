@@ -0,0 +1,88 @@
+"""
+Column-wise coercion for batches of records. Each function converts a
+column, i.e. the values of one field across records, and returns the
+converted values together with a list flagging the cells that could
+not be converted. The results equal those of the respective
+InstanceGenerator.prepare_* methods applied value by value.
+"""
+from __future__ import print_function
+from six import text_type, binary_type
+from builtins import str as text
+
+
+TRUE_VALUES = (1, '1', 'True', 'true', 't')
+
+
+def pivot(dics, keys):
+    """
+    Returns:
+        list: One list of values per key, the columns of dics.
+    """
+    return [[dic[key] for dic in dics] for key in keys]
+
+
+def is_empty(value):
+    return value is None or value == ''
+
+
+def coerce_cells(function, values):
+    """
+    Converts value by value, cells raising ValueError or TypeError become
+    None and are flagged unless they are empty.
+    """
+    ret = []
+    invalid = []
+    for value in values:
+        if is_empty(value):
+            ret.append(None)
+            invalid.append(False)
+            continue
+        try:
+            ret.append(function(value))
+            invalid.append(False)
+        except (ValueError, TypeError):
+            ret.append(None)
+            invalid.append(True)
+    return ret, invalid
+
+
+def coerce_column(function, values):
+    """
+    Converts the column at once and value by value only if that fails.
+    """
+    try:
+        return list(map(function, values)), [False] * len(values)
+    except (ValueError, TypeError):
+        return coerce_cells(function, values)
+
+
+def coerce_integers(values):
+    """
+    Column version of InstanceGenerator.prepare_integer.
+    """
+    return coerce_column(int, values)
+
+
+def coerce_floats(values):
+    """
+    Column version of InstanceGenerator.prepare_float.
+    """
+    return coerce_column(float, values)
+
+
+def coerce_booleans(values):
+    """
+    Column version of InstanceGenerator.prepare_boolean.
+    """
+    return ([bool(value) and value in TRUE_VALUES for value in values],
+            [False] * len(values))
+
+
+def coerce_texts(values, max_length=None):
+    """
+    Column version of InstanceGenerator.prepare_text.
+    """
+    string_types = (text_type, binary_type)
+    return ([
+        (value if isinstance(value, string_types) else text(value))[
+            0:max_length] for value in values], [False] * len(values))
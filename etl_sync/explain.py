@@ -0,0 +1,237 @@
+"""
+Static load plans: which fields a generator resolves, how many queries
+a record costs in the worst case and which lookups lack a database index.
+The plan is derived from the model and the generator configuration, no
+records are read and no queries are run.
+"""
+from __future__ import print_function
+
+from etl_sync.generators import (
+    get_internal_type, get_lookup_field, get_unambiguous_fields,
+    get_unique_string_fields)
+
+
+def get_indexes(model_class):
+    """
+    Returns:
+        list: Tuples of the field names of the indexes and unique
+        constraints of model_class, in index order.
+    """
+    meta = model_class._meta
+    ret = []
+    for field in meta.concrete_fields:
+        if field.primary_key or field.unique or field.db_index:
+            ret.append((field.name,))
+    for names in meta.unique_together:
+        ret.append(tuple(names))
+    for names in getattr(meta, 'index_together', ()):
+        ret.append(tuple(names))
+    for index in getattr(meta, 'indexes', []):
+        ret.append(tuple(name.lstrip('-') for name in index.fields))
+    for constraint in getattr(meta, 'constraints', []):
+        if getattr(constraint, 'fields', None):
+            ret.append(tuple(constraint.fields))
+    return ret
+
+
+def is_indexed(model_class, names):
+    """
+    Returns True if an index of model_class can serve a lookup on the
+    fields names, i.e. the first field of the index is one of them.
+    """
+    names = set(names)
+    return any(index[0] in names for index in get_indexes(model_class))
+
+
+def get_label(model_class):
+    return '{0}.{1}'.format(
+        model_class._meta.app_label, model_class.__name__)
+
+
+def format_queries(queries):
+    if queries == int(queries):
+        return '{0}'.format(int(queries))
+    return '{0:.2f}'.format(queries)
+
+
+class LoadPlan(object):
+    """
+    Worst-case cost of loading a record, see InstanceGenerator.explain.
+    """
+
+    def __init__(self, model_class):
+        self.model_class = model_class
+        # (label, value) lines describing the configuration
+        self.settings = []
+        # (stage, queries per record, queries per related item, note)
+        self.steps = []
+        self.warnings = []
+
+    def add_setting(self, label, value):
+        self.settings.append((label, value))
+
+    def add_step(self, stage, queries, note, per_item=0):
+        self.steps.append((stage, queries, per_item, note))
+
+    def warn(self, message):
+        self.warnings.append(message)
+
+    def get_queries(self):
+        """
+        Returns:
+            tuple: (queries per record, queries per many-to-many item).
+        """
+        return (sum(step[1] for step in self.steps),
+                sum(step[2] for step in self.steps))
+
+    def format(self):
+        lines = ['Load plan for {0} (table {1})'.format(
+            get_label(self.model_class), self.model_class._meta.db_table)]
+        for label, value in self.settings:
+            lines.append('{0}: {1}'.format(label, value))
+        lines.append('Queries per record, worst case:')
+        for stage, queries, per_item, note in self.steps:
+            count = format_queries(queries)
+            if per_item:
+                count = '{0} + {1}/item'.format(
+                    count, format_queries(per_item))
+            lines.append('  {0:<10} {1:>12}  {2}'.format(stage, count, note))
+        queries, per_item = self.get_queries()
+        total = format_queries(queries)
+        if per_item:
+            total = '{0} + {1} per many-to-many item'.format(
+                total, format_queries(per_item))
+        lines.append('Total: {0}'.format(total))
+        if self.warnings:
+            lines.append('Warnings:')
+            lines.extend('  {0}'.format(warning) for warning in self.warnings)
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format()
+
+
+def describe_lookup(model_class, names):
+    """
+    Returns:
+        tuple: (description, warning or None) of a lookup on the fields
+        names of model_class.
+    """
+    label = '{0} on {1}'.format(get_label(model_class), ', '.join(names))
+    if any(get_lookup_field(model_class, name) is None for name in names):
+        return label, 'Lookup {0} is not on concrete fields'.format(label)
+    if not is_indexed(model_class, names):
+        return label, 'Lookup {0} has no supporting index'.format(label)
+    return label, None
+
+
+def get_related_lookup(field):
+    """
+    Returns:
+        list: Field names ForeignKey or ManyToMany values given as
+        dictionaries are looked up by, i.e. the persistence criterion of
+        the related model.
+    """
+    try:
+        return get_unambiguous_fields(field.related_model)
+    except Exception:
+        return []
+
+
+def explain_generator(generator, chunked=False):
+    """
+    Returns the LoadPlan of an InstanceGenerator. With chunked, lookups
+    are costed like in get_instances.
+    """
+    model_class = generator.model_class
+    plan = LoadPlan(model_class)
+    chunksize = float(generator.chunksize) if chunked else 1.0
+    hashfield = getattr(generator, 'hashfield', None)
+    bulksize = getattr(generator, 'bulksize', None)
+    upsert = hasattr(generator, 'get_upsert_method') and bool(
+        generator.get_upsert_method())
+
+    persistence = list(generator.persistence or [])
+    plan.add_setting('Persistence', ', '.join(persistence) or 'none')
+    if not persistence and not hashfield:
+        plan.warn('No persistence criterion, every record is created')
+    elif persistence:
+        label, warning = describe_lookup(model_class, persistence)
+        if warning:
+            plan.warn(warning)
+    if hashfield:
+        plan.add_setting('Hash field', hashfield)
+        if hashfield not in generator.field_names:
+            plan.warn('Hash field {0} is not a field of {1}'.format(
+                hashfield, get_label(model_class)))
+        else:
+            label, warning = describe_lookup(model_class, [hashfield])
+            if warning:
+                plan.warn(warning)
+
+    # lookup
+    if upsert:
+        plan.add_step('lookup', 0, 'left to INSERT ... ON CONFLICT')
+    else:
+        lookups = 1 + (1 if hashfield else 0)
+        note = 'persistence query'
+        if hashfield:
+            note = 'hash query, then persistence query if not found'
+            if getattr(generator, 'hash_index', None) is not None:
+                lookups -= 1
+                note = 'hash index in memory, then persistence query'
+        if chunked:
+            note += ', once per chunk of {0}'.format(generator.chunksize)
+        plan.add_step('lookup', lookups / chunksize, note)
+
+    # write
+    if upsert:
+        plan.add_step('write', 1.0 / bulksize, 'upsert once per {0}'.format(
+            bulksize))
+    elif bulksize:
+        plan.add_step(
+            'write', 2.0 / bulksize,
+            'bulk_create and bulk_update once per {0}'.format(bulksize))
+    elif generator.update:
+        plan.add_step('write', 2, 'UPDATE and SELECT of an existing record')
+    elif generator.create:
+        plan.add_step('write', 1, 'INSERT of a new record')
+    if generator.savepoints:
+        plan.add_step(
+            'savepoint', 4 if chunked else 2,
+            'SAVEPOINT and RELEASE per record{0}'.format(
+                ', for prepare and write' if chunked else ''))
+
+    # relations
+    meta = model_class._meta
+    for field in list(meta.concrete_fields) + list(meta.many_to_many):
+        fieldtype = get_internal_type(field)
+        if fieldtype in ('ForeignKey', 'OneToOneField'):
+            related = field.related_model
+            lookup = get_related_lookup(field)
+            note = '{0} -> {1}'.format(field.name, get_label(related))
+            if generator.fk_cache is not None:
+                note += ', 0 on cache hits'
+            # dictionaries: lookup, UPDATE and SELECT in the related table
+            plan.add_step('fk', 3, note)
+            if lookup:
+                label, warning = describe_lookup(related, lookup)
+                if warning:
+                    plan.warn(warning)
+            elif not get_unique_string_fields(related):
+                plan.warn(
+                    'ForeignKey {0} can only be resolved by primary key, '
+                    '{1} has no persistence criterion'.format(
+                        field.name, get_label(related)))
+        elif fieldtype == 'ManyToManyField':
+            related = field.related_model
+            note = '{0} -> {1}, link query and insert{2}'.format(
+                field.name, get_label(related),
+                ' once per chunk' if chunked else '')
+            plan.add_step('m2m', 2 / chunksize, note, per_item=3)
+            lookup = get_related_lookup(field)
+            if lookup:
+                label, warning = describe_lookup(related, lookup)
+                if warning:
+                    plan.warn(warning)
+    return plan
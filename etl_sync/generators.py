@@ -1,13 +1,26 @@
 from __future__ import print_function
-from six import text_type, binary_type
+from six import (
+    text_type, binary_type, string_types, get_unbound_function)
 from builtins import str as text
 from future.utils import iteritems
 
+import threading
 from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
 from hashlib import md5
+from django.conf import settings
 from django.core.exceptions import ValidationError, FieldError
-from django.db.models import (Q, FieldDoesNotExist)
+from django.db import IntegrityError, DatabaseError, connections, transaction
+from django.db.models import (
+    Q, AutoField, FieldDoesNotExist, Model, QuerySet)
 from django.forms import DateTimeField
+from django.forms.utils import from_current_timezone
+from django.utils import formats, timezone
+from etl_sync import columnar
+from etl_sync.caches import LRUCache, HashIndex
+from etl_sync.timers import timed
 
 
 def get_unique_fields(model_class):
@@ -69,6 +82,50 @@ def get_unambiguous_fields(model_class):
         'Failure to identify unambiguous field for {}'.format(model_class))
 
 
+def get_lookup_field(model_class, fieldname):
+    """
+    Returns the concrete model field for a persistence criterion or None
+    if the criterion cannot be resolved to a single field.
+    """
+    try:
+        field = model_class._meta.get_field(fieldname)
+    except FieldDoesNotExist:
+        return None
+    if not getattr(field, 'concrete', False) or field.many_to_many:
+        return None
+    return field
+
+
+def get_lookup_value(field, value):
+    """
+    Normalizes a value to what is stored in the field's database column,
+    i.e. related instances are reduced to the referenced key.
+    """
+    if field.is_relation:
+        if isinstance(value, Model):
+            value = getattr(value, field.target_field.attname)
+        return field.target_field.to_python(value)
+    return field.to_python(value)
+
+
+# format name for ISO 8601 in date_formats
+ISO_FORMAT = 'iso'
+
+
+def parse_datetime(value, date_format):
+    """
+    Parses value with a strptime format or ISO_FORMAT, raises ValueError
+    if value does not match.
+    """
+    if date_format == ISO_FORMAT:
+        try:
+            return datetime.fromisoformat(value)
+        except AttributeError:
+            # Python < 3.7
+            raise ValueError('ISO 8601 parsing not available')
+    return datetime.strptime(value, date_format)
+
+
 def get_unique_string_fields(model_class):
     """
     Unique string fields are used to auto normalize ForeignKey
@@ -80,30 +137,179 @@ def get_unique_string_fields(model_class):
         field.unique]
 
 
+class ModelInfo(object):
+    """
+    Introspection results for a model class, computed once and shared by
+    all generators for that model. Treat the attributes as read-only.
+    """
+
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.fields = get_fields(model_class)
+        self.field_names = OrderedDict([
+            (field.name, get_internal_type(field))
+            for field in self.fields])
+        self.unique_string_fields = get_unique_string_fields(model_class)
+        try:
+            self.unambiguous_fields = get_unambiguous_fields(model_class)
+            self.unambiguous_error = None
+        except ValidationError as e:
+            self.unambiguous_fields = None
+            self.unambiguous_error = e
+        # generator class => list of (field, preparation method name)
+        self.preparations = {}
+
+    def get_unambiguous_fields(self):
+        if self.unambiguous_error:
+            raise self.unambiguous_error
+        return list(self.unambiguous_fields)
+
+    def get_preparations(self, generator_class):
+        """
+        Returns the names of the preparation methods generator_class uses
+        for each model field. Fields without a preparation for their
+        internal type map to 'prepare_field'.
+
+        Returns:
+            list: List of (field, method name) tuples.
+        """
+        try:
+            return self.preparations[generator_class]
+        except KeyError:
+            pass
+        mapping = getattr(generator_class, 'preparations', {})
+        ret = [
+            (field, mapping.get(self.field_names[field.name],
+                                'prepare_field'))
+            for field in self.fields]
+        self.preparations[generator_class] = ret
+        return ret
+
+
+class ModelRegistry(object):
+    """
+    Thread-safe, process-wide store of ModelInfo objects by model class.
+    Call invalidate if a model class changes at runtime.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def get(self, model_class):
+        try:
+            return self.models[model_class]
+        except KeyError:
+            pass
+        with self.lock:
+            if model_class not in self.models:
+                self.models[model_class] = ModelInfo(model_class)
+            return self.models[model_class]
+
+    def invalidate(self, model_class=None):
+        """
+        Drops the introspection results for model_class or for all
+        models if model_class is None.
+        """
+        with self.lock:
+            if model_class is None:
+                self.models.clear()
+            else:
+                self.models.pop(model_class, None)
+
+
+registry = ModelRegistry()
+
+
+class RecordContext(object):
+    """
+    State of the record a generator is preparing, see begin_record. Other
+    than ModelInfo it lives for a single record only.
+    """
+
+    def __init__(self):
+        # field name => instances linked once the record is written
+        self.related_instances = OrderedDict()
+
+
 class BaseGenerator(object):
     persistence = None
+    # errors rejecting a single record, everything else aborts a load
+    record_errors = (ValidationError, IntegrityError, DatabaseError,
+                     ValueError)
 
     def __init__(self, model_class, persistence=[], options={}):
         self.model_class = model_class
-        self.related_instances = {}
+        # RecordContext of the record being prepared
+        self.context = None
         self.create = options.get('create', True)
         self.update = options.get('update', True)
         self.related_field = options.get('related_field')
+        self.chunksize = options.get('chunksize') or 500
+        self.detect_unchanged = options.get('detect_unchanged', False)
+        # coerce the columns of a chunk at once, see prepare_batch
+        self.columnar = options.get('columnar', False)
+        # field name => number of cells prepare_batch could not coerce
+        self.invalid_cells = OrderedDict()
+        # (tag, field names) of records with cells prepare_batch could
+        # not coerce, see pop_invalid
+        self.invalid = []
+        # write records in savepoints, enabled by Loader transactions
+        self.savepoints = options.get(
+            'savepoints', bool(options.get('transactionsize')))
+        # label of the current record, e.g. the line number set by Loader
+        self.tag = None
+        # StageTimers for prepare, lookup, write and m2m, set by Loader
+        self.timers = options.get('timers')
+        self.rejected = []
+        self.revised = []
+        # (related model, related field, value) => ForeignKey instance
+        self.fk_cache = options.get('fk_cache')
+        if self.fk_cache is None and options.get('fk_cache_size'):
+            self.fk_cache = LRUCache(options['fk_cache_size'])
         self.res = None
+        self.model_info = registry.get(self.model_class)
         self.persistence = (
             self.persistence or persistence or
-            get_unambiguous_fields(self.model_class))
+            self.model_info.get_unambiguous_fields())
         if isinstance(self.persistence, (text_type, binary_type)):
             self.persistence = [self.persistence]
-        self.model_fields = get_fields(self.model_class)
-        self.field_names = OrderedDict([
-            (field.name, get_internal_type(field))
-            for field in self.model_fields])
-        self.unique_string_fields = get_unique_string_fields(self.model_class)
+        self.model_fields = self.model_info.fields
+        self.field_names = self.model_info.field_names
+        self.unique_string_fields = self.model_info.unique_string_fields
 
     def get_persistence_query(self, dic, persistence, update):
         return dic, self.get_from_db(dic, persistence), update
 
+    @property
+    def related_instances(self):
+        """
+        Many-to-many instances of the current record, see RecordContext.
+        """
+        if self.context is None:
+            self.context = RecordContext()
+        return self.context.related_instances
+
+    def begin_record(self):
+        """
+        Starts a new RecordContext, discarding state left by the previous
+        record.
+        """
+        self.context = RecordContext()
+        return self.context
+
+    def end_record(self):
+        """
+        Releases the RecordContext of the current record.
+
+        Returns:
+            dict: Related instances of the record by field name.
+        """
+        context, self.context = self.context, None
+        if context is None:
+            return OrderedDict()
+        return context.related_instances
+
     def get_from_db(self, dic, lookup):
         if lookup:
             query = Q()
@@ -117,6 +323,94 @@ class BaseGenerator(object):
                 pass
         return self.model_class.objects.none()
 
+    def get_persistence_key(self, dic, lookup):
+        """
+        Returns the lookup values of a record as a hashable key. Returns None
+        if the record cannot be resolved by a batch query, e.g. because a
+        lookup value is missing or the lookup is not a concrete field.
+        """
+        if not lookup:
+            return None
+        key = []
+        for fieldname in lookup:
+            value = dic.get(fieldname, None)
+            field = get_lookup_field(self.model_class, fieldname)
+            if not value or field is None:
+                return None
+            try:
+                key.append(get_lookup_value(field, value))
+            except ValidationError:
+                return None
+        return tuple(key)
+
+    def get_many_from_db(self, keys, lookup):
+        """
+        Resolves a list of persistence keys with a single query, or one
+        per batch below the parameter limit of the backend.
+
+        Args:
+            keys (list): Keys as returned by get_persistence_key.
+            lookup (list): Field names the keys refer to.
+
+        Returns:
+            dict: Lists of model instances by key.
+        """
+        ret = {}
+        keys = list(set(keys))
+        if not keys:
+            return ret
+        fields = [get_lookup_field(self.model_class, name) for name in lookup]
+        if len(fields) == 1:
+            # the backend splits IN lists itself if needed
+            queries = [Q(**{'{}__in'.format(fields[0].attname): [
+                key[0] for key in keys]})]
+        else:
+            connection = connections[self.model_class.objects.db]
+            batch_size = max(connection.ops.bulk_batch_size(fields, keys), 1)
+            queries = []
+            for start in range(0, len(keys), batch_size):
+                query = Q()
+                for key in keys[start:start + batch_size]:
+                    query |= Q(**dict(zip(
+                        [field.attname for field in fields], key)))
+                queries.append(query)
+        for query in queries:
+            for instance in self.model_class.objects.filter(query):
+                key = tuple(
+                    get_lookup_value(field, getattr(instance, field.attname))
+                    for field in fields)
+                ret.setdefault(key, []).append(instance)
+        return ret
+
+    def get_persistence_queries(self, records):
+        """
+        Batch version of get_persistence_query. Records sharing the same
+        persistence criterion are resolved with one query per chunk. Records
+        that cannot be resolved that way fall back to get_persistence_query.
+
+        Args:
+            records (list): List of (dic, persistence, update) tuples.
+
+        Returns:
+            list: List of (dic, instances, update) tuples in input order.
+        """
+        ret = [None] * len(records)
+        groups = OrderedDict()
+        for index, (dic, persistence, update) in enumerate(records):
+            key = self.get_persistence_key(dic, persistence)
+            if key is None:
+                ret[index] = self.get_persistence_query(
+                    dic, persistence, update)
+            else:
+                groups.setdefault(
+                    tuple(persistence), []).append((index, key))
+        for lookup, items in iteritems(groups):
+            found = self.get_many_from_db([key for _, key in items], lookup)
+            for index, key in items:
+                dic, _, update = records[index]
+                ret[index] = (dic, found.get(key, []), update)
+        return ret
+
     def create_in_db(self, dic):
         return self.model_class.objects.create(**dic)
 
@@ -130,11 +424,14 @@ class BaseGenerator(object):
 
         Args:
             dic(dict): Data dictionary.
-            qs(QuerySet): A django queryset.
+            qs(QuerySet or list): A django queryset or list of instances.
 
         Returns:
             Model instance: First model instance.
         """
+        if isinstance(qs, list):
+            qs = self.model_class.objects.filter(
+                pk__in=[item.pk for item in qs])
         qs.update(**dic)
         return qs[0]
 
@@ -142,11 +439,37 @@ class BaseGenerator(object):
         persistence = dic.pop('etl_persistence', self.persistence)
         create = dic.pop('etl_create', self.create)
         update = dic.pop('etl_update', self.update)
-        dic = self.prepare(dic)
-        dic, qs, update = self.get_persistence_query(dic, persistence, update)
-        dic = {item:dic[item] for item in dic if item in self.field_names}
+        with timed(self.timers, 'prepare'):
+            dic = self.prepare(dic)
+        with timed(self.timers, 'lookup'):
+            dic, qs, update = self.get_persistence_query(
+                dic, persistence, update)
+            if self.timers is not None and isinstance(qs, QuerySet):
+                # evaluated by write otherwise
+                bool(qs)
+        with timed(self.timers, 'write'):
+            return self.write(dic, qs, create, update)
+
+    def write(self, dic, qs, create, update):
+        """
+        Creates, updates or returns the instance depending on the result
+        of the persistence query and sets self.res accordingly.
+
+        Args:
+            dic (dict): Prepared data dictionary.
+            qs (QuerySet or list): Instances matching the persistence
+                criterion.
+            create (boolean): Whether new instances can be created.
+            update (boolean): Whether existing instances can be updated.
+        """
+        dic = {item: dic[item] for item in dic if item in self.field_names}
         if qs:
             if update:
+                if self.detect_unchanged:
+                    instance = qs[0]
+                    if self.is_unchanged(dic, instance):
+                        self.res = 'unchanged'
+                        return instance
                 instance = self.update_in_db(dic, qs)
                 self.res = 'updated'
                 return instance
@@ -159,6 +482,26 @@ class BaseGenerator(object):
                 self.res = 'created'
                 return instance
 
+    def is_unchanged(self, dic, instance):
+        """
+        Compares prepared values with the values of an instance fetched
+        from the database.
+
+        Returns:
+            boolean: True if an update would not change the instance.
+        """
+        for name, value in iteritems(dic):
+            field = get_lookup_field(self.model_class, name)
+            if field is None:
+                continue
+            try:
+                value = get_lookup_value(field, value)
+            except ValidationError:
+                return False
+            if getattr(instance, field.attname) != value:
+                return False
+        return True
+
     def instance_from_int(self, intnumber):
         query = {self.related_field or 'pk': intnumber}
         try:
@@ -173,21 +516,71 @@ class BaseGenerator(object):
             dic = {self.unique_string_fields[0].name: string}
             return self.instance_from_dic(dic)
 
-    def assign_related(self, instance):
-        for (key, lst) in iteritems(self.related_instances):
-            field = getattr(instance, key)
-            try:
-                field.add(*lst)
-            except AttributeError:
-                generator = InstanceGenerator(field.through)
+    def assign_related(self, instance, related_instances=None):
+        if related_instances is None:
+            related_instances = self.end_record()
+        self.assign_related_bulk([(instance, related_instances)])
+
+    def assign_related_bulk(self, pairs):
+        """
+        Creates many-to-many links for several instances at once with one
+        existence query and one bulk_create of through model rows per
+        relation. As the through model is written directly, m2m_changed
+        signals are not sent.
+
+        Args:
+            pairs (list): List of (instance, related_instances) tuples.
+        """
+        links = OrderedDict()
+        for instance, related_instances in pairs:
+            for (key, lst) in iteritems(related_instances):
+                field = self.model_class._meta.get_field(key)
+                if getattr(field, 'auto_created', False):
+                    # reverse relation
+                    getattr(instance, key).add(*lst)
+                    continue
                 for item in lst:
-                    instance = generator.get_instance({
-                        field.source_field_name: instance.pk,
-                        field.target_field_name: item.pk,
-                        'etl_persistence': [
-                            field.source_field_name,
-                            field.target_field_name
-                        ]})
+                    if instance.pk is None or getattr(item, 'pk', None) is None:
+                        raise ValueError(
+                            'Cannot link {} and {} in {}, both need a '
+                            'primary key.'.format(instance, item, key))
+                    links.setdefault(field, OrderedDict())[
+                        (instance, item)] = None
+        for field, items in iteritems(links):
+            self.create_links(field, list(items))
+
+    def create_links(self, field, items):
+        """
+        Writes missing rows for a list of (instance, related instance)
+        tuples to the through model of a ManyToManyField.
+        """
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name())
+        target = through._meta.get_field(field.m2m_reverse_field_name())
+        links = OrderedDict()
+        for instance, item in items:
+            links[(get_lookup_value(source, instance),
+                   get_lookup_value(target, item))] = None
+            if (field.remote_field.symmetrical and
+                    field.remote_field.model == self.model_class):
+                links[(get_lookup_value(source, item),
+                       get_lookup_value(target, instance))] = None
+        existing = set(through.objects.filter(**{
+            '{}__in'.format(source.attname): set(
+                link[0] for link in links),
+            '{}__in'.format(target.attname): set(
+                link[1] for link in links)}).values_list(
+                    source.attname, target.attname))
+        missing = [
+            through(**{source.attname: link[0], target.attname: link[1]})
+            for link in links if link not in existing]
+        if not missing:
+            return
+        kwargs = {}
+        features = connections[through.objects.db].features
+        if getattr(features, 'supports_ignore_conflicts', False):
+            kwargs['ignore_conflicts'] = True
+        through.objects.bulk_create(missing, **kwargs)
 
     def get_instance(self, obj):
         """
@@ -195,8 +588,13 @@ class BaseGenerator(object):
         """
         if isinstance(obj, dict):
             dic = obj.copy()
-            instance = self.instance_from_dic(dic)
-            self.assign_related(instance)
+            self.begin_record()
+            try:
+                instance = self.instance_from_dic(dic)
+            finally:
+                related = self.end_record()
+            with timed(self.timers, 'm2m'):
+                self.assign_related(instance, related)
             return instance
         if isinstance(obj, self.model_class):
             self.res = 'exists'
@@ -207,9 +605,234 @@ class BaseGenerator(object):
         if isinstance(obj, (text_type, binary_type)):
             return self.instance_from_str(obj)
 
+    def rollback(self):
+        """
+        Called if changes made while generating a record might have been
+        rolled back. Clears caches that could refer to these changes.
+        """
+        if self.fk_cache is not None:
+            self.fk_cache.clear()
+
+    def uses_savepoints(self):
+        return bool(self.savepoints and connections[
+            self.model_class.objects.db].in_atomic_block)
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Wraps the changes of a single record in a savepoint if
+        self.savepoints is set and a transaction is open, so that a failing
+        record does not abort the transaction. Calls rollback if the
+        savepoint is rolled back.
+        """
+        if not self.uses_savepoints():
+            yield
+            return
+        connection = connections[self.model_class.objects.db]
+        try:
+            with transaction.atomic(using=connection.alias):
+                yield
+        except Exception:
+            self.rollback()
+            raise
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Statistics to be included in the Loader's feedback.
+        """
+        ret = OrderedDict()
+        if self.fk_cache is not None:
+            ret['ForeignKey cache'] = self.fk_cache.report()
+        if self.invalid_cells:
+            ret['Invalid cells'] = ', '.join(
+                '{0}: {1}'.format(key, value)
+                for key, value in iteritems(self.invalid_cells))
+        return ret
+
+    def explain(self, chunked=False):
+        """
+        Builds the load plan without printing it, unlike Loader.explain.
+        LoadPlan.format returns the printable text.
+
+        Returns:
+            LoadPlan: Worst-case queries per record and lookups without
+            a supporting index, see etl_sync.explain.
+        """
+        from etl_sync.explain import explain_generator
+        return explain_generator(self, chunked=chunked)
+
+    def pop_rejected(self):
+        """
+        Returns and clears records rejected after get_instance returned,
+        e.g. by a buffered write.
+
+        Returns:
+            list: List of (tag, res, error) tuples.
+        """
+        rejected, self.rejected = self.rejected, []
+        return rejected
+
+    def pop_revised(self):
+        """
+        Returns and clears results determined after get_instance returned,
+        e.g. whether an upserted record was created or updated.
+
+        Returns:
+            list: List of (tag, res, new res) tuples.
+        """
+        revised, self.revised = self.revised, []
+        return revised
+
+    def pop_invalid(self):
+        """
+        Returns and clears the records with cells prepare_batch could not
+        coerce. These cells are left out like invalid values in prepare.
+
+        Returns:
+            list: List of (tag, field names) tuples.
+        """
+        invalid, self.invalid = self.invalid, []
+        return invalid
+
+    def get_instances(self, dics, tags=None):
+        """
+        Batch version of get_instance for data dictionaries. The persistence
+        queries for a chunk of records are resolved at once instead of
+        record by record. Errors in self.record_errors reject the record
+        and processing continues with the next one.
+
+        Args:
+            dics (iterable): Data dictionaries.
+            tags (iterable): Optional labels, e.g. line numbers, set as
+                self.tag while the respective record is written.
+
+        Returns:
+            list: One (instance, res, error) tuple per record in input
+            order. error is the exception rejecting the record or None.
+        """
+        ret = []
+        chunk = []
+        dics = list(dics)
+        tags = list(tags) if tags is not None else [None] * len(dics)
+        for dic in dics:
+            chunk.append(dic)
+            if len(chunk) == self.chunksize:
+                ret.extend(self.get_instances_chunk(
+                    chunk, tags[len(ret):len(ret) + len(chunk)]))
+                chunk = []
+        if chunk:
+            ret.extend(self.get_instances_chunk(chunk, tags[len(ret):]))
+        return ret
+
+    def get_instances_chunk(self, dics, tags):
+        ret = [None] * len(dics)
+        records, indices, options = [], [], []
+        batch = None
+        if self.columnar:
+            with timed(self.timers, 'prepare'):
+                batch = self.prepare_batch(dics)
+        for index, dic in enumerate(dics):
+            dic = dic.copy()
+            persistence = dic.pop('etl_persistence', self.persistence)
+            create = dic.pop('etl_create', self.create)
+            update = dic.pop('etl_update', self.update)
+            values, invalid = batch[index] if batch else (None, None)
+            if invalid:
+                self.invalid.append((tags[index], list(invalid)))
+            if values:
+                for key in values:
+                    dic.pop(key, None)
+            self.begin_record()
+            try:
+                with timed(self.timers, 'prepare'), self.savepoint():
+                    dic = self.prepare(dic)
+                    if values:
+                        dic.update(
+                            (key, value) for key, value in iteritems(values)
+                            if value is not None)
+            except self.record_errors as e:
+                ret[index] = (None, None, e)
+                continue
+            finally:
+                related = self.end_record()
+            records.append((dic, persistence, update))
+            indices.append(index)
+            options.append((create, related))
+        with timed(self.timers, 'lookup'):
+            queries = self.get_persistence_queries(records)
+        # instances created earlier in the same chunk by persistence key
+        created = {}
+        # (index, instance, related_instances) for many-to-many links
+        pairs = []
+        for index, (dic, persistence, _), (_, qs, update), (create, related) \
+                in zip(indices, records, queries, options):
+            key = self.get_persistence_key(dic, persistence)
+            if key is not None:
+                key = (tuple(persistence), key)
+                if not qs and key in created:
+                    qs = created[key]
+            self.res = None
+            self.tag = tags[index]
+            try:
+                with timed(self.timers, 'write'), self.savepoint():
+                    instance = self.write(dic, qs, create, update)
+            except self.record_errors as e:
+                ret[index] = (None, None, e)
+                continue
+            if self.res == 'created' and key is not None:
+                created[key] = [instance]
+            if instance is not None and related:
+                pairs.append((index, instance, related))
+            ret[index] = (instance, self.res, None)
+        with timed(self.timers, 'm2m'):
+            self.assign_related_chunk(pairs, ret)
+        return ret
+
+    def assign_related_chunk(self, pairs, results):
+        """
+        Assigns the related instances of a chunk at once. If that fails
+        each record is assigned on its own and rejected on failure.
+        """
+        if not pairs:
+            return
+        try:
+            with self.savepoint():
+                self.assign_related_bulk(
+                    [(instance, related) for _, instance, related in pairs])
+            return
+        except self.record_errors:
+            pass
+        for index, instance, related in pairs:
+            try:
+                with self.savepoint():
+                    self.assign_related(instance, related)
+            except self.record_errors as e:
+                results[index] = (None, None, e)
+
     def prepare(self, dic):
         return dic
 
+    def prepare_batch(self, dics):
+        """
+        Override this method to prepare fields of a chunk of records at
+        once, used by get_instances with the option columnar. Fields
+        prepared here are removed from the records passed to prepare.
+
+        Returns:
+            list: One (values, invalid) tuple per record, values is a
+            dictionary of prepared fields and invalid lists the fields
+            that could not be prepared. None to prepare record by record.
+        """
+        return None
+
+    def flush(self):
+        """
+        Override this method to write buffered data, e.g. before the
+        Loader saves a checkpoint.
+        """
+        pass
+
     def finalize(self):
         """
         Override this method to finalize your data generation job,
@@ -243,6 +866,98 @@ class InstanceGenerator(BaseGenerator):
         'BigIntegerField': 'prepare_integer',
         'FloatField': 'prepare_float',
         'JSONField': 'prepare_text'}
+    # preparation methods with a column version in etl_sync.columnar
+    column_preparations = {
+        'prepare_integer': columnar.coerce_integers,
+        'prepare_float': columnar.coerce_floats,
+        'prepare_boolean': columnar.coerce_booleans,
+        'prepare_text': columnar.coerce_texts}
+    # upper bound for the number of cached preparation plans
+    max_plans = 100
+
+    def __init__(self, model_class, persistence=[], options={}):
+        super(InstanceGenerator, self).__init__(
+            model_class, persistence=persistence, options=options)
+        # tuple of record keys => preparation plan
+        self.plans = {}
+        # tuple of record keys => column plan
+        self.column_plans = {}
+        # field name => format of the date strings, detected on the first
+        # value unless given
+        self.date_formats = dict(options.get('date_formats') or {})
+        # field name => DateTimeField validating values not matching
+        self.date_fields = {}
+
+    def get_plan(self, keys):
+        """
+        Compiles the preparation plan for records with the given keys.
+
+        Returns:
+            list: List of (key, field, bound preparation method) in model
+            field order, restricted to the fields present in keys.
+        """
+        keys = set(keys)
+        return [
+            (field.name, field, getattr(self, name, self.prepare_field))
+            for field, name in self.model_info.get_preparations(type(self))
+            if field.name in keys]
+
+    def get_column_plan(self, keys):
+        """
+        Returns:
+            list: List of (key, column function) for the fields in keys
+            that are prepared by a method with a column version. Methods
+            overridden in subclasses are applied record by record.
+        """
+        ret = []
+        for name, field, prepare_function in self.get_plan(keys):
+            method = prepare_function.__name__
+            function = self.column_preparations.get(method)
+            if function is None or get_unbound_function(
+                    getattr(type(self), method)) is not get_unbound_function(
+                    getattr(InstanceGenerator, method)):
+                continue
+            if method == 'prepare_text':
+                function = partial(
+                    function, max_length=getattr(field, 'max_length', None))
+            ret.append((name, function))
+        return ret
+
+    def prepare_batch(self, dics):
+        """
+        Pivots records with the same keys into columns and coerces the
+        integer, float, boolean and text columns at once. Cells that
+        cannot be coerced are left out of the values like in prepare and
+        counted in self.invalid_cells.
+        """
+        ret = [({}, []) for _ in dics]
+        groups = OrderedDict()
+        for index, dic in enumerate(dics):
+            groups.setdefault(tuple(dic), []).append(index)
+        for keys, indices in iteritems(groups):
+            try:
+                plan = self.column_plans[keys]
+            except KeyError:
+                if len(self.column_plans) >= self.max_plans:
+                    self.column_plans.clear()
+                plan = self.column_plans[keys] = self.get_column_plan(keys)
+            if not plan:
+                continue
+            group = [dics[index] for index in indices]
+            values = [{} for _ in indices]
+            invalid = [[] for _ in indices]
+            columns = columnar.pivot(group, [name for name, _ in plan])
+            for (name, function), column in zip(plan, columns):
+                column, flags = function(column)
+                for position, (value, flag) in enumerate(zip(column, flags)):
+                    values[position][name] = value
+                    if flag:
+                        invalid[position].append(name)
+                        self.invalid_cells[name] = (
+                            self.invalid_cells.get(name, 0) + 1)
+            for position, index in enumerate(indices):
+                ret[index] = (values[position], invalid[position])
+        return ret
 
     def prepare_none(self, field, value):
         return None
@@ -251,29 +966,91 @@ class InstanceGenerator(BaseGenerator):
         return value
 
     def prepare_fk(self, field, value):
-        options = {'related_field': field.related_fields[0][1].name}
+        options = {
+            'related_field': field.related_fields[0][1].name,
+            'fk_cache': self.fk_cache}
         related = getattr(field, 'related_model')
-        return InstanceGenerator(
+        key = None
+        if self.fk_cache is not None and isinstance(
+                value, (text_type, binary_type, int)):
+            key = (related, options['related_field'], value)
+            instance = self.fk_cache.get(key)
+            if instance is not None:
+                return instance
+        instance = InstanceGenerator(
             related, options=options).get_instance(value)
+        if key is not None and instance is not None:
+            self.fk_cache.set(key, instance)
+        return instance
 
     def prepare_m2m(self, field, lst):
         """
         Defers assignment of related instances until instance creation is
         finished.
         """
-        self.related_instances[field.name] = []
         if not isinstance(lst, list):
             lst = [lst]
-        for item in lst:
-            related = getattr(field, 'related_model')
-            generator = InstanceGenerator(related)
-            instance = generator.get_instance(item)
-            self.related_instances[field.name].append(instance)
+        related = getattr(field, 'related_model')
+        generator = InstanceGenerator(related)
+        self.related_instances[field.name] = [
+            generator.get_instance(item) for item in lst]
+
+    def detect_date_format(self, value):
+        """
+        Returns:
+            str: ISO_FORMAT or the first of the DateTimeField input formats
+            parsing value, None if neither does.
+        """
+        for date_format in [ISO_FORMAT] + list(
+                formats.get_format('DATETIME_INPUT_FORMATS')):
+            try:
+                parse_datetime(value, date_format)
+                return date_format
+            except (ValueError, TypeError):
+                pass
+
+    def parse_date(self, field, value):
+        """
+        Parses a date string with the format of the field. The format is
+        detected on the first value unless given in the option
+        date_formats.
+
+        Returns:
+            datetime: None if value does not match.
+        """
+        date_format = self.date_formats.get(field.name)
+        if date_format is None:
+            date_format = self.detect_date_format(value)
+            if date_format is None:
+                return None
+            self.date_formats[field.name] = date_format
+        try:
+            ret = parse_datetime(value, date_format)
+        except (ValueError, TypeError):
+            return None
+        if timezone.is_aware(ret) and not settings.USE_TZ:
+            return None
+        return from_current_timezone(ret)
 
     def prepare_date(self, field, value):
-        if not (field.auto_now or field.auto_now_add):
-            formfield = DateTimeField(required=not field.null)
-            return formfield.clean(value)
+        """
+        Parses strings with the format of the field, other values and
+        strings not matching are validated by a DateTimeField.
+        """
+        if field.auto_now or field.auto_now_add:
+            return None
+        if isinstance(value, string_types):
+            value = value.strip()
+            if value:
+                ret = self.parse_date(field, value)
+                if ret is not None:
+                    return ret
+        try:
+            formfield = self.date_fields[field.name]
+        except KeyError:
+            formfield = self.date_fields[field.name] = DateTimeField(
+                required=not field.null)
+        return formfield.clean(value)
 
     def prepare_text(self, field, value):
         if not isinstance(value, (text_type, binary_type)):
@@ -316,16 +1093,18 @@ class InstanceGenerator(BaseGenerator):
         return value
 
     def prepare(self, dic):
+        keys = tuple(dic)
+        try:
+            plan = self.plans[keys]
+        except KeyError:
+            if len(self.plans) >= self.max_plans:
+                self.plans.clear()
+            plan = self.plans[keys] = self.get_plan(keys)
         ret = {}
-        for field in get_fields(self.model_class):
-            if field.name not in dic:
-                continue
-            fieldtype = get_internal_type(field)
-            prepare_function = getattr(
-                self, self.preparations[fieldtype], self.prepare_field)
-            res = prepare_function(field, dic.pop(field.name))
+        for name, field, prepare_function in plan:
+            res = prepare_function(field, dic.pop(name))
             if res is not None:
-                ret[field.name] = res
+                ret[name] = res
         return ret
 
 
@@ -333,17 +1112,115 @@ class HashMixin(object):
     """
     Mix-in adding hashing to Generators. Replaces persistence
     criterion.
+
+    With options['hash_index'] the hash values of the target table are
+    loaded into memory on first use, up to options['hash_index_limit']
+    entries. Records found in the index are classified as existing
+    without a query.
     """
     hashfield = 'md5'
     do_not_hash_fields = ['id', 'last_modified']
+    hash_index_limit = 1000000
+
+    def __init__(self, model_class, persistence=[], options={}):
+        super(HashMixin, self).__init__(
+            model_class, persistence=persistence, options=options)
+        self.hash_index = None
+        if options.get('hash_index') and self.hashfield in self.field_names:
+            self.hash_index = HashIndex(
+                options.get('hash_index_limit', self.hash_index_limit))
+            self.hash_index_loaded = False
+        # (hash, pk, previous hash) added since the last savepoint
+        self.hash_index_added = None
+
+    def get_hash_index(self):
+        if self.hash_index is not None and not self.hash_index_loaded:
+            self.hash_index.load(self.model_class.objects.all(), self.hashfield)
+            self.hash_index_loaded = True
+        return self.hash_index
+
+    def get_from_index(self, dic):
+        """
+        Returns instances from the hash index for a hashed record, an
+        empty list if the record is certainly new, or None if the database
+        needs to be queried.
+        """
+        index = self.get_hash_index()
+        if index is None:
+            return None
+        pk = index.get(dic[self.hashfield])
+        if pk is not None:
+            instance = self.model_class(pk=pk)
+            setattr(instance, self.hashfield, dic[self.hashfield])
+            return [instance]
+        if index.complete:
+            return []
+        return None
 
     def get_persistence_query(self, dic, persistence, update):
         dic = self.hash_dic(dic)
-        items = self.get_from_db(dic, [self.hashfield])
+        items = self.get_from_index(dic)
+        if items is None:
+            items = self.get_from_db(dic, [self.hashfield])
         if len(items) > 0:
             return dic, items, False
         return dic, self.get_from_db(dic, persistence), update
 
+    def get_persistence_queries(self, records):
+        records = [
+            (self.hash_dic(dic), persistence, update)
+            for dic, persistence, update in records]
+        ret = [None] * len(records)
+        lookup = []
+        for index, (dic, _, _) in enumerate(records):
+            items = self.get_from_index(dic)
+            if items is None:
+                lookup.append(index)
+            else:
+                ret[index] = (dic, items, False)
+        queries = super(HashMixin, self).get_persistence_queries([
+            (records[index][0], [self.hashfield], False)
+            for index in lookup])
+        for index, query in zip(lookup, queries):
+            ret[index] = query
+        missing = [
+            index for index, (_, items, _) in enumerate(ret) if not items]
+        queries = super(HashMixin, self).get_persistence_queries(
+            [records[index] for index in missing])
+        for index, query in zip(missing, queries):
+            ret[index] = query
+        return ret
+
+    def write(self, dic, qs, create, update):
+        instance = super(HashMixin, self).write(dic, qs, create, update)
+        if (self.hash_index is not None and self.res in (
+                'created', 'updated') and getattr(instance, 'pk', None)):
+            if self.hash_index_added is not None:
+                self.hash_index_added.append((
+                    dic[self.hashfield], instance.pk,
+                    self.hash_index.changed.get(instance.pk)))
+            self.hash_index.add(
+                dic[self.hashfield], instance.pk,
+                changed=self.res == 'updated')
+        return instance
+
+    def savepoint(self):
+        self.hash_index_added = [] if self.uses_savepoints() else None
+        return super(HashMixin, self).savepoint()
+
+    def rollback(self):
+        super(HashMixin, self).rollback()
+        # hashes of writes rolled back with the savepoint
+        for value, pk, previous in reversed(self.hash_index_added or []):
+            self.hash_index.discard(value, pk, previous)
+        self.hash_index_added = None
+
+    def get_stats(self):
+        ret = super(HashMixin, self).get_stats()
+        if self.hash_index is not None:
+            ret['Hash index'] = self.hash_index.report()
+        return ret
+
     def hash(self, dic):
         text_representation = ''
         fields = sorted([
@@ -357,3 +1234,465 @@ class HashMixin(object):
     def hash_dic(self, dic):
         dic[self.hashfield] = self.hash(dic)
         return dic
+
+
+class BulkMixin(object):
+    """
+    Mix-in buffering new and changed instances in Generators. Buffers are
+    written with bulk_create and bulk_update once they hold
+    options['bulksize'] instances after a record or chunk is complete,
+    and in finalize. Instances returned by get_instance are not saved
+    until then.
+
+    Failing bulk writes are bisected until the failing records are
+    found. These are reported through pop_rejected. Other than update_in_db
+    only the first instance matching the persistence criterion is updated.
+    """
+    bulksize = 500
+
+    def __init__(self, model_class, persistence=[], options={}):
+        super(BulkMixin, self).__init__(
+            model_class, persistence=persistence, options=options)
+        self.bulksize = options.get('bulksize') or self.bulksize
+        # lists of (tag, instance, related_instances)
+        self.created_buffer = []
+        self.updated_buffer = []
+        self.buffered_keys = set()
+        # primary keys of the instances in updated_buffer
+        self.updated_pks = set()
+
+    def can_return_pks(self):
+        features = connections[self.model_class.objects.db].features
+        return (
+            getattr(features, 'can_return_rows_from_bulk_insert', False) or
+            getattr(features, 'can_return_ids_from_bulk_insert', False))
+
+    def flush_if_buffered(self, dic, persistence):
+        key = self.get_persistence_key(dic, persistence)
+        if key is not None and (tuple(persistence), key) in self.buffered_keys:
+            self.flush()
+
+    def get_persistence_query(self, dic, persistence, update):
+        self.flush_if_buffered(dic, persistence)
+        return super(BulkMixin, self).get_persistence_query(
+            dic, persistence, update)
+
+    def get_persistence_queries(self, records):
+        for dic, persistence, _ in records:
+            self.flush_if_buffered(dic, persistence)
+        return super(BulkMixin, self).get_persistence_queries(records)
+
+    def create_in_db(self, dic):
+        instance = self.model_class(**dic)
+        key = self.get_persistence_key(dic, self.persistence)
+        if key is not None:
+            self.buffered_keys.add((tuple(self.persistence), key))
+        self.created_buffer.append([self.tag, instance, {}])
+        return instance
+
+    def update_in_db(self, dic, qs):
+        instance = qs[0]
+        for key, value in iteritems(dic):
+            setattr(instance, key, value)
+        if instance.pk is None:
+            # created earlier in the same chunk and still buffered
+            return instance
+        if instance.pk in self.updated_pks:
+            self.flush_updated()
+        self.updated_pks.add(instance.pk)
+        self.updated_buffer.append([self.tag, instance, list(dic)])
+        return instance
+
+    def is_full(self):
+        return (
+            len(self.created_buffer) >= self.bulksize or
+            len(self.updated_buffer) >= self.bulksize)
+
+    def flush_if_full(self):
+        """
+        Flushes the buffers once they hold bulksize instances. Called after
+        the related instances of a record or chunk have been added to the
+        buffered entries, so that they are linked on flush.
+        """
+        if self.is_full():
+            self.flush()
+
+    def get_instance(self, obj):
+        instance = super(BulkMixin, self).get_instance(obj)
+        self.flush_if_full()
+        return instance
+
+    def get_instances_chunk(self, dics, tags):
+        ret = super(BulkMixin, self).get_instances_chunk(dics, tags)
+        self.flush_if_full()
+        return ret
+
+    def get_buffered(self):
+        """
+        Returns:
+            list: Buffered entries of new instances.
+        """
+        return self.created_buffer
+
+    def assign_related_bulk(self, pairs):
+        # links of buffered instances are created once these are written
+        buffered = dict(
+            (id(item[1]), item) for item in self.get_buffered())
+        ret = []
+        for instance, related_instances in pairs:
+            if id(instance) in buffered and instance.pk is None:
+                buffered[id(instance)][2] = dict(related_instances)
+            else:
+                ret.append((instance, related_instances))
+        super(BulkMixin, self).assign_related_bulk(ret)
+
+    def bulk_write(self, entries, write, res):
+        """
+        Writes buffered entries with write and bisects them if that fails.
+        Records that fail on their own are added to self.rejected.
+
+        Returns:
+            list: Successfully written entries.
+        """
+        if not entries:
+            return []
+        try:
+            with transaction.atomic(using=self.model_class.objects.db):
+                write(entries)
+        except self.record_errors as e:
+            if len(entries) == 1:
+                self.rejected.append((entries[0][0], res, e))
+                return []
+            half = len(entries) // 2
+            return (
+                self.bulk_write(entries[:half], write, res) +
+                self.bulk_write(entries[half:], write, res))
+        return entries
+
+    def bulk_create(self, entries):
+        try:
+            self.model_class.objects.bulk_create(
+                [item[1] for item in entries])
+        except self.record_errors:
+            # primary keys assigned before the rollback are void
+            for item in entries:
+                item[1].pk = None
+            raise
+        super(BulkMixin, self).assign_related_bulk([
+            (item[1], item[2]) for item in entries if item[2]])
+
+    def bulk_update(self, entries):
+        fields = set()
+        for item in entries:
+            fields.update(item[2])
+        fields = [
+            name for name in fields if
+            getattr(self.model_class._meta.get_field(name), 'concrete', False)
+            and not self.model_class._meta.get_field(name).primary_key]
+        if not fields:
+            return
+        instances = [item[1] for item in entries]
+        manager = self.model_class.objects
+        if hasattr(manager, 'bulk_update'):
+            manager.bulk_update(instances, fields)
+        else:
+            for instance in instances:
+                instance.save(update_fields=fields)
+
+    def save_each(self, entries):
+        for _, instance, related_instances in entries:
+            instance.save()
+            super(BulkMixin, self).assign_related(instance, related_instances)
+
+    def flush(self):
+        """
+        Writes buffered instances to the database.
+        """
+        created, self.created_buffer = self.created_buffer, []
+        self.buffered_keys = set()
+        # instances with many-to-many relations need a primary key
+        if not self.can_return_pks():
+            for item in [item for item in created if item[2]]:
+                self.bulk_write([item], self.save_each, 'created')
+            created = [item for item in created if not item[2]]
+        self.bulk_write(created, self.bulk_create, 'created')
+        self.flush_updated()
+
+    def flush_updated(self):
+        """
+        Writes the buffered changes of existing instances.
+        """
+        updated, self.updated_buffer = self.updated_buffer, []
+        self.updated_pks = set()
+        self.bulk_write(updated, self.bulk_update, 'updated')
+
+    def finalize(self):
+        self.flush()
+        return super(BulkMixin, self).finalize()
+
+
+class UpsertMixin(BulkMixin):
+    """
+    Mix-in writing records in batches with INSERT ... ON CONFLICT DO
+    UPDATE instead of looking them up first. The persistence fields need
+    to be covered by a unique constraint and serve as conflict target.
+
+    Raw SQL is used on PostgreSQL and SQLite 3.35 upwards, bulk_create
+    with update_conflicts on other backends supporting it (Django 4.1
+    upwards). Otherwise, and for records with etl_create or etl_update set
+    to False, records are written like in BulkMixin.
+
+    get_instance sets res to 'upserted'. On PostgreSQL whether the record
+    was created or updated is reported through pop_revised.
+    """
+
+    def __init__(self, model_class, persistence=[], options={}):
+        super(UpsertMixin, self).__init__(
+            model_class, persistence=persistence, options=options)
+        # lists of (tag, instance, related_instances, fields)
+        self.upsert_buffer = []
+        # persistence keys of the instances in upsert_buffer
+        self.upsert_keys = set()
+        self.upsert_method = None
+
+    def get_upsert_method(self):
+        """
+        Returns:
+            str: 'sql', 'bulk_create' or None if upserts are not supported.
+        """
+        if self.upsert_method is None:
+            self.upsert_method = ''
+            connection = connections[self.model_class.objects.db]
+            fields = [
+                get_lookup_field(self.model_class, name)
+                for name in self.persistence]
+            if not fields or None in fields:
+                return None
+            raw = not any(
+                hasattr(field, 'get_placeholder')
+                for field in self.model_class._meta.concrete_fields)
+            if raw and connection.vendor == 'postgresql':
+                self.upsert_method = 'sql'
+            elif raw and connection.vendor == 'sqlite':
+                import sqlite3
+                if sqlite3.sqlite_version_info >= (3, 35):
+                    self.upsert_method = 'sql'
+            if not self.upsert_method and getattr(
+                    connection.features,
+                    'supports_update_conflicts_with_target', False):
+                self.upsert_method = 'bulk_create'
+        return self.upsert_method or None
+
+    def can_upsert(self, persistence, update):
+        return bool(
+            update and list(persistence) == list(self.persistence) and
+            self.get_upsert_method())
+
+    def get_persistence_query(self, dic, persistence, update):
+        if self.can_upsert(persistence, update):
+            self.flush_if_buffered(dic, persistence)
+            # left to the database
+            return dic, None, update
+        return super(UpsertMixin, self).get_persistence_query(
+            dic, persistence, update)
+
+    def get_persistence_queries(self, records):
+        ret = [None] * len(records)
+        lookup = []
+        for index, (dic, persistence, update) in enumerate(records):
+            if self.can_upsert(persistence, update):
+                self.flush_if_buffered(dic, persistence)
+                ret[index] = (dic, None, update)
+            else:
+                lookup.append(index)
+        queries = super(UpsertMixin, self).get_persistence_queries(
+            [records[index] for index in lookup])
+        for index, query in zip(lookup, queries):
+            ret[index] = query
+        return ret
+
+    def write(self, dic, qs, create, update):
+        if qs is None and not create:
+            dic, qs, update = super(UpsertMixin, self).get_persistence_query(
+                dic, self.persistence, update)
+        if qs is not None:
+            return super(UpsertMixin, self).write(dic, qs, create, update)
+        dic = {item: dic[item] for item in dic if item in self.field_names}
+        instance = self.model_class(**dic)
+        key = self.get_persistence_key(dic, self.persistence)
+        if key is not None:
+            key = (tuple(self.persistence), key)
+            # a statement must not affect the same row twice
+            if key in self.upsert_keys:
+                self.flush_upserts()
+            elif key in self.buffered_keys:
+                self.flush()
+            self.buffered_keys.add(key)
+            self.upsert_keys.add(key)
+        self.upsert_buffer.append([self.tag, instance, {}, list(dic)])
+        self.res = 'upserted'
+        return instance
+
+    def get_buffered(self):
+        return self.created_buffer + self.upsert_buffer
+
+    def is_full(self):
+        return (
+            super(UpsertMixin, self).is_full() or
+            len(self.upsert_buffer) >= self.bulksize)
+
+    def get_update_fields(self, fields):
+        meta = self.model_class._meta
+        ret = [
+            meta.get_field(name) for name in fields
+            if name not in self.persistence]
+        ret = [
+            field for field in ret if getattr(field, 'concrete', False) and
+            not field.primary_key]
+        ret += [
+            field for field in meta.concrete_fields
+            if getattr(field, 'auto_now', False) and field not in ret]
+        return ret
+
+    def upsert(self, entries):
+        """
+        Writes entries sharing the same fields with a single statement.
+        """
+        update_fields = self.get_update_fields(entries[0][3])
+        instances = [item[1] for item in entries]
+        if self.get_upsert_method() == 'bulk_create':
+            if update_fields:
+                kwargs = {
+                    'update_conflicts': True,
+                    'unique_fields': list(self.persistence),
+                    'update_fields': [field.name for field in update_fields]}
+            else:
+                # update_conflicts requires fields to update
+                kwargs = {'ignore_conflicts': True}
+            self.model_class.objects.bulk_create(instances, **kwargs)
+            # not every backend returns primary keys of upserted rows
+            self.set_missing_pks(
+                [item[1] for item in entries if item[2]])
+            revised = []
+        else:
+            revised = self.upsert_sql(instances, update_fields)
+        self.assign_related_bulk(
+            [(item[1], item[2]) for item in entries if item[2]])
+        for item, res in zip(entries, revised):
+            if res:
+                self.revised.append((item[0], 'upserted', res))
+
+    def set_missing_pks(self, instances):
+        """
+        Looks up the primary keys of upserted instances without one by
+        their persistence fields.
+        """
+        instances = [
+            instance for instance in instances if instance.pk is None]
+        if not instances:
+            return
+        fields = [
+            get_lookup_field(self.model_class, name)
+            for name in self.persistence]
+        keys = [
+            tuple(
+                get_lookup_value(field, getattr(instance, field.attname))
+                for field in fields)
+            for instance in instances]
+        found = self.get_many_from_db(keys, self.persistence)
+        for instance, key in zip(instances, keys):
+            if key in found:
+                instance.pk = found[key][0].pk
+                instance._state.adding = False
+
+    def upsert_sql(self, instances, update_fields):
+        """
+        Runs INSERT ... ON CONFLICT DO UPDATE ... RETURNING and sets the
+        primary keys of instances.
+
+        Returns:
+            list: 'created' or 'updated' per instance if the backend can
+            tell, None otherwise.
+        """
+        meta = self.model_class._meta
+        connection = connections[self.model_class.objects.db]
+        quote = connection.ops.quote_name
+        fields = [
+            field for field in meta.concrete_fields
+            if not (field.primary_key and isinstance(field, AutoField))]
+        target = [meta.get_field(name) for name in self.persistence]
+        row = '({0})'.format(', '.join(['%s'] * len(fields)))
+        if update_fields:
+            action = 'UPDATE SET {0}'.format(', '.join(
+                '{0} = EXCLUDED.{0}'.format(quote(field.column))
+                for field in update_fields))
+        else:
+            # no-op update, so that RETURNING includes the row
+            action = 'UPDATE SET {0} = EXCLUDED.{0}'.format(
+                quote(target[0].column))
+        returning = [quote(meta.pk.column)] + [
+            quote(field.column) for field in target]
+        postgresql = connection.vendor == 'postgresql'
+        if postgresql:
+            returning.append('(xmax = 0)')
+        # like bulk_create, stay below the parameter limit of the backend
+        batch_size = max(
+            connection.ops.bulk_batch_size(fields, instances), 1)
+        rows = []
+        for start in range(0, len(instances), batch_size):
+            batch = instances[start:start + batch_size]
+            params = []
+            for instance in batch:
+                for field in fields:
+                    params.append(field.get_db_prep_save(
+                        field.pre_save(instance, True), connection))
+            sql = (
+                'INSERT INTO {table} ({columns}) VALUES {rows} '
+                'ON CONFLICT ({target}) DO {action} '
+                'RETURNING {returning}'.format(
+                    table=quote(meta.db_table),
+                    columns=', '.join(
+                        quote(field.column) for field in fields),
+                    rows=', '.join([row] * len(batch)),
+                    target=', '.join(
+                        quote(field.column) for field in target),
+                    action=action, returning=', '.join(returning)))
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                rows.extend(cursor.fetchall())
+        # RETURNING does not guarantee the order of rows
+        results = {}
+        for row in rows:
+            key = tuple(
+                get_lookup_value(field, value)
+                for field, value in zip(target, row[1:len(target) + 1]))
+            results[key] = (
+                row[0], ('created' if row[-1] else 'updated')
+                if postgresql else None)
+        ret = []
+        for instance in instances:
+            key = tuple(
+                get_lookup_value(field, getattr(instance, field.attname))
+                for field in target)
+            pk, res = results.get(key, (None, None))
+            instance.pk = pk
+            instance._state.adding = False
+            ret.append(res)
+        return ret
+
+    def flush(self):
+        super(UpsertMixin, self).flush()
+        self.flush_upserts()
+
+    def flush_upserts(self):
+        """
+        Writes the upsert buffer, entries with the same fields at once.
+        """
+        entries, self.upsert_buffer = self.upsert_buffer, []
+        self.buffered_keys -= self.upsert_keys
+        self.upsert_keys = set()
+        groups = OrderedDict()
+        for item in entries:
+            groups.setdefault(tuple(item[3]), []).append(item)
+        for group in groups.values():
+            self.bulk_write(group, self.upsert, 'upserted')
@@ -1,15 +1,33 @@
 from __future__ import print_function
 from backports import csv
 from builtins import str as text
+from future.utils import iteritems
 import io
 import os
+import multiprocessing
+from collections import OrderedDict, namedtuple
+from functools import partial
 from datetime import datetime
-from django.core.exceptions import ValidationError
-from django.db import IntegrityError, DatabaseError
+from hashlib import md5
+from timeit import default_timer
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import IntegrityError, DatabaseError, connections, transaction
+from etl_sync.caches import FingerprintStore, replace
+from etl_sync.checkpoints import (
+    Checkpoint, FileCheckpointStore, DatabaseCheckpointStore)
 from etl_sync.generators import InstanceGenerator
+from etl_sync.memory import MemoryMonitor
+from etl_sync.pipelines import Pipeline
+from etl_sync.queries import QueryCounter
+from etl_sync.shards import get_shards, ShardFile, RecordIndex
+from etl_sync.timers import StageTimers, timed
 from etl_sync.transformations import Transformer
 
 
+# outcome is the result of the generator, 'rejected' or 'skipped'
+Result = namedtuple('Result', ['line', 'outcome', 'pk', 'error'])
+
+
 def get_logfilename(filename):
     ret = None
     if isinstance(filename, (text, str)):
@@ -35,24 +53,117 @@ def get_logfile(filename=None, logfilename=None):
 class FeedbackCounter(object):
     """
     Keeps track of the ETL process and provides feedback.
+
+    Args:
+        counter (int): Number of the first record.
+        timers (StageTimers): Optional, adds stage timings and record
+            latencies to the feedback.
+        reporters (list): Reporters receiving a snapshot at every
+            feedback in addition to the printed message.
+        memory (MemoryMonitor): Optional, adds its last measurement to
+            the feedback.
     """
 
-    def __init__(self, counter=0):
+    def __init__(self, counter=0, timers=None, reporters=None, memory=None):
+        self.start = counter
         self.counter = counter
+        # counter at the last feedback
+        self.feedbackcounter = counter
+        self.timers = timers
+        self.reporters = list(reporters or [])
+        self.memory = memory
         self.rejected = 0
         self.created = 0
         self.updated = 0
+        self.unchanged = 0
+        self.upserted = 0
+        self.skipped = 0
         self.starttime = datetime.now()
         self.feedbacktime = self.starttime
+        # additional lines for the feedback message
+        self.stats = OrderedDict()
         self.message = (
             'Extraction from {filename}:\n{records} records processed '
             'in {time}, {total}: {created} created, {updated} updated, '
+            '{unchanged} unchanged, {upserted} upserted, {skipped} skipped, '
             '{rejected} rejected.')
 
+    def __getstate__(self):
+        # counters of shards are returned from worker processes
+        state = dict(self.__dict__)
+        state['timers'] = None
+        state['reporters'] = []
+        state['memory'] = None
+        return state
+
+    def get_snapshot(self, filename=None, records=None):
+        """
+        Returns:
+            dict: The state of the counter for the current interval, see
+            Reporter.
+        """
+        now = datetime.now()
+        seconds = (now - self.feedbacktime).total_seconds()
+        ret = OrderedDict([
+            ('time', now.isoformat()),
+            ('filename', text(filename)),
+            ('records', records),
+            ('seconds', seconds),
+            ('rate', (self.counter - self.feedbackcounter) / seconds
+             if seconds > 0 else None),
+            ('total', self.counter)])
+        ret.update(sorted(iteritems(self.get_counts())))
+        ret['stats'] = OrderedDict(
+            (key, text(value)) for key, value in iteritems(self.stats))
+        if self.timers is not None:
+            ret['stages'] = OrderedDict(self.timers.interval)
+            ret['stage_totals'] = OrderedDict(self.timers.totals)
+            ret['latency'] = self.timers.get_latency()
+        if self.memory is not None and self.memory.last is not None:
+            ret['memory'] = OrderedDict(self.memory.last)
+        return ret
+
+    def format_timings(self, snapshot):
+        """
+        Returns:
+            list: Feedback lines for rate, stage timings and latency.
+        """
+        ret = []
+        if snapshot['rate'] is not None:
+            ret.append('Rate: {0:.0f} records/s'.format(snapshot['rate']))
+        if 'stages' in snapshot:
+            ret.append('Stages: {0}'.format(', '.join(
+                '{0} {1:.3f}s'.format(stage, seconds)
+                for stage, seconds in iteritems(snapshot['stages']))))
+            if snapshot['latency']['p50'] is not None:
+                ret.append('Latency: p50 {0:.3f}ms, p95 {1:.3f}ms'.format(
+                    snapshot['latency']['p50'] * 1000,
+                    snapshot['latency']['p95'] * 1000))
+        return ret
+
+    def report(self, snapshot):
+        for reporter in self.reporters:
+            reporter.report(snapshot)
+        if self.timers is not None:
+            self.timers.reset_interval()
+        self.feedbackcounter = self.counter
+
+    def finish(self, filename=None):
+        """
+        Sends the final snapshot to the reporters and closes them.
+        """
+        snapshot = self.get_snapshot(
+            filename, self.counter - self.feedbackcounter)
+        for reporter in self.reporters:
+            reporter.finish(snapshot)
+            reporter.close()
+
     def feedback(self, **kwargs):
         """
         Print feedback.
         """
+        snapshot = self.get_snapshot(
+            kwargs.get('filename'), kwargs.get('records'))
         dic = {
             'filename': str(kwargs.get('filename')),
             'records': kwargs.get('records'),
@@ -60,8 +171,20 @@ class FeedbackCounter(object):
             'total': self.counter,
             'created': self.created,
             'updated': self.updated,
+            'unchanged': self.unchanged,
+            'upserted': self.upserted,
+            'skipped': self.skipped,
             'rejected': self.rejected}
         print(self.message.format(**dic))
+        for key, value in iteritems(self.stats):
+            print('{0}: {1}'.format(key, value))
+        if self.timers is not None:
+            for line in self.format_timings(snapshot):
+                print(line)
+        if 'memory' in snapshot:
+            for line in self.memory.format(snapshot['memory']):
+                print(line)
+        self.report(snapshot)
         self.feedbacktime = datetime.now()
 
     def increment(self):
@@ -79,6 +202,18 @@ class FeedbackCounter(object):
         self.updated += 1
         self.increment()
 
+    def keep(self):
+        self.unchanged += 1
+        self.increment()
+
+    def upsert(self):
+        self.upserted += 1
+        self.increment()
+
+    def skip(self):
+        self.skipped += 1
+        self.increment()
+
     def use_result(self, res):
         """
         Use feedback from InstanceGenerator to set counters.
@@ -87,18 +222,61 @@ class FeedbackCounter(object):
             self.create()
         elif res == 'updated':
             self.update()
+        elif res == 'unchanged':
+            self.keep()
+        elif res == 'upserted':
+            self.upsert()
         else:
             self.increment()
 
+    def revise(self, res, new_res):
+        """
+        Moves a counted result to another result without changing the
+        total, e.g. if a buffered write fails after the record was
+        counted.
+        """
+        for result, change in ((res, -1), (new_res, 1)):
+            if result in (
+                    'created', 'updated', 'unchanged', 'upserted',
+                    'rejected'):
+                setattr(self, result, getattr(self, result) + change)
+
+    def revoke(self, res):
+        """
+        Turns a counted result into a rejection.
+        """
+        self.revise(res, 'rejected')
+
+    def get_counts(self):
+        return dict(
+            (result, getattr(self, result)) for result in (
+                'created', 'updated', 'unchanged', 'upserted', 'skipped',
+                'rejected'))
+
+    def restore(self, counts):
+        """
+        Sets the results from a dictionary returned by get_counts.
+        """
+        for result, value in iteritems(counts):
+            setattr(self, result, value)
+
+    def merge(self, other):
+        """
+        Adds the results of another counter, e.g. of a shard.
+        """
+        self.counter += other.counter - other.start
+        for result, value in iteritems(other.get_counts()):
+            setattr(self, result, getattr(self, result) + value)
+
     def finished(self):
         """
         Provides a final message.
         """
         return (
-            'Data extraction finished {0}\n\n{1} '
-            'created\n{2} updated\n{3} rejected'.format(
-                datetime.now(), self.created, self.updated,
-                self.rejected))
+            'Data extraction finished {0}\n\n{1} created\n{2} updated\n'
+            '{3} unchanged\n{4} upserted\n{5} skipped\n{6} rejected'.format(
+                datetime.now(), self.created, self.updated, self.unchanged,
+                self.upserted, self.skipped, self.rejected))
 
 
 class Extractor(object):
@@ -126,6 +304,51 @@ class Extractor(object):
         self.reader_class = reader_class or csv.DictReader
         self.reader_kwargs = reader_kwargs or {
             'delimiter': u'\t', 'quoting': csv.QUOTE_NONE}
+        # byte offset the reader starts at, see seek
+        self.offset = None
+
+    def is_line_based(self):
+        """
+        Returns True if the source is a text file read line by line, the
+        precondition for byte offsets. Readers other than csv.DictReader
+        need to set line_based to True, e.g. OGRReader reopens the source
+        by name.
+        """
+        return bool(
+            getattr(self.reader_class, 'line_based',
+                    self.reader_class is csv.DictReader) and
+            isinstance(self.source, (text, str)) and
+            os.path.isfile(self.source))
+
+    def seek(self, record, offset=None):
+        """
+        Moves the start of the reader close to record if the source is a
+        file name and options['record_index'] is set to True or to the
+        interval of a RecordIndex. The index is built if it is missing.
+        If the byte offset of record is known, e.g. from a checkpoint, it
+        is used instead. Must be called before entering the context. Sources
+        that are not line based start at the first record.
+
+        Returns:
+            int: Number of the first record the reader will return.
+        """
+        self.offset = None
+        if not self.is_line_based():
+            return 0
+        if offset is not None:
+            self.offset = offset
+            return record
+        interval = self.options.get('record_index')
+        if not interval:
+            return 0
+        index = RecordIndex(
+            self.source, None if interval is True else interval,
+            self.options.get('record_index_file'))
+        found = index.lookup(record)
+        if not found:
+            return 0
+        self.offset, ret = found
+        return ret
 
     def __enter__(self):
         """
@@ -139,6 +362,12 @@ class Extractor(object):
         """
         if hasattr(self.source, 'read'):
             fil = self.source
+        elif (self.offset or self.options.get('checkpoints')) and (
+                self.is_line_based()):
+            # tracks the byte offset
+            fil = self.fil = ShardFile(
+                self.source, self.offset,
+                encoding=self.options.get('encoding'))
         else:
             try:
                 fil = io.open(self.source)
@@ -146,6 +375,15 @@ class Extractor(object):
                 fil = self.source
         return self.reader_class(fil, **self.reader_kwargs)
 
+    def tell(self):
+        """
+        Returns:
+            int: Byte offset of the next line to be read from a file
+            source or None if unknown.
+        """
+        fil = getattr(self, 'fil', None) or self.source
+        return getattr(fil, 'position', None)
+
     def __exit__(self, type, value, traceback):
         try:
             self.fil.close()
@@ -164,6 +402,10 @@ class Logger(object):
         'Instance generation error in line {0}: {1} => rejected')
     transformation_error_message = (
         'Transformation error in line {0}: {1} => rejected')
+    invalid_cells_message = (
+        'Invalid cells in line {0}: {1} => left empty')
+    query_budget_message = (
+        'Query budget exceeded in line {0}: {1:.2f} queries, budget {2}')
 
     def __init__(self, logfile):
         self.logfile = logfile
@@ -186,6 +428,12 @@ class Logger(object):
     def log_instance_error(self, line, error):
         self.log(self.instance_error_message.format(line, text(error)))
 
+    def log_invalid_cells(self, line, fields):
+        self.log(self.invalid_cells_message.format(line, ', '.join(fields)))
+
+    def log_query_budget(self, line, queries, budget):
+        self.log(self.query_budget_message.format(line, queries, budget))
+
     def close(self):
         if self.logfile:
             self.logfile.close()
@@ -209,6 +457,17 @@ class Loader(object):
         self.model_class = model_class or self.model_class
         self.logfilename = options.get('logfilename')
         self.feedbacksize = options.get('feedbacksize', 5000)
+        self.chunksize = options.get('chunksize')
+        self.transactionsize = options.get('transactionsize')
+        # number of transformer threads, see Pipeline
+        self.pipeline_workers = options.get('pipeline')
+        if self.pipeline_workers is True:
+            self.pipeline_workers = 2
+        self.pipeline = None
+        # transformer_class instance with options['reuse_transformer']
+        self.transformer = None
+        # Result tuples not yet returned by iter_results
+        self.results = []
         self.logfile = get_logfile(
             filename=self.source, logfilename=self.logfilename)
         self.extractor = self.extractor_class(
@@ -216,8 +475,35 @@ class Loader(object):
             options=options)
         self.slice_begin = options.get('slice_begin', 0)
         self.slice_end = options.get('slice_end')
+        # line number of the first record, e.g. of a shard
+        self.counter_start = options.get('counter_start', 0)
         self.generator = self.generator_class(
             self.model_class, persistence=self.persistence, options=options)
+        # stage timings with options['timings'] or query accounting
+        self.timers = None
+        if (options.get('timings') or options.get('count_queries') or
+                options.get('query_budget') is not None):
+            self.timers = StageTimers()
+        self.generator.timers = self.timers
+        self.queries = None
+        if (options.get('count_queries') or
+                options.get('query_budget') is not None):
+            self.queries = QueryCounter(
+                options.get('query_budget'), timers=self.timers)
+        self.memory = None
+        if options.get('memory') or options.get('memory_ceiling'):
+            self.memory = MemoryMonitor(
+                ceiling=options.get('memory_ceiling'),
+                abort=options.get('memory_abort', False),
+                trace=bool(options.get('memory')),
+                top=options.get('memory_top', 10))
+        self.reporters = options.get('reporters') or []
+        self.checkpoints = self.get_checkpoint_store()
+        self.resume = options.get('resume', False)
+        self.fingerprints = None
+        if options.get('fingerprints'):
+            self.fingerprints = FingerprintStore(
+                options['fingerprints'], options.get('fingerprints_output'))
         self.options = options
 
     def feedback_hook(self, counter):
@@ -235,86 +521,655 @@ class Loader(object):
 
     def feedback(self, counter):
         if counter.counter % self.feedbacksize == 0:
+            counter.stats.update(self.generator.get_stats())
+            if self.queries is not None:
+                counter.stats.update(self.queries.get_stats())
+            if self.memory is not None:
+                self.memory.check()
             counter.feedback(
             filename=self.source, records=self.feedbacksize)
+            if self.memory is not None:
+                self.memory.enforce()
             if not self.feedback_hook(counter.counter):
+                # process_chunk updates the offset once the chunk is counted
+                self.stopped = True
+                self.stop_offset = self.tell()
                 raise StopIteration
 
+    def get_checkpoint_store(self):
+        """
+        Returns the store set with options['checkpoints']: 'database' for
+        a DatabaseCheckpointStore, a file name for a FileCheckpointStore
+        or a store instance.
+        """
+        store = self.options.get('checkpoints')
+        if not store:
+            return None
+        if store == 'database':
+            return DatabaseCheckpointStore(using=self.model_class.objects.db)
+        if isinstance(store, (text, str)):
+            return FileCheckpointStore(store)
+        return store
+
+    def get_checkpoint_key(self):
+        """
+        Identifies the source and slice in the checkpoint store. Raises
+        ImproperlyConfigured for checkpoints of sources without a name,
+        e.g. StringIO, unless options['checkpoint_key'] is set.
+        """
+        key = self.options.get('checkpoint_key')
+        if key:
+            return key
+        if isinstance(self.source, (text, str)):
+            key = os.path.abspath(self.source)
+        elif hasattr(self.source, 'name'):
+            key = text(self.source.name)
+        elif self.checkpoints is not None:
+            raise ImproperlyConfigured(
+                'Set checkpoint_key to resume loads from {0}.'.format(
+                    type(self.source).__name__))
+        else:
+            key = text(self.source)
+        if self.slice_begin or self.slice_end or self.counter_start:
+            key = u'{0}[{1}:{2}]'.format(
+                key, self.slice_begin or self.counter_start,
+                self.slice_end or '')
+        return key
+
+    def checkpoint(self, counter):
+        """
+        Saves a checkpoint every self.feedbacksize records. Buffered
+        records are written first. Checkpoints of stores outside the
+        database are saved once the current transaction is committed.
+        """
+        if (self.checkpoints is None or
+                counter.counter < self.next_checkpoint):
+            return
+        self.next_checkpoint = counter.counter + self.feedbacksize
+        self.generator.flush()
+        checkpoint = Checkpoint(
+            self.checkpoint_key, counter.counter,
+            self.tell(), counter.get_counts())
+        if self.checkpoints.transactional:
+            self.checkpoints.save(checkpoint)
+        else:
+            transaction.on_commit(
+                partial(self.checkpoints.save, checkpoint),
+                using=self.model_class.objects.db)
+
+    def restore_checkpoint(self, counter):
+        """
+        Continues from the last checkpoint of the source if resume is set.
+
+        Returns:
+            bool: True if a checkpoint was found.
+        """
+        if not self.resume or self.checkpoints is None:
+            return False
+        checkpoint = self.checkpoints.get(self.checkpoint_key)
+        if checkpoint is None:
+            return False
+        print('Resuming at line {0}'.format(checkpoint.line))
+        counter.restore(checkpoint.counts)
+        counter.counter = max(counter.counter, self.extractor.seek(
+            checkpoint.line, checkpoint.offset))
+        # remaining records are skipped by reading
+        self.slice_begin = checkpoint.line
+        return True
+
+    def discard_fingerprint(self, counter):
+        if self.fingerprints is not None:
+            self.fingerprints.discard(counter.counter)
+
+    def discard_unwritten(self, counter, res):
+        # e.g. with create set to False, loaded by a later run
+        if res is None:
+            self.discard_fingerprint(counter)
+
+    def add_result(self, line, outcome, instance=None, error=None):
+        self.results.append(
+            Result(line, outcome, getattr(instance, 'pk', None), error))
+
+    def pop_results(self):
+        results, self.results = self.results, []
+        return results
+
     def reader_reject(self, counter, logger, e):
         logger.log_reader_error(counter.counter, e)
+        self.add_result(counter.counter, 'rejected', error=e)
+        self.discard_fingerprint(counter)
         counter.reject()
         self.feedback(counter)
 
     def transformation_reject(self, counter, logger, e):
         logger.log_transformation_error(counter.counter, e)
+        self.add_result(counter.counter, 'rejected', error=e)
+        self.discard_fingerprint(counter)
         counter.reject()
         self.feedback(counter)
 
     def generator_reject(self, counter, logger, e):
+        if isinstance(e, DatabaseError):
+            self.generator.rollback()
         logger.log_instance_error(counter.counter, e)
+        self.add_result(counter.counter, 'rejected', error=e)
+        self.discard_fingerprint(counter)
         counter.reject()
         self.feedback(counter)
 
-    def process(self, extractor, counter, logger):
+    def collect_deferred(self, counter, logger):
         """
-        This is broken out from below and should be better
-        organized.
+        Logs and counts results the generator determined after the records
+        have been counted, e.g. when a buffered write failed, and logs
+        cells the generator could not coerce.
         """
+        for tag, fields in self.generator.pop_invalid():
+            logger.log_invalid_cells(tag, fields)
+        for tag, res, new_res in self.generator.pop_revised():
+            counter.revise(res, new_res)
+            self.add_result(tag, new_res)
+        for tag, res, error in self.generator.pop_rejected():
+            logger.log_instance_error(tag, error)
+            self.add_result(tag, 'rejected', error=error)
+            counter.revoke(res)
+            if self.fingerprints is not None:
+                self.fingerprints.discard(tag)
 
-        try:
-            dic = extractor.next()
-        except (UnicodeDecodeError, csv.Error) as e:
-            self.reader_reject(counter, logger, e)
-            return
+    def fingerprint(self, dic):
+        """
+        Returns a fingerprint of a record as returned by the reader.
+        """
+        items = sorted(
+            u'{0}\x1e{1}'.format(key, value) for key, value in iteritems(dic))
+        return md5(u'\x1f'.join(items).encode('utf-8')).hexdigest()
 
+    def transform(self, dic):
+        """
+        Applies the transformer to a record.
+
+        Returns:
+            dict: Transformed record.
+        """
         defaults = self.options.get('defaults') or {}
+        if self.options.get('reuse_transformer'):
+            if self.transformer is None:
+                self.transformer = self.transformer_class(defaults=defaults)
+            return self.transformer.transform_record(dic)
         transformer = self.transformer_class(dic, defaults=defaults)
+        if transformer.is_valid():
+            return transformer.cleaned_data
+        raise ValidationError('Transformer did not return valid data')
+
+    def extract(self, extractor):
+        """
+        Reads the next record, raises StopIteration at the end.
+
+        Returns:
+            tuple: (reject, item, fingerprint), reject is None and item
+            the record or reject is the method rejecting the record with
+            item. fingerprint is None without fingerprints.
+        """
         try:
-            if transformer.is_valid():
-                dic = transformer.cleaned_data
-            else:
-                raise ValidationError('Transformer did not return valid data')
+            with timed(self.timers, 'read'):
+                dic = next(extractor)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return self.reader_reject, e, None
+        fingerprint = None
+        if self.fingerprints is not None:
+            fingerprint = self.fingerprint(dic)
+            if fingerprint in self.fingerprints:
+                return self.skip_record, fingerprint, None
+        return None, dic, fingerprint
+
+    def apply_transform(self, entry):
+        """
+        Transforms an entry returned by extract.
+        """
+        reject, dic, fingerprint = entry
+        if reject:
+            return entry
+        try:
+            with timed(self.timers, 'transform'):
+                return None, self.transform(dic), fingerprint
         except (ValidationError, ValueError, IndexError,
                 KeyError) as e:
-            self.transformation_reject(counter, logger, e)
+            return self.transformation_reject, e, fingerprint
+
+    def read(self, extractor, line):
+        """
+        Reads and transforms the next record, from the pipeline if there
+        is one. Raises StopIteration at the end.
+
+        Returns:
+            tuple: (reject, item), reject is None and item the transformed
+            record or reject is the method rejecting the record with item.
+        """
+        if self.pipeline is not None:
+            reject, item, fingerprint = self.pipeline.next()
+        else:
+            reject, item, fingerprint = self.apply_transform(
+                self.extract(extractor))
+        if fingerprint is not None:
+            self.fingerprints.add(line, fingerprint)
+        return reject, item
+
+    def tell(self):
+        """
+        Returns:
+            int: Byte offset of the record after the last record read or
+            None if unknown.
+        """
+        if self.pipeline is not None:
+            return self.pipeline.tell()
+        return self.extractor.tell()
+
+    def process(self, extractor, counter, logger):
+        """
+        Processes a single record. Raises StopIteration once the
+        extractor is exhausted.
+        """
+        reject, dic = self.read(extractor, counter.counter)
+        if reject:
+            reject(counter, logger, dic)
             return
 
+        self.generator.tag = counter.counter
         try:
-            self.generator.get_instance(dic)
+            # savepoint queries count as writes, nested stages are exclusive
+            with timed(self.timers, 'write'), self.generator.savepoint():
+                instance = self.generator.get_instance(dic)
         except (ValidationError, IntegrityError, DatabaseError,
                 ValueError) as e:
             self.generator_reject(counter, logger, e)
             return
 
+        self.add_result(counter.counter, self.generator.res, instance)
+        self.discard_unwritten(counter, self.generator.res)
         counter.use_result(self.generator.res)
+        self.collect_deferred(counter, logger)
+        self.feedback(counter)
+
+    def process_instrumented(self, process, extractor, counter, logger):
+        """
+        Calls process, adds the time per record to the latencies and
+        counts the queries per record if self.queries is set.
+        """
+        start = default_timer()
+        count = counter.counter
+        try:
+            if self.queries is None:
+                process(extractor, counter, logger)
+            else:
+                self.queries.begin()
+                with self.queries.install(
+                        connections[self.model_class.objects.db]):
+                    process(extractor, counter, logger)
+        finally:
+            if self.timers is not None:
+                self.timers.add_latency(
+                    default_timer() - start, counter.counter - count)
+            if self.queries is not None:
+                for tag, queries in self.queries.end(
+                        range(count, counter.counter)):
+                    logger.log_query_budget(
+                        tag, queries, self.queries.budget)
+
+    def skip_record(self, counter, logger, fingerprint):
+        """
+        Counts a record unchanged since the previous run as skipped.
+        """
+        self.fingerprints.add(counter.counter, fingerprint)
+        self.add_result(counter.counter, 'skipped')
+        counter.skip()
         self.feedback(counter)
 
+    def process_chunk(self, extractor, counter, logger):
+        """
+        Processes up to self.chunksize records and passes them on to
+        the generator at once. Rejections and results are counted in the
+        order of the records. Raises StopIteration once the extractor is
+        exhausted or, after the whole chunk is counted, once feedback_hook
+        stopped the load.
+        """
+        size = self.chunksize
+        if self.slice_end:
+            size = min(size, self.slice_end - counter.counter + 1)
+        records = []
+        exhausted = False
+        while len(records) < size:
+            try:
+                records.append(self.read(
+                    extractor, counter.counter + len(records)))
+            except StopIteration:
+                exhausted = True
+                break
+
+        tags = [
+            counter.counter + index for index, (reject, _) in
+            enumerate(records) if not reject]
+        results = iter(self.generator.get_instances(
+            [dic for reject, dic in records if not reject], tags=tags))
+        for reject, item in records:
+            if reject:
+                reject(counter, logger, item)
+                continue
+            instance, res, error = next(results)
+            if error:
+                self.generator_reject(counter, logger, error)
+            else:
+                self.add_result(counter.counter, res, instance)
+                self.discard_unwritten(counter, res)
+                counter.use_result(res)
+                if not self.stopped:
+                    try:
+                        self.feedback(counter)
+                    except StopIteration:
+                        # the chunk is written already, count it to the end
+                        pass
+        self.collect_deferred(counter, logger)
+
+        if self.stopped:
+            self.stop_offset = self.tell()
+        if exhausted or self.stopped:
+            raise StopIteration
+
+    def process_transaction(self, process, extractor, counter, logger):
+        """
+        Calls process in a single transaction until self.transactionsize
+        records have been counted. Every record is written in a savepoint,
+        so that failing records are rejected without rolling back the
+        others. Raises StopIteration once the extractor is exhausted,
+        after committing the transaction.
+        """
+        end = counter.counter + self.transactionsize
+        if self.slice_end:
+            end = min(end, self.slice_end + 1)
+        exhausted = False
+        with transaction.atomic(using=self.model_class.objects.db):
+            while counter.counter < end:
+                try:
+                    process(extractor, counter, logger)
+                except StopIteration:
+                    exhausted = True
+                    break
+                self.checkpoint(counter)
+        if exhausted:
+            raise StopIteration
+
+    def explain(self):
+        """
+        Prints the load plan of the generator with the Loader settings
+        without reading the source or writing to the database.
+
+        Returns:
+            LoadPlan
+        """
+        plan = self.generator.explain(chunked=bool(self.chunksize))
+        plan.settings[0:0] = [
+            ('Loader', type(self).__name__),
+            ('Generator', type(self.generator).__name__),
+            ('Transformer', '{0}{1}'.format(
+                self.transformer_class.__name__,
+                ', compiled forms' if getattr(
+                    self.transformer_class, 'compile_forms', False) else '')),
+            ('Chunk size', self.chunksize or 'none'),
+            ('Transaction size', self.transactionsize or 'none'),
+            ('Pipeline workers', self.pipeline_workers or 'none')]
+        print(plan.format())
+        return plan
 
     def load(self):
         """
         Loads data into database using Django models and error logging.
+
+        Returns:
+            FeedbackCounter
+        """
+        for _ in self.iter_results():
+            pass
+        return self.counter
+
+    def iter_results(self):
+        """
+        Loads data like load and lazily yields a Result for each record
+        once it has been processed, with transactionsize once the
+        transaction is committed. Buffered records are yielded with pk
+        None. If writing them fails later, another Result with outcome
+        'rejected' follows for the same line. The FeedbackCounter is
+        available as self.counter. If the consumer stops iterating, the
+        load is finished like when feedback_hook stops it.
         """
         print('Opening {0}'.format(self.source))
+        self.checkpoint_key = self.get_checkpoint_key()
         logger = Logger(self.logfile)
-        logger.log_start({
-            'start_time': datetime.now().strftime('%Y-%m-%d'),
-            'slice_begin': self.slice_begin,
-            'slice_end': self.slice_end})
-        counter = FeedbackCounter()
+        try:
+            self.results = []
+            logger.log_start({
+                'start_time': datetime.now().strftime('%Y-%m-%d'),
+                'slice_begin': self.slice_begin or self.counter_start,
+                'slice_end': self.slice_end})
+            counter = self.counter = FeedbackCounter(
+                counter=self.counter_start, timers=self.timers,
+                reporters=self.reporters, memory=self.memory)
+            if self.memory is not None:
+                self.memory.start()
+            if self.fingerprints is not None:
+                self.fingerprints.open()
 
-        with self.extractor as extractor:
+            # set if feedback_hook or the consumer stopped the load
+            self.stopped = False
+            self.stop_offset = None
+            if not self.restore_checkpoint(counter) and self.slice_begin:
+                counter.counter += self.extractor.seek(self.slice_begin)
+            self.next_checkpoint = counter.counter + self.feedbacksize
 
-            while self.slice_begin and self.slice_begin > counter.counter:
-                extractor.next()
-                counter.increment()
+            with self.extractor as extractor:
 
-            while not self.slice_end or self.slice_end >= counter.counter:
                 try:
-                    self.process(extractor, counter, logger)
+                    while (self.slice_begin and
+                            self.slice_begin > counter.counter):
+                        next(extractor)
+                        counter.increment()
                 except StopIteration:
-                    break
+                    pass
+
+                if self.pipeline_workers:
+                    self.pipeline = Pipeline(
+                        partial(self.extract, extractor),
+                        self.apply_transform, workers=self.pipeline_workers,
+                        size=self.options.get('pipeline_size', 1000),
+                        limit=(self.slice_end - counter.counter + 1)
+                        if self.slice_end else None,
+                        tell=self.extractor.tell).start()
 
-            if self.generator.finalize():
-                logger.log(counter.finished())
+                process = (
+                    self.process_chunk if self.chunksize else self.process)
+                if self.timers is not None or self.queries is not None:
+                    process = partial(self.process_instrumented, process)
+                closed = False
+                try:
+                    exhausted = False
+                    while not exhausted and (
+                            not self.slice_end or
+                            self.slice_end >= counter.counter):
+                        try:
+                            if self.transactionsize:
+                                self.process_transaction(
+                                    process, extractor, counter, logger)
+                            else:
+                                process(extractor, counter, logger)
+                                self.checkpoint(counter)
+                        except StopIteration:
+                            exhausted = True
+                        for result in self.pop_results():
+                            yield result
+                except GeneratorExit:
+                    # the consumer stopped iterating, finish counted records
+                    self.stopped = True
+                    self.stop_offset = self.tell()
+                    closed = True
+                except BaseException:
+                    # e.g. MemoryCeilingExceeded, stops tracemalloc
+                    if self.memory is not None:
+                        self.memory.close()
+                    raise
+                finally:
+                    if self.pipeline is not None:
+                        self.pipeline.close()
+                        self.pipeline = None
 
+                finalized = self.generator.finalize()
+                self.collect_deferred(counter, logger)
+                if not closed:
+                    for result in self.pop_results():
+                        yield result
+                if finalized:
+                    logger.log(counter.finished())
+                if self.memory is not None:
+                    self.memory.check()
+                counter.finish(self.source)
+                if self.memory is not None:
+                    self.memory.close()
+                if self.checkpoints is not None and self.stopped:
+                    # resume after the last record counted
+                    self.checkpoints.save(Checkpoint(
+                        self.checkpoint_key, counter.counter,
+                        self.stop_offset, counter.get_counts()))
+                elif self.checkpoints is not None:
+                    self.checkpoints.delete(self.checkpoint_key)
+                if self.fingerprints is not None:
+                    self.fingerprints.close()
+        finally:
             logger.close()
+
+
+def init_worker():
+    """
+    Prepares a worker process of ParallelLoader. Workers must not share
+    database connections with the parent process.
+    """
+    from django import setup
+    from django.apps import apps
+    if not apps.ready:
+        setup()
+    connections.close_all()
+
+
+def load_shard(args):
+    """
+    Loads a shard of a file, runs in a worker process of ParallelLoader.
+
+    Returns:
+        FeedbackCounter
+    """
+    loader_class, filename, (begin, end, line), model_class, options = args
+    with ShardFile(
+            filename, begin, end, encoding=options.get('encoding')) as fil:
+        loader = loader_class(fil, model_class=model_class, options=dict(
+            options, counter_start=line))
+        return loader.load()
+
+
+class ParallelLoader(object):
+    """
+    Splits a file into byte ranges aligned on line boundaries and loads
+    each shard with loader_class in a pool of worker processes. Records
+    must not span several lines and loader_class needs to be importable
+    by the workers.
+
+    Options:
+        processes (int): Number of worker processes, defaults to the
+            number of CPUs. With 1 the shards are loaded in this process.
+        shards (int): Number of shards, defaults to processes.
+
+    Other options are passed on to the loaders, except for slice_begin
+    and slice_end.
+    """
+    loader_class = Loader
+    model_class = None
+
+    def __init__(self, source, model_class=None, options={}):
+        self.source = source
+        self.options = options
+        self.model_class = model_class or self.model_class
+        self.processes = options.get(
+            'processes') or multiprocessing.cpu_count()
+        self.shards = options.get('shards') or self.processes
+        self.logfilename = options.get(
+            'logfilename') or get_logfilename(source)
+        self.logfile = create_logfile(self.logfilename)
+
+    def get_shard_options(self, index):
+        options = dict(self.options, logfilename='{0}.{1}'.format(
+            self.logfilename, index))
+        options.pop('slice_begin', None)
+        options.pop('slice_end', None)
+        if options.get('fingerprints'):
+            options['fingerprints_output'] = '{0}.{1}'.format(
+                options['fingerprints'], index)
+        return options
+
+    def map(self, tasks):
+        """
+        Runs load_shard for each task and yields the results in order.
+        """
+        if self.processes == 1:
+            for task in tasks:
+                yield load_shard(task)
+            return
+        # connections must not be inherited by forked workers
+        connections.close_all()
+        pool = multiprocessing.Pool(
+            min(self.processes, len(tasks)), initializer=init_worker)
+        try:
+            for result in pool.imap(load_shard, tasks):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def merge_log(self, logger, index):
+        filename = '{0}.{1}'.format(self.logfilename, index)
+        with io.open(filename) as fil:
+            for line in fil:
+                logger.log(line.rstrip('\n'))
+        os.remove(filename)
+
+    def merge_fingerprints(self, count):
+        filename = self.options.get('fingerprints')
+        if not filename:
+            return
+        tmp = '{0}.tmp'.format(filename)
+        with io.open(tmp, 'w', encoding='ascii') as fil:
+            for index in range(0, count):
+                part = '{0}.{1}'.format(filename, index)
+                with io.open(part, encoding='ascii') as shard:
+                    for line in shard:
+                        fil.write(line)
+                os.remove(part)
+        replace(tmp, filename)
+
+    def load(self):
+        """
+        Loads the shards and merges their counters and logs.
+
+        Returns:
+            FeedbackCounter
+        """
+        print('Opening {0}'.format(self.source))
+        logger = Logger(self.logfile)
+        shards = get_shards(self.source, self.shards)
+        logger.log('Loading {0} in {1} shards\n'.format(
+            self.source, len(shards)))
+        tasks = [
+            (self.loader_class, self.source, shard, self.model_class,
+             self.get_shard_options(index))
+            for index, shard in enumerate(shards)]
+        counter = FeedbackCounter()
+        for index, result in enumerate(self.map(tasks)):
+            counter.merge(result)
+            self.merge_log(logger, index)
+        self.merge_fingerprints(len(shards))
+        logger.log(counter.finished())
+        logger.close()
+        return counter
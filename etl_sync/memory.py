@@ -0,0 +1,217 @@
+from __future__ import print_function
+
+import os
+import sys
+import warnings
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connections
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class MemoryCeilingExceeded(MemoryError):
+    pass
+
+
+def get_rss():
+    """
+    Returns:
+        int: Resident set size of the process in bytes, None if it is
+        not available, i.e. without /proc.
+    """
+    try:
+        with open('/proc/self/statm') as fil:
+            pages = int(fil.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def get_peak_rss():
+    """
+    Returns:
+        int: Peak resident set size of the process in bytes, None if it
+        is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_debug_queries():
+    """
+    Returns:
+        int: Number of queries in the logs Django keeps with DEBUG.
+    """
+    if not settings.DEBUG:
+        return 0
+    return sum(
+        len(getattr(connection, 'queries_log', ()))
+        for connection in connections.all())
+
+
+def format_bytes(value):
+    if value is None:
+        return 'n/a'
+    sign = '-' if value < 0 else ''
+    value = abs(value)
+    for unit in ('B', 'kB', 'MB'):
+        if value < 1024:
+            return '{0}{1:.1f} {2}'.format(sign, value, unit)
+        value /= 1024.0
+    return '{0}{1:.1f} GB'.format(sign, value)
+
+
+class MemoryMonitor(object):
+    """
+    Measures the memory of a load at every feedback interval: RSS and,
+    with trace, the memory allocated by Python according to tracemalloc
+    and the top sites it grew at since the previous interval. Crossing
+    ceiling (RSS in bytes, traced memory where RSS is not available)
+    warns, or with abort raises MemoryCeilingExceeded.
+
+    Args:
+        ceiling (int): Memory limit in bytes, None for no limit.
+        abort (bool): Abort the load at the ceiling instead of warning.
+        trace (bool): Use tracemalloc, Python 3 only. Slows down the load.
+        top (int): Number of growth sites reported.
+        frames (int): Frames stored per allocation by tracemalloc.
+    """
+
+    def __init__(self, ceiling=None, abort=False, trace=True, top=10,
+                 frames=1):
+        self.ceiling = ceiling
+        self.abort = abort
+        self.trace = trace and tracemalloc is not None
+        self.top = top
+        self.frames = frames
+        self.started = False
+        # tracemalloc was started by the monitor and is stopped by close
+        self.tracing = False
+        self.snapshot = None
+        # measurements of the last check, see get_snapshot
+        self.last = None
+
+    def start(self):
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.tracing = True
+        if self.trace:
+            self.snapshot = self.take_snapshot()
+        self.started = True
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')))
+
+    def get_growth(self, snapshot):
+        """
+        Returns:
+            list: (site, bytes, allocations) of the top sites memory
+            grew at since the previous snapshot.
+        """
+        ret = []
+        for stat in snapshot.compare_to(self.snapshot, 'lineno'):
+            if len(ret) >= self.top or stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            ret.append(('{0}:{1}'.format(frame.filename, frame.lineno),
+                        stat.size_diff, stat.count_diff))
+        return ret
+
+    def check(self):
+        """
+        Measures the memory, the result is kept for get_snapshot.
+
+        Returns:
+            dict: rss, peak_rss, traced and traced_peak in bytes,
+            debug_queries and growth, see get_growth.
+        """
+        if not self.started:
+            self.start()
+        ret = OrderedDict([
+            ('rss', get_rss()),
+            ('peak_rss', get_peak_rss()),
+            ('traced', None),
+            ('traced_peak', None),
+            ('debug_queries', get_debug_queries()),
+            ('growth', [])])
+        if self.trace:
+            ret['traced'], ret['traced_peak'] = (
+                tracemalloc.get_traced_memory())
+            snapshot = self.take_snapshot()
+            ret['growth'] = self.get_growth(snapshot)
+            self.snapshot = snapshot
+        ret['exceeded'] = self.is_exceeded(ret)
+        self.last = ret
+        return ret
+
+    def is_exceeded(self, measurement):
+        if self.ceiling is None:
+            return False
+        used = measurement['rss']
+        if used is None:
+            used = measurement['traced']
+        return used is not None and used > self.ceiling
+
+    def format(self, measurement):
+        """
+        Returns:
+            list: Feedback lines for measurement.
+        """
+        line = 'Memory: RSS {0}, peak {1}'.format(
+            format_bytes(measurement['rss']),
+            format_bytes(measurement['peak_rss']))
+        if measurement['traced'] is not None:
+            line += ', traced {0}, traced peak {1}'.format(
+                format_bytes(measurement['traced']),
+                format_bytes(measurement['traced_peak']))
+        ret = [line]
+        if measurement['debug_queries']:
+            ret.append(
+                'Memory: {0} queries kept in the debug log, set DEBUG to '
+                'False'.format(measurement['debug_queries']))
+        if measurement['exceeded']:
+            ret.append('Memory: ceiling of {0} exceeded'.format(
+                format_bytes(self.ceiling)))
+        if measurement['growth']:
+            ret.append('Memory growth:')
+            ret.extend(
+                '  {0}: +{1} in {2} blocks'.format(
+                    site, format_bytes(size), count)
+                for site, size, count in measurement['growth'])
+        return ret
+
+    def enforce(self):
+        """
+        Warns or raises MemoryCeilingExceeded if the last check crossed
+        the ceiling.
+        """
+        if not self.last or not self.last['exceeded']:
+            return
+        message = 'Memory ceiling of {0} exceeded: RSS {1}, traced {2}'.format(
+            format_bytes(self.ceiling), format_bytes(self.last['rss']),
+            format_bytes(self.last['traced']))
+        if self.abort:
+            raise MemoryCeilingExceeded(message)
+        warnings.warn(message, RuntimeWarning)
+
+    def close(self):
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+        self.snapshot = None
+        self.started = False
@@ -0,0 +1,26 @@
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True, serialize=False,
+                    verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('line', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(blank=True, null=True)),
+                ('counts', models.TextField(blank=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
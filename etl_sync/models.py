@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class Checkpoint(models.Model):
+    """
+    Progress of a load, see etl_sync.checkpoints.DatabaseCheckpointStore.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    line = models.BigIntegerField()
+    offset = models.BigIntegerField(null=True, blank=True)
+    counts = models.TextField(blank=True)
+    modified = models.DateTimeField(auto_now=True)
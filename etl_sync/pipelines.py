@@ -0,0 +1,148 @@
+from __future__ import print_function
+
+import threading
+from six.moves import queue
+from django.db import connections
+
+
+class Pipeline(object):
+    """
+    Runs extract in a reader thread and transform in a pool of transformer
+    threads. The threads are connected by bounded queues: the reader
+    blocks while size records are in flight. next returns the results in
+    the order of the records, so that they can be written, counted and
+    logged by a single writer like in sequential processing.
+
+    Args:
+        extract (callable): Returns the next entry, raises StopIteration
+            at the end.
+        transform (callable): Transforms an entry.
+        workers (int): Number of transformer threads.
+        size (int): Maximum number of records in flight.
+        limit (int): Maximum number of records to read, None for all.
+        tell (callable): Optional, returns the position of the reader
+            after a record was extracted, see Extractor.tell.
+    """
+
+    def __init__(self, extract, transform, workers=2, size=1000,
+                 limit=None, tell=None):
+        self.extract = extract
+        self.transform = transform
+        self.workers = workers
+        self.limit = limit
+        self.tell_reader = tell
+        # one item per record in flight
+        self.slots = queue.Queue(size)
+        # (index, entry, position) or None to stop a worker
+        self.tasks = queue.Queue()
+        # index => (entry, error, position)
+        self.results = {}
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        # number of records read, set once the reader is done
+        self.end = None
+        self.index = 0
+        self.position = None
+        self.threads = []
+
+    def start(self):
+        self.threads = [threading.Thread(target=self.read)] + [
+            threading.Thread(target=self.work)
+            for _ in range(0, self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def acquire(self):
+        while not self.stopped.is_set():
+            try:
+                self.slots.put(None, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(self):
+        index = 0
+        try:
+            while self.limit is None or index < self.limit:
+                if not self.acquire():
+                    break
+                try:
+                    entry = self.extract()
+                except StopIteration:
+                    break
+                position = self.tell_reader() if self.tell_reader else None
+                self.tasks.put((index, entry, position))
+                index += 1
+        except Exception as e:
+            # raised by next in the order of the records
+            self.put(index, None, e, None)
+            index += 1
+        finally:
+            for _ in range(0, self.workers):
+                self.tasks.put(None)
+            with self.condition:
+                self.end = index
+                self.condition.notify_all()
+
+    def work(self):
+        try:
+            while True:
+                task = self.tasks.get()
+                if task is None or self.stopped.is_set():
+                    break
+                index, entry, position = task
+                try:
+                    self.put(index, self.transform(entry), None, position)
+                except Exception as e:
+                    self.put(index, None, e, position)
+        finally:
+            # connections opened by transformers
+            connections.close_all()
+
+    def put(self, index, entry, error, position):
+        with self.condition:
+            self.results[index] = (entry, error, position)
+            self.condition.notify_all()
+
+    def next(self):
+        """
+        Returns the next transformed entry, raises StopIteration at the
+        end and errors of extract or transform that were not handled.
+        """
+        with self.condition:
+            while self.index not in self.results:
+                if self.end is not None and self.index >= self.end:
+                    raise StopIteration
+                self.condition.wait(0.1)
+            entry, error, position = self.results.pop(self.index)
+        self.index += 1
+        self.position = position
+        self.slots.get_nowait()
+        if error is not None:
+            raise error
+        return entry
+
+    __next__ = next
+
+    def __iter__(self):
+        return self
+
+    def tell(self):
+        """
+        Returns:
+            Position of the reader after the last record returned by next.
+        """
+        return self.position
+
+    def close(self):
+        """
+        Stops the threads, records in flight are discarded.
+        """
+        self.stopped.set()
+        for _ in range(0, self.workers):
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,130 @@
+from __future__ import print_function
+from future.utils import iteritems
+
+from collections import OrderedDict
+from timeit import default_timer
+from etl_sync.timers import StageTimers
+
+
+class QueryCounter(object):
+    """
+    Execute wrapper for a database connection counting the queries and
+    the time spent in the database, in total, by stage and by record.
+    Records exceeding budget queries are flagged. Requires Django 2.0 or
+    newer.
+
+    Args:
+        budget (int): Maximum number of queries per record, None for no
+            limit.
+        timers (StageTimers): Optional, provides the stage of a query.
+    """
+    # upper bound for the number of flagged records kept
+    max_flagged = 1000
+
+    def __init__(self, budget=None, timers=None):
+        self.budget = budget
+        self.timers = timers
+        self.queries = 0
+        self.seconds = 0.0
+        # stage => [queries, seconds]
+        self.stages = OrderedDict()
+        self.records = 0
+        # queries assigned to finished records by end
+        self.credited = 0
+        self.max_per_record = 0
+        # (tag, queries) of records over budget
+        self.flagged = []
+        # queries since begin
+        self.current = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = default_timer()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = default_timer() - start
+            stage = None
+            if self.timers is not None:
+                stage = self.timers.current_stage()
+            self.queries += 1
+            self.current += 1
+            self.seconds += seconds
+            totals = self.stages.setdefault(stage or 'other', [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def install(self, connection):
+        """
+        Returns:
+            context manager: Counts the queries of connection.
+        """
+        if not hasattr(connection, 'execute_wrapper'):
+            raise ValueError('Query accounting requires Django 2.0 or newer')
+        return connection.execute_wrapper(self)
+
+    def begin(self):
+        self.current = 0
+
+    def end(self, tags):
+        """
+        Assigns the queries since begin to the records labeled with tags,
+        evenly if there are several, e.g. records of a chunk.
+
+        Returns:
+            list: (tag, queries) of the records over budget.
+        """
+        tags = list(tags)
+        if not tags:
+            return []
+        per_record = float(self.current) / len(tags)
+        self.records += len(tags)
+        self.credited += self.current
+        self.max_per_record = max(self.max_per_record, per_record)
+        if self.budget is None or per_record <= self.budget:
+            return []
+        ret = [(tag, per_record) for tag in tags]
+        self.flagged.extend(
+            ret[0:max(0, self.max_flagged - len(self.flagged))])
+        return ret
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Statistics to be included in the Loader's feedback.
+        """
+        ret = OrderedDict()
+        # queries of records in progress are not averaged
+        ret['Queries'] = (
+            '{0} in {1:.3f}s, {2:.2f} per record, max {3:.2f}'.format(
+                self.queries, self.seconds,
+                float(self.credited) / self.records if self.records else 0,
+                self.max_per_record))
+        ret['Queries by stage'] = ', '.join(
+            '{0} {1} ({2:.3f}s)'.format(stage, queries, seconds)
+            for stage, (queries, seconds) in iteritems(self.stages))
+        if self.budget is not None:
+            ret['Records over query budget'] = len(self.flagged)
+        return ret
+
+
+class QueryAssertionsMixin(object):
+    """
+    Assertions for unittest.TestCase subclasses.
+    """
+
+    def assertMaxQueriesPerRecord(self, loader, budget):
+        """
+        Loads with loader and fails if a record took more than budget
+        queries. Chunked loads are checked by the average of the chunk.
+        """
+        if loader.timers is None:
+            loader.timers = loader.generator.timers = StageTimers()
+        loader.queries = QueryCounter(budget=budget, timers=loader.timers)
+        loader.load()
+        if loader.queries.max_per_record > budget:
+            self.fail(
+                '{0:.2f} queries per record exceed the budget of {1}, lines '
+                '{2}'.format(
+                    loader.queries.max_per_record, budget, ', '.join(
+                        str(tag) for tag, _ in loader.queries.flagged[:10])))
+        return loader.queries
@@ -66,7 +66,10 @@ class OGRReader(object):
     def length(self):
         return self.layer.GetFeatureCount()
 
-    def next(self):
+    def __iter__(self):
+        return self
+
+    def __next__(self):
         feature = self.layer.GetNextFeature()
         try:
             ret = feature.items()
@@ -80,6 +83,8 @@ class OGRReader(object):
                 ret['geometry'] = ogr_geom.ExportToWkt()
             return ret
 
+    next = __next__
+
 
 class ShapefileReader(OGRReader):
     """
@@ -0,0 +1,157 @@
+from __future__ import print_function
+from builtins import str as text
+from future.utils import iteritems
+
+import io
+import json
+from etl_sync.caches import replace
+
+
+class Reporter(object):
+    """
+    Receives a snapshot of the FeedbackCounter at every feedback interval
+    and once the load is finished. A snapshot is a dictionary with the
+    keys:
+
+        time, filename, records (in the interval), seconds (of the
+        interval), rate (records per second in the interval), total,
+        created, updated, unchanged, upserted, skipped, rejected and
+        stats (additional feedback of the generator).
+
+    With timings the snapshot also holds stages and stage_totals, seconds
+    by stage for the interval and in total, and latency, p50 and p95 of
+    the processing time per record in the interval.
+
+    With memory instrumentation the snapshot holds memory, the last
+    measurement of the MemoryMonitor.
+    """
+
+    def report(self, snapshot):
+        """
+        Override this method to publish a snapshot, e.g. write it to a file
+        or push it to a metrics service.
+        """
+        pass
+
+    def finish(self, snapshot):
+        """
+        Called with the final snapshot.
+        """
+        self.report(snapshot)
+
+    def close(self):
+        pass
+
+
+class JSONLinesReporter(Reporter):
+    """
+    Appends every snapshot as a line of JSON to a file.
+
+    Args:
+        output (str or file): File name or file-like object.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.fil = None
+
+    def report(self, snapshot):
+        if self.fil is None:
+            if hasattr(self.output, 'write'):
+                self.fil = self.output
+            else:
+                self.fil = io.open(self.output, 'a', encoding='utf-8')
+        self.fil.write(text(json.dumps(snapshot)) + u'\n')
+        self.fil.flush()
+
+    def close(self):
+        if self.fil is not None and self.fil is not self.output:
+            self.fil.close()
+        self.fil = None
+
+
+def escape_label(value):
+    return text(value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')
+
+
+class PrometheusReporter(Reporter):
+    """
+    Writes the latest snapshot to a file in the Prometheus text format,
+    e.g. for the textfile collector of the node exporter. The file is
+    replaced atomically.
+
+    Args:
+        filename (str): Path of the file, should end with .prom.
+        prefix (str): Prefix of the metric names.
+        labels (dict): Labels added to all metrics, by default the
+            source file.
+    """
+    results = (
+        'created', 'updated', 'unchanged', 'upserted', 'skipped',
+        'rejected')
+
+    def __init__(self, filename, prefix='etl_sync', labels=None):
+        self.filename = filename
+        self.prefix = prefix
+        self.labels = labels
+
+    def format_labels(self, labels):
+        if not labels:
+            return ''
+        return u'{{{0}}}'.format(u','.join(
+            u'{0}="{1}"'.format(key, escape_label(value))
+            for key, value in labels))
+
+    def format_metric(self, name, kind, helptext, samples):
+        name = u'{0}_{1}'.format(self.prefix, name)
+        lines = [
+            u'# HELP {0} {1}'.format(name, helptext),
+            u'# TYPE {0} {1}'.format(name, kind)]
+        for labels, value in samples:
+            if value is not None:
+                lines.append(u'{0}{1} {2}'.format(
+                    name, self.format_labels(labels), repr(float(value))))
+        return lines
+
+    def get_lines(self, snapshot):
+        labels = sorted(iteritems(
+            self.labels if self.labels is not None else
+            {'source': snapshot['filename']}))
+        lines = self.format_metric(
+            'records_total', 'counter', 'Records processed.',
+            [(labels, snapshot['total'])])
+        lines += self.format_metric(
+            'results_total', 'counter', 'Records processed by result.',
+            [(labels + [('result', result)], snapshot[result])
+             for result in self.results])
+        lines += self.format_metric(
+            'records_per_second', 'gauge',
+            'Records processed per second in the last interval.',
+            [(labels, snapshot['rate'])])
+        if 'stage_totals' in snapshot:
+            lines += self.format_metric(
+                'stage_seconds_total', 'counter', 'Seconds spent by stage.',
+                [(labels + [('stage', stage)], seconds)
+                 for stage, seconds in iteritems(snapshot['stage_totals'])])
+            lines += self.format_metric(
+                'record_latency_seconds', 'gauge',
+                'Processing time per record in the last interval.',
+                [(labels + [('quantile', quantile)], snapshot['latency'][key])
+                 for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'))])
+        if 'memory' in snapshot:
+            lines += self.format_metric(
+                'memory_rss_bytes', 'gauge', 'Resident set size.',
+                [(labels, snapshot['memory']['rss'])])
+            lines += self.format_metric(
+                'memory_traced_bytes', 'gauge',
+                'Memory allocated by Python according to tracemalloc.',
+                [(labels, snapshot['memory']['traced'])])
+        return lines
+
+    def report(self, snapshot):
+        tmp = '{0}.tmp'.format(self.filename)
+        with io.open(tmp, 'w', encoding='utf-8') as fil:
+            for line in self.get_lines(snapshot):
+                fil.write(line + u'\n')
+        replace(tmp, self.filename)
@@ -0,0 +1,197 @@
+from __future__ import print_function
+
+import io
+import locale
+import os
+from etl_sync.caches import replace
+
+
+def count_lines(fil, begin, end, blocksize=1 << 20):
+    """
+    Counts the line breaks between the byte offsets begin and end of a
+    file opened in binary mode.
+    """
+    fil.seek(begin)
+    ret = 0
+    while begin < end:
+        block = fil.read(min(blocksize, end - begin))
+        if not block:
+            break
+        ret += block.count(b'\n')
+        begin += len(block)
+    return ret
+
+
+def get_shards(filename, count):
+    """
+    Splits a text file with a header line into up to count byte ranges
+    aligned on line boundaries. Records must not span several lines.
+
+    Returns:
+        list: (begin, end, line) tuples, line is the number of records
+        preceding the shard.
+    """
+    size = os.path.getsize(filename)
+    with io.open(filename, 'rb') as fil:
+        fil.readline()
+        start = fil.tell()
+        bounds = [start]
+        for index in range(1, count):
+            position = start + (size - start) * index // count
+            if position <= bounds[-1]:
+                continue
+            # move to the beginning of the next line
+            fil.seek(position - 1)
+            fil.readline()
+            position = fil.tell()
+            if bounds[-1] < position < size:
+                bounds.append(position)
+        bounds.append(size)
+        ret = []
+        line = 0
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            ret.append((begin, end, line))
+            if end < size:
+                line += count_lines(fil, begin, end)
+    return ret
+
+
+class ShardFile(object):
+    """
+    Read-only text file returning the header line of a file followed by
+    the lines between the byte offsets begin and end. Line endings are
+    kept, lines are decoded with encoding.
+
+    Args:
+        filename (str): Path of the file.
+        begin (int): Offset of the first line, must be a line boundary.
+            None for the line after the header.
+        end (int): Offset after the last line, None for the end of file.
+        encoding (str): Defaults to the preferred encoding like io.open.
+
+    position is the offset of the next line to be read.
+    """
+
+    def __init__(self, filename, begin=None, end=None, encoding=None):
+        self.name = filename
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.fil = io.open(filename, 'rb')
+        self.header = self.fil.readline()
+        if begin is None:
+            begin = self.fil.tell()
+        if end is None:
+            end = os.path.getsize(filename)
+        self.begin = begin
+        self.end = end
+        self.fil.seek(begin)
+        self.position = begin
+
+    def __repr__(self):
+        return '{0} [{1}:{2}]'.format(self.name, self.begin, self.end)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.header is not None:
+            line, self.header = self.header, None
+        else:
+            if self.position >= self.end:
+                raise StopIteration
+            line = self.fil.readline()
+            if not line:
+                raise StopIteration
+            self.position += len(line)
+        return line.decode(self.encoding)
+
+    next = __next__
+
+    def read(self):
+        return u''.join(self)
+
+    def close(self):
+        self.fil.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class RecordIndex(object):
+    """
+    Sidecar index of the byte offsets of every interval-th record of a
+    text file with a header line and one record per line. The index is
+    stored in indexfilename, by default filename + '.idx', and rebuilt if
+    the file or the interval changed.
+
+    Args:
+        filename (str): Path of the indexed file.
+        interval (int): Number of records between indexed offsets.
+        indexfilename (str): Path of the index.
+    """
+    interval = 10000
+
+    def __init__(self, filename, interval=None, indexfilename=None):
+        self.filename = filename
+        self.interval = interval or self.interval
+        self.indexfilename = indexfilename or '{0}.idx'.format(filename)
+        self.offsets = None
+
+    def get_signature(self):
+        stat = os.stat(self.filename)
+        return u'{0} {1} {2:.6f}'.format(
+            self.interval, stat.st_size, stat.st_mtime)
+
+    def load(self):
+        """
+        Reads the index.
+
+        Returns:
+            bool: False if the index is missing or outdated.
+        """
+        try:
+            with io.open(self.indexfilename, encoding='ascii') as fil:
+                if fil.readline().strip() != self.get_signature():
+                    return False
+                self.offsets = [int(line) for line in fil]
+        except (IOError, OSError, ValueError):
+            return False
+        return True
+
+    def build(self):
+        """
+        Scans the file for the offsets and saves the index.
+        """
+        signature = self.get_signature()
+        offsets = []
+        with io.open(self.filename, 'rb') as fil:
+            fil.readline()
+            position = fil.tell()
+            for record, line in enumerate(fil):
+                if record % self.interval == 0:
+                    offsets.append(position)
+                position += len(line)
+        tmp = '{0}.tmp'.format(self.indexfilename)
+        with io.open(tmp, 'w', encoding='ascii') as fil:
+            fil.write(u'{0}\n'.format(signature))
+            for offset in offsets:
+                fil.write(u'{0}\n'.format(offset))
+        replace(tmp, self.indexfilename)
+        self.offsets = offsets
+
+    def lookup(self, record):
+        """
+        Builds the index if necessary.
+
+        Returns:
+            tuple: (offset, number) of the last indexed record not after
+            record, None if the file holds no records.
+        """
+        if self.offsets is None and not self.load():
+            self.build()
+        if not self.offsets:
+            return None
+        index = min(record // self.interval, len(self.offsets) - 1)
+        return self.offsets[index], index * self.interval
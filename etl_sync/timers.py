@@ -0,0 +1,135 @@
+from __future__ import print_function
+
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+
+class NullTimer(object):
+    """
+    Context manager doing nothing, returned by timed without timers.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def timed(timers, stage):
+    """
+    Returns:
+        context manager: Timing stage if timers is not None.
+    """
+    if timers is None:
+        return NULL_TIMER
+    return timers.time(stage)
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a sorted list, None if it is empty.
+    """
+    if not values:
+        return None
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+class StageTimer(object):
+
+    def __init__(self, timers, stage):
+        self.timers = timers
+        self.stage = stage
+
+    def __enter__(self):
+        self.timers.enter(self.stage)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.timers.exit(self.stage)
+
+
+class StageTimers(object):
+    """
+    Accumulates the time spent in the stages of a load, in total and for
+    the current feedback interval, and the processing time of each record
+    of the interval. Nested stages are exclusive, e.g. time spent in
+    'lookup' while in 'prepare' only counts for 'lookup'. Stages can be
+    timed from several threads, e.g. transformer threads of a Pipeline,
+    their times add up.
+    """
+    stages = ('read', 'transform', 'prepare', 'lookup', 'write', 'm2m')
+
+    def __init__(self):
+        self.totals = OrderedDict((stage, 0.0) for stage in self.stages)
+        self.interval = OrderedDict((stage, 0.0) for stage in self.stages)
+        # processing times of the records of the current interval
+        self.latencies = []
+        self.lock = threading.Lock()
+        # per thread list of [start, time of nested stages, stage]
+        self.local = threading.local()
+
+    def time(self, stage):
+        """
+        Returns:
+            context manager: Adds the time spent in the block to stage.
+        """
+        return StageTimer(self, stage)
+
+    def enter(self, stage):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append([default_timer(), 0.0, stage])
+
+    def exit(self, stage):
+        stack = self.local.stack
+        start, nested, _ = stack.pop()
+        elapsed = default_timer() - start
+        if stack:
+            stack[-1][1] += elapsed
+        self.add(stage, elapsed - nested)
+
+    def current_stage(self):
+        """
+        Returns:
+            str: The innermost stage the current thread is in, None if
+            it is in none.
+        """
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1][2] if stack else None
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+            self.interval[stage] = self.interval.get(stage, 0.0) + seconds
+
+    def add_latency(self, seconds, count=1):
+        """
+        Adds the processing time of count records, each is counted with
+        seconds / count.
+        """
+        if count:
+            self.latencies.extend([seconds / count] * count)
+
+    def get_latency(self):
+        """
+        Returns:
+            dict: p50 and p95 of the record processing times of the
+            interval in seconds.
+        """
+        latencies = sorted(self.latencies)
+        return OrderedDict([
+            ('p50', percentile(latencies, 0.5)),
+            ('p95', percentile(latencies, 0.95))])
+
+    def reset_interval(self):
+        with self.lock:
+            for stage in self.interval:
+                self.interval[stage] = 0.0
+        self.latencies = []
@@ -2,13 +2,27 @@ from future.utils import iteritems
 
 import re
 from django.core.exceptions import ValidationError
+from etl_sync.validators import Validator, get_validator
+
+
+def compile_pattern(pattern):
+    try:
+        return re.compile(pattern)
+    except TypeError:
+        return None
 
 
 class Transformer(object):
     """Base transformer. Django forms can be used instead.
     This class contains only the bare minimum of methods
-    and is able to process a list of forms."""
+    and is able to process a list of forms.
+
+    Instantiated with a dictionary, is_valid transforms that record.
+    Instantiated without, transform_record and transform_batch can
+    transform any number of records with the same instance."""
     forms = []
+    # replace the form classes in forms by compiled Validators
+    compile_forms = False
     error = None
     # dictionary of mappings applied in remap
     mappings = {}
@@ -16,14 +30,34 @@ class Transformer(object):
     blacklist = {}
     defaults = {}
 
-    def __init__(self, dic, defaults={}):
+    def __init__(self, dic=None, defaults={}):
         self.dic = dic
         if defaults:
             self.defaults = defaults
+        # (blacklist, [(key, [(pattern, compiled pattern)])])
+        self._compiled_blacklist = None
+        # (forms, list of forms and Validators)
+        self._compiled_forms = None
+
+    def get_forms(self):
+        """
+        Returns forms with compile_forms applied. Forms are compiled
+        again if self.forms was replaced.
+        """
+        if not self.compile_forms:
+            return self.forms
+        if (self._compiled_forms is None or
+                self._compiled_forms[0] is not self.forms):
+            self._compiled_forms = (
+                self.forms, [get_validator(form) for form in self.forms])
+        return self._compiled_forms[1]
 
     def _process_forms(self, dic):
-        """Processes a list of forms."""
-        for form in self.forms:
+        """Processes a list of forms and Validators."""
+        for form in self.get_forms():
+            if isinstance(form, Validator):
+                dic.update(form.validate(dic))
+                continue
             frm = form(dic)
             if frm.is_valid():
                 dic.update(frm.cleaned_data)
@@ -34,21 +68,32 @@ class Transformer(object):
     def _apply_defaults(self, dictionary):
         """Adds defaults to the dictionary."""
         if type(self.defaults) is dict:
-            dic = self.defaults.copy()
-        else:
-            dic = {}
-        dictionary.update(dic)
+            dictionary.update(self.defaults)
         return dictionary
 
+    def get_blacklist(self):
+        """
+        Returns the blacklist with compiled patterns. Patterns are compiled
+        again if self.blacklist was replaced.
+        """
+        if (self._compiled_blacklist is None or
+                self._compiled_blacklist[0] is not self.blacklist):
+            self._compiled_blacklist = (self.blacklist, [
+                (key, [(v, compile_pattern(v)) for v in value])
+                for key, value in iteritems(self.blacklist)])
+        return self._compiled_blacklist[1]
+
     def check_blacklist(self, dic):
         """
         Raise ValidationError if value or pattern is
         black-listed.
         """
-        for key, value in iteritems(self.blacklist):
-            for v in value:
+        for key, patterns in self.get_blacklist():
+            for v, pattern in patterns:
                 try:
-                    if re.match(v, dic[key]):
+                    if pattern is None:
+                        raise TypeError(v)
+                    if pattern.match(dic[key]):
                         raise ValidationError(
                             'Value {} not allowed in field {}'.format(
                                 v, key))
@@ -86,6 +131,32 @@ class Transformer(object):
         """For compatibility with Django's form class."""
         return self.full_transform(dic)
 
+    def transform_record(self, dic):
+        """
+        Transforms a record, raises ValidationError if it is invalid.
+
+        Returns:
+            dict: Transformed record.
+        """
+        try:
+            return self.clean(dic)
+        except UnicodeEncodeError as e:
+            raise ValidationError(e)
+
+    def transform_batch(self, dics):
+        """
+        Returns:
+            list: One (dic, error) tuple per record, dic is the
+            transformed record or None if the record is invalid.
+        """
+        ret = []
+        for dic in dics:
+            try:
+                ret.append((self.transform_record(dic), None))
+            except ValidationError as e:
+                ret.append((None, e))
+        return ret
+
     def is_valid(self):
         try:
             self.cleaned_data = self.clean(self.dic)
@@ -0,0 +1,220 @@
+from __future__ import print_function
+from six import string_types, get_unbound_function
+
+import math
+import threading
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.widgets import Widget
+from etl_sync.generators import get_fields
+
+
+# methods of forms.BaseForm a form class must not override to be compiled
+FORM_METHODS = (
+    '__init__', 'full_clean', '_clean_fields', '_clean_form',
+    '_post_clean', 'clean')
+
+
+def is_compilable(form_class):
+    """
+    Returns True if form_class validates with its fields only, i.e. it
+    does not customize initialization or cleaning.
+    """
+    if not issubclass(form_class, forms.BaseForm) or issubclass(
+            form_class, forms.BaseModelForm):
+        return False
+    for name in FORM_METHODS:
+        if get_unbound_function(getattr(form_class, name)) is not \
+                get_unbound_function(getattr(forms.BaseForm, name)):
+            return False
+    for name, field in form_class.base_fields.items():
+        if hasattr(form_class, 'clean_{0}'.format(name)) or field.disabled \
+                or isinstance(field, forms.FileField):
+            return False
+    return True
+
+
+def compile_getter(name, field):
+    """
+    Returns a function reading the value of field from a record like the
+    field's widget reads it from form data.
+    """
+    widget = field.widget
+    if get_unbound_function(type(widget).value_from_datadict) is \
+            get_unbound_function(Widget.value_from_datadict):
+        return lambda dic: dic.get(name)
+    return lambda dic: widget.value_from_datadict(dic, {}, name)
+
+
+def compile_char(field):
+    strip = field.strip
+    clean = field.clean
+    run_validators = field.run_validators
+
+    def clean_char(value):
+        if isinstance(value, string_types):
+            ret = value.strip() if strip else value
+            if ret:
+                run_validators(ret)
+                return ret
+        return clean(value)
+    return clean_char
+
+
+def compile_integer(field):
+    clean = field.clean
+    run_validators = field.run_validators
+    validators = field.validators
+
+    def clean_integer(value):
+        if isinstance(value, string_types):
+            try:
+                ret = int(value)
+            except ValueError:
+                return clean(value)
+            if validators:
+                run_validators(ret)
+            return ret
+        return clean(value)
+    return clean_integer
+
+
+def compile_float(field):
+    clean = field.clean
+    run_validators = field.run_validators
+    validators = field.validators
+
+    def clean_float(value):
+        if isinstance(value, string_types):
+            try:
+                ret = float(value)
+            except ValueError:
+                return clean(value)
+            if math.isinf(ret) or math.isnan(ret):
+                return clean(value)
+            if validators:
+                run_validators(ret)
+            return ret
+        return clean(value)
+    return clean_float
+
+
+# form field class => function compiling a clean function, other fields
+# are cleaned with field.clean
+COMPILERS = {
+    forms.CharField: compile_char,
+    forms.IntegerField: compile_integer,
+    forms.FloatField: compile_float}
+
+
+def compile_field(field):
+    """
+    Returns a function with the contract of field.clean. Fast paths
+    cover string input for plain character and number fields, any other
+    input is handed to field.clean.
+    """
+    compiler = COMPILERS.get(type(field))
+    if compiler is None or getattr(field, 'localize', False):
+        return field.clean
+    return compiler(field)
+
+
+class Validator(object):
+    """
+    Validates records like a Django form with the same fields: validate
+    returns cleaned_data or raises a ValidationError with the errors by
+    field. The form fields are compiled once, records are validated
+    without instantiating forms.
+
+    Args:
+        fields (list): List of (name, form field) tuples.
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.rules = [
+            (name, compile_getter(name, field), compile_field(field))
+            for name, field in self.fields]
+
+    def __repr__(self):
+        return '<Validator: {0}>'.format(
+            ', '.join(name for name, field in self.fields))
+
+    @classmethod
+    def from_form(cls, form_class):
+        """
+        Compiles the fields of a form class. Raises ValueError for forms
+        with custom initialization or cleaning methods.
+        """
+        if not is_compilable(form_class):
+            raise ValueError(
+                'Form {0} cannot be compiled'.format(form_class.__name__))
+        return cls(form_class.base_fields.items())
+
+    @classmethod
+    def from_model(cls, model_class, fields=None, exclude=None):
+        """
+        Compiles the form fields of model fields like a ModelForm, i.e.
+        from types, max_length, null, blank and choices. Relations and
+        fields that are not editable are left out.
+
+        Args:
+            model_class: Django model.
+            fields (list): Names of the fields to validate, all by default.
+            exclude (list): Names of fields not to validate.
+        """
+        ret = []
+        for field in get_fields(model_class):
+            if (not getattr(field, 'concrete', False) or field.is_relation or
+                    not field.editable or field.auto_created):
+                continue
+            if fields is not None and field.name not in fields:
+                continue
+            if exclude and field.name in exclude:
+                continue
+            formfield = field.formfield()
+            if formfield is not None:
+                ret.append((field.name, formfield))
+        return cls(ret)
+
+    def validate(self, dic):
+        """
+        Returns:
+            dict: Cleaned values of all fields.
+        """
+        ret = {}
+        errors = None
+        for name, get, clean in self.rules:
+            try:
+                ret[name] = clean(get(dic))
+            except ValidationError as e:
+                if errors is None:
+                    errors = {}
+                errors[name] = e.error_list
+        if errors:
+            raise ValidationError(errors)
+        return ret
+
+
+# form class => Validator or None if the form cannot be compiled
+compiled_forms = {}
+compiled_forms_lock = threading.Lock()
+
+
+def get_validator(form):
+    """
+    Returns a Validator for a form class or form itself if it is a
+    Validator or cannot be compiled.
+    """
+    if isinstance(form, Validator):
+        return form
+    try:
+        validator = compiled_forms[form]
+    except KeyError:
+        with compiled_forms_lock:
+            try:
+                validator = Validator.from_form(form)
+            except (ValueError, TypeError):
+                validator = None
+            compiled_forms[form] = validator
+    return form if validator is None else validator
@@ -9,7 +9,7 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 setup(
     name='django-etl-sync',
     version='0.3.3',
-    packages=['etl_sync'],
+    packages=['etl_sync', 'etl_sync.migrations'],
     include_package_data=True,
     license='BSD License',
     description='Django ETL, derives rules from models, creates relations.',
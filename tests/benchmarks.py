@@ -0,0 +1,136 @@
+"""
+Benchmarks, not run with the test suite. Run from the repository root:
+
+    python -m tests.benchmarks
+"""
+from __future__ import print_function
+
+import os
+import timeit
+import django
+
+
+def get_wide_record(index):
+    dic = {
+        'record': str(index), 'name': 'name', 'description': 'text',
+        'category': 'cat', 'station': 'station', 'flag': '1',
+        'active': 'false', 'count_a': '1', 'count_b': '2', 'count_c': '',
+        'count_d': '12345678', 'value_a': '1.5', 'value_b': '2.5',
+        'value_c': 'nan', 'value_d': '', 'value_e': '3', 'value_f': '-1e3',
+        'note_a': 'a', 'note_b': 'b', 'note_c': 'c', 'quality': '3',
+        'unused': 'x'}
+    return dic
+
+
+def legacy_prepare(generator, dic):
+    """InstanceGenerator.prepare as of 0.3.3, walking all model fields."""
+    from etl_sync.generators import get_fields, get_internal_type
+    ret = {}
+    for field in get_fields(generator.model_class):
+        if field.name not in dic:
+            continue
+        fieldtype = get_internal_type(field)
+        prepare_function = getattr(
+            generator, generator.preparations[fieldtype],
+            generator.prepare_field)
+        res = prepare_function(field, dic.pop(field.name))
+        if res is not None:
+            ret[field.name] = res
+    return ret
+
+
+def rate(function, rows):
+    records = [get_wide_record(index) for index in range(0, rows)]
+    seconds = timeit.timeit(
+        lambda: [function(dic.copy()) for dic in records], number=1)
+    return rows / seconds
+
+
+def benchmark_prepare(rows=20000):
+    from etl_sync.generators import InstanceGenerator
+    from tests.models import WideModel
+    generator = InstanceGenerator(WideModel)
+    print('InstanceGenerator.prepare, {0} fields, {1} rows'.format(
+        len(generator.model_fields), rows))
+    print('  per-row field walk: {0:>10.0f} rows/sec'.format(
+        rate(lambda dic: legacy_prepare(generator, dic), rows)))
+    print('  compiled plan:      {0:>10.0f} rows/sec'.format(
+        rate(generator.prepare, rows)))
+
+
+def benchmark_columnar(rows=20000, chunksize=500):
+    from etl_sync.generators import InstanceGenerator
+    from tests.models import WideModel
+    generator = InstanceGenerator(WideModel)
+    records = [get_wide_record(index) for index in range(0, rows)]
+    chunks = [records[index:index + chunksize]
+              for index in range(0, rows, chunksize)]
+    print('InstanceGenerator.prepare_batch, chunks of {0}, {1} rows'.format(
+        chunksize, rows))
+    seconds = timeit.timeit(
+        lambda: [generator.prepare(dic.copy()) for dic in records], number=1)
+    print('  record by record:   {0:>10.0f} rows/sec'.format(rows / seconds))
+    seconds = timeit.timeit(
+        lambda: [generator.prepare_batch(chunk) for chunk in chunks],
+        number=1)
+    print('  columns:            {0:>10.0f} rows/sec'.format(rows / seconds))
+
+
+def benchmark_dates(rows=20000):
+    from django.forms import DateTimeField
+    from etl_sync.generators import InstanceGenerator
+    from tests.models import WideModel
+    generator = InstanceGenerator(WideModel)
+    field = WideModel._meta.get_field('observed')
+    print('InstanceGenerator.prepare_date, {0} rows'.format(rows))
+    for value in ['2014-10-14 10:30:00', '10/14/2014 10:30']:
+        seconds = timeit.timeit(lambda: [
+            DateTimeField(required=False).clean(value)
+            for _ in range(0, rows)], number=1)
+        print('  {0:<20} form field: {1:>10.0f} rows/sec'.format(
+            value, rows / seconds))
+        generator.date_formats = {}
+        seconds = timeit.timeit(lambda: [
+            generator.prepare_date(field, value)
+            for _ in range(0, rows)], number=1)
+        print('  {0:<20} detected:   {1:>10.0f} rows/sec'.format(
+            value, rows / seconds))
+
+
+def benchmark_validator(rows=20000):
+    from django import forms
+    from etl_sync.validators import Validator
+
+    class WideForm(forms.Form):
+        record = forms.CharField(max_length=10)
+        name = forms.CharField(max_length=20, required=False)
+        category = forms.CharField(max_length=20, required=False)
+        flag = forms.BooleanField(required=False)
+        count_a = forms.IntegerField(required=False)
+        count_b = forms.IntegerField(required=False)
+        count_d = forms.IntegerField(required=False)
+        value_a = forms.FloatField(required=False)
+        value_b = forms.FloatField(required=False)
+        value_f = forms.FloatField(required=False)
+
+    def validate_form(dic):
+        form = WideForm(dic)
+        form.is_valid()
+        return form.cleaned_data
+
+    validator = Validator.from_form(WideForm)
+    print('Transformer forms, {0} fields, {1} rows'.format(
+        len(WideForm.base_fields), rows))
+    print('  Django form:        {0:>10.0f} rows/sec'.format(
+        rate(validate_form, rows)))
+    print('  compiled Validator: {0:>10.0f} rows/sec'.format(
+        rate(validator.validate, rows)))
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    django.setup()
+    benchmark_prepare()
+    benchmark_validator()
+    benchmark_columnar()
+    benchmark_dates()
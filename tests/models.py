@@ -151,3 +151,31 @@ class TwoRelatedAsUnique(models.Model):
 class RelatedRelated(models.Model):
     key = models.ForeignKey(TwoRelatedAsUnique, on_delete=models.CASCADE)
     value = models.CharField(max_length=5)
+
+
+class WideModel(models.Model):
+    """
+    Model with many fields for benchmarks.
+    """
+    record = models.CharField(max_length=10, unique=True)
+    name = models.CharField(max_length=20, blank=True)
+    description = models.TextField(blank=True)
+    category = models.CharField(max_length=20, blank=True)
+    station = models.CharField(max_length=20, blank=True)
+    flag = models.BooleanField(default=False)
+    active = models.BooleanField(default=False)
+    count_a = models.IntegerField(null=True)
+    count_b = models.IntegerField(null=True)
+    count_c = models.IntegerField(null=True)
+    count_d = models.BigIntegerField(null=True)
+    value_a = models.FloatField(null=True)
+    value_b = models.FloatField(null=True)
+    value_c = models.FloatField(null=True)
+    value_d = models.FloatField(null=True)
+    value_e = models.FloatField(null=True)
+    value_f = models.FloatField(null=True)
+    note_a = models.CharField(max_length=20, blank=True)
+    note_b = models.CharField(max_length=20, blank=True)
+    note_c = models.CharField(max_length=20, blank=True)
+    observed = models.DateTimeField(null=True)
+    quality = models.IntegerField(null=True)
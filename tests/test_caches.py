@@ -0,0 +1,50 @@
+from unittest import TestCase
+from etl_sync.caches import LRUCache, HashIndex
+
+
+class TestLRUCache(TestCase):
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.report(), '1 hits, 1 misses, 2 entries')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestHashIndex(TestCase):
+
+    def test_hash_index(self):
+        index = HashIndex()
+        index.data = {'a': 1, 'b': 2}
+        self.assertEqual(index.get('a'), 1)
+        self.assertIsNone(index.get('c'))
+        index.add('c', 1, changed=True)
+        self.assertEqual(index.get('c'), 1)
+        self.assertIsNone(index.get('a'))
+        self.assertGreater(index.memory(), 0)
+        self.assertIn('3 hashes (partial)', index.report())
+
+    def test_limit(self):
+        index = HashIndex(limit=1)
+        index.complete = True
+        index.add('a', 1)
+        self.assertTrue(index.complete)
+        index.add('b', 2)
+        self.assertIsNone(index.get('b'))
+        self.assertFalse(index.complete)
+
+    def test_discard(self):
+        index = HashIndex()
+        index.data = {'a': 1}
+        index.add('b', 1, changed=True)
+        index.discard('b', 1)
+        self.assertEqual(index.get('a'), 1)
+        self.assertIsNone(index.get('b'))
@@ -0,0 +1,37 @@
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from django.test import TestCase
+from etl_sync.checkpoints import (
+    Checkpoint, FileCheckpointStore, DatabaseCheckpointStore)
+
+
+class TestCheckpointStores(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_store(self, store):
+        self.assertIsNone(store.get('data.txt'))
+        store.save(Checkpoint('data.txt', 10, 200, {'created': 10}))
+        store.save(Checkpoint('data.txt', 20, 400, {'created': 20}))
+        store.save(Checkpoint('other.txt', 5, None, {}))
+        self.assertEqual(
+            store.get('data.txt'),
+            Checkpoint('data.txt', 20, 400, {'created': 20}))
+        self.assertEqual(store.get('other.txt').offset, None)
+        store.delete('data.txt')
+        self.assertIsNone(store.get('data.txt'))
+        self.assertIsNotNone(store.get('other.txt'))
+
+    def test_file_store(self):
+        self.check_store(FileCheckpointStore(
+            os.path.join(self.tmpdir, 'checkpoints.json')))
+
+    def test_database_store(self):
+        self.check_store(DatabaseCheckpointStore())
@@ -0,0 +1,51 @@
+from __future__ import absolute_import
+
+from unittest import TestCase
+from etl_sync import columnar
+from etl_sync.generators import InstanceGenerator
+from tests.models import WideModel
+
+
+class TestColumnar(TestCase):
+
+    def setUp(self):
+        self.generator = InstanceGenerator(WideModel)
+        self.field = WideModel._meta.get_field('count_a')
+
+    def assertSameAsRows(self, function, method, values):
+        column, invalid = function(values)
+        self.assertEqual(column, [method(self.field, v) for v in values])
+        return invalid
+
+    def test_pivot(self):
+        self.assertEqual(
+            columnar.pivot([{'a': 1, 'b': 2}, {'a': 3, 'b': 4}], ['b', 'a']),
+            [[2, 4], [1, 3]])
+
+    def test_integers(self):
+        self.assertEqual(self.assertSameAsRows(
+            columnar.coerce_integers, self.generator.prepare_integer,
+            ['1', ' 2 ', 3, 4.5]), [False] * 4)
+        self.assertEqual(self.assertSameAsRows(
+            columnar.coerce_integers, self.generator.prepare_integer,
+            ['1', '', None, '1.0', 'x']), [False, False, False, True, True])
+
+    def test_floats(self):
+        self.assertEqual(self.assertSameAsRows(
+            columnar.coerce_floats, self.generator.prepare_float,
+            ['1.5', '-1e3', 2, 'inf']), [False] * 4)
+        self.assertEqual(self.assertSameAsRows(
+            columnar.coerce_floats, self.generator.prepare_float,
+            ['1.5', '', '1,5']), [False, False, True])
+
+    def test_booleans(self):
+        self.assertSameAsRows(
+            columnar.coerce_booleans, self.generator.prepare_boolean,
+            ['1', 't', 'true', 'True', 1, True, '0', 'false', '', None, 0])
+
+    def test_texts(self):
+        field = WideModel._meta.get_field('name')
+        values = ['a' * 30, 1, u'\xf3']
+        self.assertEqual(
+            columnar.coerce_texts(values, max_length=field.max_length)[0],
+            [self.generator.prepare_text(field, v) for v in values])
@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+
+import os
+from django.test import TestCase
+from etl_sync.explain import get_indexes, is_indexed
+from etl_sync.generators import InstanceGenerator, HashMixin, BulkMixin
+from etl_sync.loaders import Loader
+from .models import (
+    TestModel, TestModelWoFk, HashTestModel, WellDefinedModel, Polish)
+from .utils import captured_output
+
+
+class TestIndexes(TestCase):
+
+    def test_get_indexes(self):
+        indexes = get_indexes(TestModel)
+        self.assertIn(('id',), indexes)
+        self.assertIn(('record',), indexes)
+        self.assertIn(('numero',), indexes)
+        self.assertIn(
+            ('something', 'somenumber'), get_indexes(WellDefinedModel))
+
+    def test_is_indexed(self):
+        self.assertTrue(is_indexed(TestModel, ['record']))
+        self.assertTrue(is_indexed(WellDefinedModel, ['something']))
+        self.assertFalse(is_indexed(WellDefinedModel, ['somenumber']))
+        self.assertFalse(is_indexed(TestModelWoFk, ['record']))
+        self.assertFalse(is_indexed(HashTestModel, ['md5']))
+
+
+class TestExplain(TestCase):
+
+    class HashGenerator(HashMixin, InstanceGenerator):
+        pass
+
+    class BulkGenerator(BulkMixin, InstanceGenerator):
+        pass
+
+    def test_generator(self):
+        with captured_output() as (out, err):
+            plan = InstanceGenerator(
+                TestModel, persistence='record').explain()
+        self.assertEqual(out.getvalue(), '')
+        stages = [step[0] for step in plan.steps]
+        self.assertEqual(stages[0:2], ['lookup', 'write'])
+        self.assertEqual(stages.count('fk'), 3)
+        self.assertEqual(stages.count('m2m'), 1)
+        self.assertEqual(plan.get_queries(), (1 + 2 + 3 * 3 + 2, 3))
+        self.assertEqual(plan.warnings, [])
+        self.assertNumQueries(0, InstanceGenerator(TestModel).explain)
+
+    def test_chunked(self):
+        generator = self.BulkGenerator(
+            Polish, persistence='record', options={
+                'chunksize': 100, 'bulksize': 50})
+        plan = generator.explain(chunked=True)
+        self.assertAlmostEqual(plan.get_queries()[0], 0.01 + 0.04)
+
+    def test_warnings(self):
+        plan = InstanceGenerator(
+            TestModelWoFk, persistence='record').explain()
+        self.assertEqual(len(plan.warnings), 1)
+        self.assertIn('no supporting index', plan.warnings[0])
+        plan = InstanceGenerator(TestModelWoFk).explain()
+        self.assertIn('No persistence criterion', plan.warnings[0])
+        plan = self.HashGenerator(HashTestModel).explain()
+        self.assertIn('md5', plan.warnings[0])
+        self.assertEqual(plan.steps[0][1], 2)
+
+    def test_loader(self):
+        filename = os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), 'data.txt')
+        loader = Loader(filename, TestModel, options={
+            'chunksize': 10, 'transactionsize': 100})
+        with captured_output() as (out, err):
+            plan = loader.explain()
+        self.assertIn('Load plan for tests.TestModel', out.getvalue())
+        self.assertIn(('Chunk size', 10), plan.settings)
+        self.assertIn('savepoint', [step[0] for step in plan.steps])
+        self.assertEqual(TestModel.objects.count(), 0)
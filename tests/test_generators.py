@@ -1,16 +1,21 @@
 from __future__ import absolute_import
+from six import text_type
+
+from datetime import datetime
 
 from django.forms.models import model_to_dict
 from django.utils import version
-from django.db import IntegrityError
+from django.db import IntegrityError, connections
 from django.db.models import Model
 from django.contrib.gis.db.models import CharField
 from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from tests import models
 from etl_sync.generators import (
     get_unique_fields, get_unambiguous_fields, get_fields,
-    BaseGenerator, InstanceGenerator, HashMixin)
+    BaseGenerator, InstanceGenerator, HashMixin, BulkMixin, UpsertMixin,
+    registry)
 
 
 VERSION = version.get_version()[2]
@@ -201,6 +206,23 @@ class TestRelations(TestCase):
         res = models.Polish.objects.all()
         self.assertEqual(res.count(), 3)
 
+    def test_record_context(self):
+        generator = InstanceGenerator(models.TestModel)
+        first = generator.get_instance({
+            'record': '1', 'numero': 'uno', 'related': [
+                {'record': '10', 'ilosc': 'dziesiec'}]})
+        second = generator.get_instance({'record': '2', 'numero': 'uno'})
+        self.assertEqual(first.related.count(), 1)
+        self.assertEqual(second.related.count(), 0)
+        self.assertIsNone(generator.context)
+        results = generator.get_instances([
+            {'record': '3', 'numero': 'uno', 'related': [
+                {'record': '10', 'ilosc': 'dziesiec'}]},
+            {'record': '4', 'numero': 'uno'}])
+        self.assertEqual(results[0][0].related.count(), 1)
+        self.assertEqual(results[1][0].related.count(), 0)
+        self.assertIsNone(generator.context)
+
     def test_onetoone(self):
         ins = models.Nombre.objects.create(name='un', id=1)
         dos = models.Nombre.objects.create(name='dos', id=2)
@@ -358,6 +380,38 @@ class TestPreparations(TestCase):
             'datetimenotnull': '2014-10-14', 'datetimenull': ''})
         self.assertEqual(generator.res, 'created')
 
+    def test_prepare_date_formats(self):
+        field = models.DateTimeModel._meta.get_field('datetimenotnull')
+        generator = InstanceGenerator(models.DateTimeModel)
+        self.assertEqual(
+            generator.prepare_date(field, ' 2014-10-14 10:30 '),
+            datetime(2014, 10, 14, 10, 30))
+        self.assertEqual(generator.date_formats, {'datetimenotnull': 'iso'})
+        generator = InstanceGenerator(models.DateTimeModel)
+        self.assertEqual(
+            generator.prepare_date(field, '10/14/2014 10:30'),
+            datetime(2014, 10, 14, 10, 30))
+        self.assertEqual(
+            generator.date_formats, {'datetimenotnull': '%m/%d/%Y %H:%M'})
+        # values not matching the format are validated by the form field
+        self.assertEqual(
+            generator.prepare_date(field, '2014-10-14'),
+            datetime(2014, 10, 14))
+        self.assertEqual(
+            generator.prepare_date(field, datetime(2014, 10, 14)),
+            datetime(2014, 10, 14))
+        for value in ['', None, 'tomorrow']:
+            with self.assertRaises(ValidationError):
+                generator.prepare_date(field, value)
+        field = models.DateTimeModel._meta.get_field('datetimenull')
+        self.assertIsNone(generator.prepare_date(field, ''))
+        generator = InstanceGenerator(
+            models.DateTimeModel,
+            options={'date_formats': {'datetimenull': '%d.%m.%Y'}})
+        self.assertEqual(
+            generator.prepare_date(field, '14.10.2014'),
+            datetime(2014, 10, 14))
+
     def test_prepare_string(self):
         generator = InstanceGenerator(models.TestModel)
         res = generator.prepare_text(CharField(max_length=4), 'test')
@@ -371,6 +425,17 @@ class TestPreparations(TestCase):
         res = generator.prepare({'something': 'thing', 'somenumber': 0})
         self.assertEqual(res['somenumber'], 0)
 
+    def test_prepare_plan(self):
+        generator = InstanceGenerator(models.WideModel)
+        plan = generator.get_plan(['count_a', 'record', 'unknown'])
+        self.assertEqual([item[0] for item in plan], ['record', 'count_a'])
+        self.assertEqual(plan[1][2], generator.prepare_integer)
+        dic = {'record': 1, 'count_a': '2', 'value_a': '1.5', 'other': 1}
+        res = generator.prepare(dic)
+        self.assertEqual(res, {'record': '1', 'count_a': 2, 'value_a': 1.5})
+        self.assertEqual(dic, {'other': 1})
+        self.assertEqual(len(generator.plans), 1)
+
 
 class TestResults(TestCase):
 
@@ -387,6 +452,34 @@ class TestResults(TestCase):
         self.assertEqual(generator.res, 'updated')
 
 
+class TestUnchanged(TestCase):
+
+    def test_detect_unchanged(self):
+        generator = InstanceGenerator(
+            models.TestModel, options={'detect_unchanged': True})
+        dic = {'record': '1', 'name': 'one', 'numero': 'uno',
+               'elnumero': 'el uno', 'date': '2014-01-01'}
+        generator.get_instance(dic)
+        self.assertEqual(generator.res, 'created')
+        generator.get_instance(dic)
+        self.assertEqual(generator.res, 'unchanged')
+        dic['name'] = 'eins'
+        generator.get_instance(dic)
+        self.assertEqual(generator.res, 'updated')
+        self.assertEqual(models.TestModel.objects.get(record='1').name, 'eins')
+        dic['numero'] = 'due'
+        generator.get_instance(dic)
+        self.assertEqual(generator.res, 'updated')
+
+    def test_unchanged_in_batch(self):
+        generator = InstanceGenerator(
+            models.Polish, options={'detect_unchanged': True})
+        generator.get_instance({'record': '1', 'ilosc': 'jeden'})
+        with self.assertNumQueries(1):
+            res = generator.get_instances([{'record': 1, 'ilosc': 'jeden'}])
+        self.assertEqual(res[0][1], 'unchanged')
+
+
 class TestHashing(TestCase):
 
     class HashGenerator(HashMixin, InstanceGenerator):
@@ -413,6 +506,56 @@ class TestHashing(TestCase):
         self.assertEqual(generator.res, 'created')
 
 
+class TestHashIndex(TestCase):
+
+    def test_hash_index(self):
+        generator = TestHashing.HashGenerator(models.HashTestModel)
+        instance = generator.get_instance({'record': '1', 'zahl': 'alfred'})
+        generator = TestHashing.HashGenerator(
+            models.HashTestModel, options={'hash_index': True})
+        generator.get_instance({'record': '2', 'zahl': 'britta'})
+        self.assertEqual(generator.res, 'created')
+        self.assertEqual(len(generator.hash_index), 2)
+        with self.assertNumQueries(0):
+            res = generator.get_instance({'record': '1', 'zahl': 'alfred'})
+            self.assertEqual(generator.res, 'exists')
+            self.assertEqual(res.pk, instance.pk)
+            generator.get_instance({'record': '2', 'zahl': 'britta'})
+            self.assertEqual(generator.res, 'exists')
+        generator.get_instance({'record': '1', 'zahl': 'carl'})
+        self.assertEqual(generator.res, 'updated')
+        generator.get_instance({'record': '1', 'zahl': 'alfred'})
+        self.assertEqual(generator.res, 'updated')
+        self.assertIn('Hash index', generator.get_stats())
+
+    def test_partial_hash_index(self):
+        generator = TestHashing.HashGenerator(models.HashTestModel)
+        generator.get_instance({'record': '1', 'zahl': 'alfred'})
+        generator.get_instance({'record': '2', 'zahl': 'britta'})
+        generator = TestHashing.HashGenerator(
+            models.HashTestModel,
+            options={'hash_index': True, 'hash_index_limit': 1})
+        res = generator.get_instances([
+            {'record': '1', 'zahl': 'alfred'},
+            {'record': '2', 'zahl': 'britta'}])
+        self.assertFalse(generator.hash_index.complete)
+        self.assertEqual([item[1] for item in res], ['exists', 'exists'])
+
+    def test_hash_index_limit(self):
+        generator = TestHashing.HashGenerator(
+            models.HashTestModel,
+            options={'hash_index': True, 'hash_index_limit': 1})
+        generator.get_instance({'record': '1', 'zahl': 'alfred'})
+        self.assertTrue(generator.hash_index.complete)
+        results = []
+        for _ in range(0, 3):
+            generator.get_instance({'record': '2', 'zahl': 'britta'})
+            results.append(generator.res)
+        self.assertEqual(results, ['created', 'exists', 'exists'])
+        self.assertFalse(generator.hash_index.complete)
+        self.assertEqual(models.HashTestModel.objects.count(), 2)
+
+
 class TestSelectRelatedByRelated(TestCase):
     """
     This test was created because of a bug that a record
@@ -454,3 +597,392 @@ class TestSelectRelatedByRelated(TestCase):
         self.assertEqual(item.key.numero.name, 'hello')
         self.assertEqual(item.key.another.last_name, 'Mueller')
         self.assertEqual(item.value, 'test')
+
+
+class TestGetInstances(TestCase):
+
+    def test_get_instances(self):
+        generator = InstanceGenerator(models.Polish)
+        generator.get_instance({'record': '1', 'ilosc': 'jeden'})
+        res = generator.get_instances([
+            {'record': '1', 'ilosc': 'jedynka'},
+            {'record': '2', 'ilosc': 'dwa'},
+            {'record': '2', 'ilosc': 'dwojka'}])
+        self.assertEqual(
+            [item[1] for item in res], ['updated', 'created', 'updated'])
+        self.assertEqual(res[1][0].pk, res[2][0].pk)
+        self.assertEqual(models.Polish.objects.count(), 2)
+        self.assertEqual(
+            models.Polish.objects.get(record='2').ilosc, 'dwojka')
+
+    def test_single_lookup_query(self):
+        generator = InstanceGenerator(
+            models.Polish, options={'update': False})
+        for index in range(0, 10):
+            generator.get_instance(
+                {'record': text_type(index), 'ilosc': 'x'})
+        with self.assertNumQueries(1):
+            res = generator.get_instances([
+                {'record': text_type(index), 'ilosc': 'x'}
+                for index in range(0, 10)])
+        self.assertTrue(all(item[1] == 'exists' for item in res))
+
+    def test_unique_together(self):
+        generator = InstanceGenerator(models.WellDefinedModel)
+        generator.get_instance({'something': 'a', 'somenumber': 1})
+        res = generator.get_instances([
+            {'something': 'a', 'somenumber': 1},
+            {'something': 'a', 'somenumber': 2}])
+        self.assertEqual([item[1] for item in res], ['updated', 'created'])
+
+    def test_lookup_batches(self):
+        models.WellDefinedModel.objects.bulk_create([
+            models.WellDefinedModel(something='a', somenumber=index)
+            for index in range(0, 600)])
+        generator = InstanceGenerator(models.WellDefinedModel)
+        fields = [
+            models.WellDefinedModel._meta.get_field(name)
+            for name in generator.persistence]
+        keys = [('a', index) for index in range(0, 600)]
+        connection = connections[models.WellDefinedModel.objects.db]
+        size = connection.ops.bulk_batch_size(fields, keys)
+        with self.assertNumQueries(-(-600 // size)):
+            found = generator.get_many_from_db(keys, generator.persistence)
+        self.assertEqual(len(found), 600)
+        self.assertEqual(found[('a', 599)][0].somenumber, 599)
+
+    def test_rejection(self):
+        generator = InstanceGenerator(models.TestModel)
+        res = generator.get_instances([
+            {'record': '1', 'numero': 'uno'},
+            {'record': '2', 'date': '3333', 'numero': 'uno'},
+            {'record': '3', 'numero': 'due'}])
+        self.assertEqual(res[0][1], 'created')
+        self.assertIsNone(res[1][0])
+        self.assertIsInstance(res[1][2], ValidationError)
+        self.assertEqual(res[2][1], 'created')
+
+    def test_hashing(self):
+        generator = TestHashing.HashGenerator(models.HashTestModel)
+        generator.get_instance({'record': '1', 'zahl': 'alfred'})
+        res = generator.get_instances([
+            {'record': '1', 'zahl': 'alfred'},
+            {'record': '1', 'zahl': 'britta'},
+            {'record': '2', 'zahl': 'carl'}])
+        self.assertEqual(
+            [item[1] for item in res], ['exists', 'updated', 'created'])
+
+    def test_columnar(self):
+        records = [
+            {'record': '1', 'count_a': '1', 'value_a': '1.5', 'flag': 't',
+             'name': 'a' * 30, 'observed': '2001-01-01'},
+            {'record': '2', 'count_a': 'x', 'value_a': '', 'flag': '0'},
+            {'record': '3', 'count_a': '3', 'value_a': '-1', 'flag': 'true'}]
+        generator = InstanceGenerator(
+            models.WideModel, options={'columnar': True})
+        res = generator.get_instances([dic.copy() for dic in records])
+        self.assertEqual(generator.invalid_cells, {'count_a': 1})
+        self.assertEqual(generator.pop_invalid(), [(None, ['count_a'])])
+        self.assertEqual(generator.invalid, [])
+        self.assertIn('Invalid cells', generator.get_stats())
+        self.assertEqual(
+            generator.prepare_batch(records[1:2]),
+            [({'record': '2', 'count_a': None, 'value_a': None,
+               'flag': False}, ['count_a'])])
+        columns = [
+            model_to_dict(instance, exclude=['id'])
+            for instance, _, _ in res]
+        models.WideModel.objects.all().delete()
+        generator = InstanceGenerator(models.WideModel)
+        res = generator.get_instances([dic.copy() for dic in records])
+        self.assertEqual(columns, [
+            model_to_dict(instance, exclude=['id'])
+            for instance, _, _ in res])
+        self.assertEqual(columns[0]['name'], 'a' * 20)
+        self.assertIsNone(columns[1]['count_a'])
+
+
+class TestBulkMixin(TestCase):
+
+    class BulkGenerator(BulkMixin, InstanceGenerator):
+        pass
+
+    def test_buffered_writes(self):
+        generator = self.BulkGenerator(models.Polish, options={'bulksize': 3})
+        for index in range(0, 2):
+            generator.get_instance(
+                {'record': text_type(index), 'ilosc': 'x'})
+            self.assertEqual(generator.res, 'created')
+        self.assertEqual(models.Polish.objects.count(), 0)
+        generator.get_instance({'record': '2', 'ilosc': 'x'})
+        self.assertEqual(models.Polish.objects.count(), 3)
+        generator.get_instance({'record': '0', 'ilosc': 'y'})
+        self.assertEqual(generator.res, 'updated')
+        generator.get_instance({'record': '3', 'ilosc': 'y'})
+        self.assertEqual(models.Polish.objects.filter(ilosc='y').count(), 0)
+        self.assertTrue(generator.finalize())
+        self.assertEqual(models.Polish.objects.filter(ilosc='y').count(), 2)
+        self.assertEqual(generator.pop_rejected(), [])
+
+    def test_buffered_duplicates(self):
+        generator = self.BulkGenerator(models.Polish)
+        generator.get_instance({'record': '1', 'ilosc': 'x'})
+        generator.get_instance({'record': '1', 'ilosc': 'y'})
+        self.assertEqual(generator.res, 'updated')
+        generator.finalize()
+        self.assertEqual(models.Polish.objects.get(record='1').ilosc, 'y')
+
+    def test_bisection(self):
+        generator = self.BulkGenerator(models.TestModel)
+        for index in range(0, 5):
+            generator.tag = index
+            dic = {'record': text_type(index)}
+            if index != 3:
+                dic['numero'] = 'uno'
+            generator.get_instance(dic)
+        generator.finalize()
+        self.assertEqual(models.TestModel.objects.count(), 4)
+        rejected = generator.pop_rejected()
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(rejected[0][0], 3)
+        self.assertEqual(rejected[0][1], 'created')
+        self.assertIsInstance(rejected[0][2], IntegrityError)
+
+    def test_related(self):
+        generator = self.BulkGenerator(models.TestModel)
+        generator.get_instance({
+            'record': '1', 'numero': 'uno',
+            'related': [{'record': '10', 'ilosc': 'dziesiec'}]})
+        generator.finalize()
+        instance = models.TestModel.objects.get(record='1')
+        self.assertEqual(instance.related.count(), 1)
+
+    def test_related_at_bulksize(self):
+        generator = self.BulkGenerator(models.TestModel, options={
+            'bulksize': 2})
+        dics = [
+            {'record': text_type(index), 'numero': 'uno',
+             'related': [{'record': '10', 'ilosc': 'dziesiec'}]}
+            for index in range(0, 4)]
+        for dic in dics[0:2]:
+            generator.get_instance(dic)
+        self.assertEqual(models.TestModel.objects.count(), 2)
+        res = generator.get_instances(dics[2:4])
+        self.assertEqual([item[2] for item in res], [None, None])
+        generator.finalize()
+        self.assertEqual(generator.pop_rejected(), [])
+        for instance in models.TestModel.objects.all():
+            self.assertEqual(instance.related.count(), 1)
+
+    def test_repeated_updates(self):
+        models.Polish.objects.create(record='1', ilosc='jeden')
+        generator = self.BulkGenerator(models.Polish, options={
+            'bulksize': 10})
+        generator.get_instance({'record': '1', 'ilosc': 'x'})
+        self.assertEqual(len(generator.updated_pks), 1)
+        generator.get_instance({'record': '1', 'ilosc': 'y'})
+        self.assertEqual(models.Polish.objects.get(record='1').ilosc, 'x')
+        generator.finalize()
+        self.assertEqual(generator.updated_pks, set())
+        self.assertEqual(models.Polish.objects.get(record='1').ilosc, 'y')
+
+
+class TestForeignKeyCache(TestCase):
+
+    def test_fk_cache(self):
+        generator = InstanceGenerator(
+            models.SimpleFkModel, options={'fk_cache_size': 10})
+        generator.get_instance({'fk': 'un', 'name': 'one'})
+        with self.assertNumQueries(1):
+            generator.get_instance({'fk': 'un', 'name': 'two'})
+        self.assertEqual(models.Nombre.objects.count(), 1)
+        self.assertEqual(
+            models.SimpleFkModel.objects.filter(fk__name='un').count(), 2)
+        self.assertEqual(generator.fk_cache.hits, 1)
+        self.assertIn('ForeignKey cache', generator.get_stats())
+        generator.rollback()
+        self.assertEqual(len(generator.fk_cache), 0)
+
+    def test_no_fk_cache(self):
+        generator = InstanceGenerator(models.SimpleFkModel)
+        self.assertIsNone(generator.fk_cache)
+        self.assertEqual(generator.get_stats(), {})
+
+
+class TestModelRegistry(TestCase):
+
+    def test_registry(self):
+        info = registry.get(models.TestModel)
+        self.assertIs(registry.get(models.TestModel), info)
+        self.assertIs(InstanceGenerator(models.TestModel).model_info, info)
+        self.assertEqual(info.get_unambiguous_fields(), ['record'])
+        self.assertEqual(info.field_names['nombre'], 'ForeignKey')
+        self.assertEqual(
+            [field.name for field in info.unique_string_fields], ['record'])
+        preparations = dict(
+            (field.name, name) for field, name in
+            info.get_preparations(InstanceGenerator))
+        self.assertEqual(preparations['nombre'], 'prepare_fk')
+        self.assertEqual(preparations['related'], 'prepare_m2m')
+        registry.invalidate(models.TestModel)
+        self.assertIsNot(registry.get(models.TestModel), info)
+
+    def test_ambiguous_model(self):
+        info = registry.get(models.TwoUnique)
+        with self.assertRaises(ValidationError):
+            info.get_unambiguous_fields()
+        with self.assertRaises(ValidationError):
+            InstanceGenerator(models.TwoUnique)
+        InstanceGenerator(models.TwoUnique, persistence=['record'])
+
+
+class TestBulkRelations(TestCase):
+
+    def test_assign_related_bulk(self):
+        generator = InstanceGenerator(models.SomeModel)
+        parents = [
+            models.SomeModel.objects.create(record=text_type(index))
+            for index in range(0, 3)]
+        others = [
+            models.AnotherModel.objects.create(record=text_type(index))
+            for index in range(0, 2)]
+        pairs = [(parent, {'lnames': others}) for parent in parents]
+        with self.assertNumQueries(2):
+            generator.assign_related_bulk(pairs)
+        self.assertEqual(models.IntermediateModel.objects.count(), 6)
+        with self.assertNumQueries(1):
+            generator.assign_related_bulk(pairs)
+        self.assertEqual(models.IntermediateModel.objects.count(), 6)
+
+    def test_get_instances_related(self):
+        generator = InstanceGenerator(models.TestModel)
+        res = generator.get_instances([
+            {'record': text_type(index), 'numero': 'uno', 'related': [
+                {'record': '1', 'ilosc': 'jeden'},
+                {'record': '2', 'ilosc': 'dwa'}]}
+            for index in range(0, 3)])
+        self.assertTrue(all(item[1] == 'created' for item in res))
+        self.assertEqual(models.Polish.objects.count(), 2)
+        for instance, _, _ in res:
+            self.assertEqual(instance.related.count(), 2)
+
+
+class TestUpsertMixin(TestCase):
+
+    class UpsertGenerator(UpsertMixin, InstanceGenerator):
+        pass
+
+    def test_upsert(self):
+        models.Polish.objects.create(record='1', ilosc='jeden')
+        generator = self.UpsertGenerator(models.Polish)
+        if not generator.get_upsert_method():
+            self.skipTest('Backend does not support upserts.')
+        with self.assertNumQueries(0):
+            for index in range(0, 3):
+                generator.get_instance(
+                    {'record': text_type(index), 'ilosc': 'x'})
+                self.assertEqual(generator.res, 'upserted')
+        with self.assertNumQueries(3):
+            # savepoint, insert, release
+            generator.finalize()
+        self.assertEqual(models.Polish.objects.count(), 3)
+        self.assertEqual(models.Polish.objects.filter(ilosc='x').count(), 3)
+        revised = generator.pop_revised()
+        if revised:
+            self.assertEqual(
+                [item[2] for item in revised],
+                ['created', 'updated', 'created'])
+
+    def test_upsert_related(self):
+        generator = self.UpsertGenerator(models.TestModel)
+        if not generator.get_upsert_method():
+            self.skipTest('Backend does not support upserts.')
+        res = generator.get_instances([
+            {'record': '1', 'numero': 'uno', 'related': [
+                {'record': '10', 'ilosc': 'dziesiec'}]},
+            {'record': '1', 'numero': 'due'},
+            {'record': '2', 'numero': 'due'}])
+        self.assertEqual(
+            [item[1] for item in res], ['upserted', 'upserted', 'upserted'])
+        generator.finalize()
+        self.assertEqual(generator.pop_rejected(), [])
+        instance = models.TestModel.objects.get(record='1')
+        self.assertEqual(instance.numero.name, 'due')
+        self.assertEqual(instance.related.count(), 1)
+        self.assertEqual(models.TestModel.objects.count(), 2)
+
+    def test_upsert_rejection(self):
+        generator = self.UpsertGenerator(models.TestModel)
+        if not generator.get_upsert_method():
+            self.skipTest('Backend does not support upserts.')
+        for index in range(0, 4):
+            generator.tag = index
+            dic = {'record': text_type(index)}
+            if index != 2:
+                dic['numero'] = 'uno'
+            generator.get_instance(dic)
+        generator.finalize()
+        rejected = generator.pop_rejected()
+        self.assertEqual([item[:2] for item in rejected], [(2, 'upserted')])
+        self.assertEqual(models.TestModel.objects.count(), 3)
+
+    def test_upsert_duplicates(self):
+        generator = self.UpsertGenerator(models.Polish)
+        if not generator.get_upsert_method():
+            self.skipTest('Backend does not support upserts.')
+        generator.get_instances([
+            {'record': '1', 'ilosc': 'x'},
+            {'record': '2', 'ilosc': 'x'},
+            {'record': '1', 'ilosc': 'y'}])
+        # the first chunk entry was written before the second was buffered
+        self.assertEqual(models.Polish.objects.get(record='1').ilosc, 'x')
+        self.assertEqual(len(generator.upsert_buffer), 1)
+        generator.finalize()
+        self.assertEqual(generator.pop_rejected(), [])
+        self.assertEqual(models.Polish.objects.get(record='1').ilosc, 'y')
+
+    def test_upsert_batches(self):
+        generator = self.UpsertGenerator(
+            models.Polish, options={'bulksize': 2000})
+        if generator.get_upsert_method() != 'sql':
+            self.skipTest('Backend does not support SQL upserts.')
+        connection = connections[models.Polish.objects.db]
+        fields = [
+            field for field in models.Polish._meta.concrete_fields
+            if not field.primary_key]
+        size = connection.ops.bulk_batch_size(fields, [None] * 2000)
+        count = min(size, 2000) + 1
+        for index in range(0, count):
+            generator.get_instance({'record': text_type(index), 'ilosc': 'x'})
+        with CaptureQueriesContext(connection) as queries:
+            generator.finalize()
+        self.assertEqual(len([
+            query for query in queries
+            if query['sql'].startswith('INSERT')]), 2 if size < 2000 else 1)
+        self.assertEqual(models.Polish.objects.count(), count)
+
+    def test_bulk_create_without_update_fields(self):
+        existing = models.HashTestModel.objects.create(record='1')
+        generator = self.UpsertGenerator(models.HashTestModel)
+        # ON CONFLICT DO NOTHING, available on every backend
+        generator.upsert_method = 'bulk_create'
+        generator.get_instances([
+            {'record': '1', 'related': [{'record': '10', 'ilosc': 'x'}]},
+            {'record': '2', 'related': [{'record': '20', 'ilosc': 'y'}]}])
+        generator.finalize()
+        self.assertEqual(generator.pop_rejected(), [])
+        self.assertEqual(models.HashTestModel.objects.count(), 2)
+        self.assertEqual(
+            list(existing.related.values_list('record', flat=True)), ['10'])
+        self.assertEqual(
+            list(models.HashTestModel.objects.get(
+                record='2').related.values_list('record', flat=True)),
+            ['20'])
+
+    def test_no_create(self):
+        generator = self.UpsertGenerator(
+            models.Polish, options={'create': False})
+        generator.get_instance({'record': '1', 'ilosc': 'jeden'})
+        self.assertIsNone(generator.res)
+        generator.finalize()
+        self.assertEqual(models.Polish.objects.count(), 0)
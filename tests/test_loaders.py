@@ -1,15 +1,25 @@
 from __future__ import print_function
 from six import text_type, StringIO
 
+import json
 import os
+import random
 import re
+import time
 import glob
+import shutil
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError
 from django.test import TestCase, TransactionTestCase
 from etl_sync.loaders import (
     get_logfilename, FeedbackCounter)
 from .utils import captured_output
-from .models import TestModel
-from etl_sync.loaders import Loader, Extractor
+from .models import TestModel, TestModelWoFk, Polish, WideModel
+from etl_sync.loaders import Loader, Extractor, ParallelLoader
+from etl_sync.generators import BulkMixin, InstanceGenerator
+from etl_sync.reporters import JSONLinesReporter
+from etl_sync.shards import ShardFile
 
 
 class TestUtils(TestCase):
@@ -44,7 +54,16 @@ class TestFeedbackCounter(TestCase):
         self.assertEqual(counter.counter, 5)
         self.assertEqual(counter.updated, 1)
         self.assertEqual(counter.created, 1)
-
+        counter.use_result('unchanged')
+        self.assertEqual(counter.counter, 6)
+        self.assertEqual(counter.unchanged, 1)
+        counter.revise('unchanged', 'updated')
+        self.assertEqual(counter.unchanged, 0)
+        self.assertEqual(counter.updated, 2)
+        counter.revoke('created')
+        self.assertEqual(counter.counter, 6)
+        self.assertEqual(counter.created, 0)
+        self.assertEqual(counter.rejected, 2)
 
     def test_feedback(self):
         counter = FeedbackCounter()
@@ -57,6 +76,10 @@ class TestFeedbackCounter(TestCase):
         res = out.getvalue().strip()
         self.assertIn('10 created', res)
         self.assertIn('20 records processed', res)
+        counter.stats['cache'] = '1 hits'
+        with captured_output() as (out, err):
+            counter.feedback(filename='test', records=20)
+        self.assertIn('cache: 1 hits', out.getvalue())
 
 
 class TestInit(TestCase):
@@ -101,6 +124,31 @@ class TestLoad(TransactionTestCase):
         loader.load()
         self.assertEqual(TestModel.objects.all().count(), 3)
 
+    def test_timings(self):
+        output = StringIO()
+        loader = Loader(
+            self.filename, model_class=TestModel, options={
+                'timings': True, 'feedbacksize': 2,
+                'reporters': [JSONLinesReporter(output)]})
+        with captured_output() as (out, err):
+            loader.load()
+        self.assertIn('Stages: read', out.getvalue())
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line['total'] for line in lines], [2, 3])
+        totals = lines[-1]['stage_totals']
+        self.assertEqual(list(totals), [
+            'read', 'transform', 'prepare', 'lookup', 'write', 'm2m'])
+        self.assertTrue(all(value > 0 for value in totals.values()))
+        self.assertIsNotNone(lines[0]['latency']['p95'])
+
+    def test_reuse_transformer(self):
+        loader = Loader(
+            self.filename, model_class=TestModel,
+            options={'reuse_transformer': True})
+        loader.load()
+        self.assertEqual(TestModel.objects.all().count(), 3)
+        self.assertIsNotNone(loader.transformer)
+
 
 class TestExtractor(TestCase):
     """Test newly introduced ExtractorClass."""
@@ -131,6 +179,26 @@ class TestExtractor(TestCase):
             self.assertEqual(ct, 3)
             ct = 0
 
+    def test_not_line_based(self):
+
+        class NameReader(object):
+            # opens the source by name, like OGRReader
+
+            def __init__(self, source, **kwargs):
+                self.source = source
+
+        options = {'checkpoints': 'database'}
+        extractor = Extractor(self.filename, NameReader, options=options)
+        self.assertFalse(extractor.is_line_based())
+        self.assertEqual(extractor.seek(2, 40), 0)
+        self.assertIsNone(extractor.offset)
+        with extractor as reader:
+            self.assertNotIsInstance(reader.source, ShardFile)
+        directory = os.path.dirname(self.filename)
+        extractor = Extractor(directory, NameReader, options=options)
+        with extractor as reader:
+            self.assertEqual(reader.source, directory)
+
 
 class TestFileLikeObjectInLoader(TestCase):
 
@@ -155,3 +223,465 @@ class TestOptionPassing(TestCase):
         ldr = Loader('test', model_class=TestModel, options=options)
         self.assertEqual(ldr.extractor.options, options)
         self.assertFalse(ldr.generator.create)
+
+
+class TestChunkedLoad(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), 'data.txt')
+
+    def test_chunked_load(self):
+        with open(self.filename) as fil:
+            content = StringIO(text_type(fil.read()))
+        loader = Loader(
+            content, model_class=TestModel, options={'chunksize': 2})
+        with captured_output():
+            loader.load()
+        self.assertEqual(TestModel.objects.all().count(), 3)
+
+    def test_chunked_slice(self):
+        with open(self.filename) as fil:
+            content = StringIO(text_type(fil.read()))
+        loader = Loader(
+            content, model_class=TestModel,
+            options={'chunksize': 2, 'slice_end': 1})
+        with captured_output():
+            loader.load()
+        self.assertEqual(TestModel.objects.all().count(), 2)
+
+    def test_columnar_invalid_cells(self):
+        content = StringIO(text_type(
+            'record\tcount_a\tvalue_a\n1\t1\tx\n2\ttwo\ty\n'))
+        loader = Loader(
+            content, model_class=WideModel,
+            options={'chunksize': 2, 'columnar': True})
+        with captured_output() as (out, err):
+            loader.load()
+        self.assertIn(
+            'Invalid cells in line 0: value_a => left empty', out.getvalue())
+        self.assertIn(
+            'Invalid cells in line 1: count_a, value_a', out.getvalue())
+        self.assertEqual(WideModel.objects.count(), 2)
+
+
+class TestRecordIndex(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'data.txt')
+        with open(self.filename, 'w') as fil:
+            fil.write('record\tname\n')
+            for index in range(0, 10):
+                fil.write('{0}\tname{0}\n'.format(index))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_slice_with_index(self):
+        loader = Loader(self.filename, model_class=TestModelWoFk, options={
+            'record_index': 4, 'slice_begin': 6, 'slice_end': 8})
+        with captured_output():
+            counter = loader.load()
+        self.assertEqual(counter.created, 3)
+        self.assertEqual(
+            sorted(TestModelWoFk.objects.values_list('record', flat=True)),
+            ['6', '7', '8'])
+        self.assertTrue(os.path.exists(self.filename + '.idx'))
+        self.assertEqual(loader.extractor.offset, 12 + 4 * 8)
+
+
+class TestCheckpoints(TransactionTestCase):
+
+    class CrashingLoader(Loader):
+        model_class = Polish
+        crash = True
+        transformed = 0
+
+        def transform(self, dic):
+            if self.crash and dic['record'] == '7':
+                raise RuntimeError('Killed')
+            self.transformed += 1
+            return super(TestCheckpoints.CrashingLoader, self).transform(
+                dic)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'data.txt')
+        with open(self.filename, 'w') as fil:
+            fil.write('record\tilosc\n')
+            for index in range(0, 10):
+                fil.write('{0}\tilosc{0}\n'.format(index))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def resume(self, options):
+        """
+        Returns:
+            tuple: Records committed and line of the last checkpoint
+            when the first load crashed.
+        """
+        options = dict(options, feedbacksize=3, resume=True)
+        loader = self.CrashingLoader(self.filename, options=options)
+        with captured_output():
+            with self.assertRaises(RuntimeError):
+                loader.load()
+        committed = Polish.objects.count()
+        line = loader.checkpoints.get(loader.checkpoint_key).line
+        loader = self.CrashingLoader(self.filename, options=options)
+        loader.crash = False
+        with captured_output():
+            counter = loader.load()
+        self.assertEqual(counter.counter, 10)
+        self.assertEqual(counter.created + counter.updated, 10)
+        self.assertEqual(loader.transformed, 10 - line)
+        self.assertEqual(Polish.objects.count(), 10)
+        self.assertIsNone(loader.checkpoints.get(loader.checkpoint_key))
+        return committed, line
+
+    def test_file_checkpoints(self):
+        store = os.path.join(self.tmpdir, 'checkpoints.json')
+        committed, line = self.resume({'checkpoints': store})
+        # records after the checkpoint are committed in autocommit mode
+        self.assertEqual((committed, line), (7, 6))
+
+    def test_database_checkpoints(self):
+        committed, line = self.resume(
+            {'checkpoints': 'database', 'transactionsize': 2})
+        self.assertEqual((committed, line), (6, 6))
+
+    def test_chunked_checkpoints(self):
+        committed, line = self.resume(
+            {'checkpoints': 'database', 'chunksize': 2,
+             'transactionsize': 4})
+        self.assertEqual((committed, line), (4, 4))
+
+    def test_unnamed_source(self):
+        options = {
+            'checkpoints': os.path.join(self.tmpdir, 'checkpoints.json')}
+        with open(self.filename) as fil:
+            content = fil.read()
+        loader = Loader(
+            StringIO(text_type(content)), model_class=Polish, options=options)
+        with captured_output():
+            self.assertRaises(ImproperlyConfigured, loader.load)
+        self.assertEqual(Polish.objects.count(), 0)
+        loader = Loader(
+            StringIO(text_type(content)), model_class=Polish,
+            options=dict(options, checkpoint_key='data'))
+        with captured_output():
+            loader.load()
+        self.assertEqual(loader.checkpoint_key, 'data')
+        self.assertEqual(Polish.objects.count(), 10)
+
+    def test_stopped_by_hook(self):
+
+        class StoppingLoader(self.CrashingLoader):
+            crash = False
+
+            def feedback_hook(self, line):
+                return line < 6
+
+        options = {
+            'checkpoints': os.path.join(self.tmpdir, 'checkpoints.json'),
+            'feedbacksize': 3, 'resume': True}
+        loader = StoppingLoader(self.filename, options=options)
+        with captured_output():
+            loader.load()
+        self.assertEqual(Polish.objects.count(), 6)
+        checkpoint = loader.checkpoints.get(loader.checkpoint_key)
+        self.assertEqual(checkpoint.line, 6)
+        self.assertIsNotNone(checkpoint.offset)
+        loader = self.CrashingLoader(self.filename, options=options)
+        loader.crash = False
+        with captured_output():
+            counter = loader.load()
+        self.assertEqual(counter.counter, 10)
+        self.assertEqual(loader.transformed, 4)
+        self.assertEqual(Polish.objects.count(), 10)
+        self.assertIsNone(loader.checkpoints.get(loader.checkpoint_key))
+
+    def test_stopped_within_chunk(self):
+
+        class StoppingLoader(self.CrashingLoader):
+            crash = False
+
+            def feedback_hook(self, line):
+                return line < 2
+
+        options = {
+            'checkpoints': os.path.join(self.tmpdir, 'checkpoints.json'),
+            'feedbacksize': 2, 'chunksize': 5, 'resume': True}
+        loader = StoppingLoader(self.filename, options=options)
+        with captured_output():
+            results = list(loader.iter_results())
+        self.assertEqual(Polish.objects.count(), 5)
+        self.assertEqual(loader.counter.created, 5)
+        self.assertEqual(len(results), 5)
+        checkpoint = loader.checkpoints.get(loader.checkpoint_key)
+        self.assertEqual(checkpoint.line, 5)
+        self.assertIsNotNone(checkpoint.offset)
+        loader = self.CrashingLoader(self.filename, options=options)
+        loader.crash = False
+        with captured_output():
+            counter = loader.load()
+        self.assertEqual(counter.counter, 10)
+        self.assertEqual(loader.transformed, 5)
+        self.assertEqual(Polish.objects.count(), 10)
+
+
+class TestPipelinedLoad(TransactionTestCase):
+
+    class SlowLoader(Loader):
+
+        def transform(self, dic):
+            time.sleep(random.random() / 1000)
+            if dic['name'] == 'five':
+                raise ValueError('five')
+            return super(TestPipelinedLoad.SlowLoader, self).transform(dic)
+
+    content = (
+        'record\tname\tnumero\n1\tone\tuno\n2\ttwo\n3\tthree\tuno\n'
+        '4\tfour\tdue\n5\tfive\ttoo long numero\n6\tsix\tuno\n'
+        '7\tseven\tuno\n')
+
+    def load(self, options):
+        loader = self.SlowLoader(
+            StringIO(text_type(self.content)), model_class=TestModel,
+            options=options)
+        with captured_output() as (out, err):
+            counter = loader.load()
+        self.assertIsNone(loader.pipeline)
+        TestModel.objects.all().delete()
+        # without dates and object ids
+        return counter, re.sub(
+            r'\d{4}-\d{2}-\d{2}[\d :.]*|0x[0-9a-f]+', '', out.getvalue())
+
+    def test_pipelined_load(self):
+        counter, res = self.load({})
+        self.assertEqual((counter.created, counter.rejected), (5, 2))
+        self.assertIn('Transformation error in line 4', res)
+        for options in [
+                {'pipeline': True, 'pipeline_size': 2},
+                {'pipeline': 3, 'chunksize': 2},
+                {'pipeline': 1, 'slice_end': 4, 'feedbacksize': 2}]:
+            pipelined, pipelined_res = self.load(options)
+            if 'slice_end' in options:
+                self.assertEqual(pipelined.counter, 5)
+                continue
+            self.assertEqual(pipelined_res, res)
+
+
+class TestIterResults(TestCase):
+
+    content = (
+        'record\tname\tnumero\n1\tone\tuno\n2\ttwo\tuno\n'
+        '1\tone\tdue\n1\ttwo\tuno\n')
+
+    def test_iter_results(self):
+        loader = Loader(
+            StringIO(text_type(self.content)), model_class=TestModel)
+        with captured_output():
+            results = loader.iter_results()
+            first = next(results)
+            self.assertEqual(TestModel.objects.count(), 1)
+            results = [first] + list(results)
+        pks = dict(TestModel.objects.values_list('record', 'pk'))
+        self.assertEqual(
+            [result[:3] for result in results], [
+                (0, 'created', pks['1']), (1, 'created', pks['2']),
+                (2, 'updated', pks['1']), (3, 'updated', pks['1'])])
+        self.assertEqual(loader.counter.created, 2)
+
+    def test_buffered_results(self):
+        loader = Loader(
+            StringIO(text_type(self.content)), model_class=TestModel)
+        loader.generator = TestBufferedLoad.BulkGenerator(
+            TestModel, persistence=['name'])
+        with captured_output():
+            results = list(loader.iter_results())
+        self.assertEqual(
+            [result[:2] for result in results], [
+                (0, 'created'), (1, 'created'), (2, 'updated'),
+                (3, 'updated'), (3, 'rejected')])
+        self.assertIsNone(results[0].pk)
+        self.assertIsInstance(results[-1].error, IntegrityError)
+
+    def test_stop_iterating(self):
+        loader = Loader(
+            StringIO(text_type(self.content)), model_class=TestModel)
+        loader.generator = TestBufferedLoad.BulkGenerator(TestModel)
+        loader.logfile = StringIO()
+        with captured_output():
+            for result in loader.iter_results():
+                if result.line == 1:
+                    break
+        self.assertEqual(TestModel.objects.count(), 2)
+        self.assertEqual(loader.counter.created, 2)
+        self.assertTrue(loader.logfile.closed)
+
+
+class TestBufferedLoad(TestCase):
+
+    class BulkGenerator(BulkMixin, InstanceGenerator):
+        pass
+
+    def test_rejection_after_flush(self):
+        content = StringIO(text_type(
+            'record\tname\tnumero\n1\tone\tuno\n1\ttwo\tuno\n'
+            '3\tthree\tuno\n'))
+        loader = Loader(content, model_class=TestModel)
+        loader.generator = self.BulkGenerator(
+            TestModel, persistence=['name'])
+        with captured_output() as (out, err):
+            loader.load()
+        res = out.getvalue()
+        self.assertIn('Instance generation error in line 1', res)
+        self.assertIn('\n2 created\n0 updated\n', res)
+        self.assertIn('\n1 rejected', res)
+        self.assertEqual(TestModel.objects.count(), 2)
+
+
+class TestTransactionLoad(TransactionTestCase):
+
+    class NameLoader(Loader):
+        model_class = TestModel
+        persistence = ['name']
+
+    content = (
+        'record\tname\tnumero\n1\tone\tuno\n1\ttwo\tuno\n'
+        '3\tthree\tuno\n4\tfour\tuno\n5\tfive\tuno\n')
+
+    def load(self, options):
+        loader = self.NameLoader(
+            StringIO(text_type(self.content)), options=options)
+        with captured_output() as (out, err):
+            loader.load()
+        return out.getvalue()
+
+    def test_rejection_in_transaction(self):
+        res = self.load({'transactionsize': 2})
+        self.assertIn('Instance generation error in line 1', res)
+        self.assertIn('\n4 created\n0 updated\n', res)
+        self.assertIn('\n1 rejected', res)
+        self.assertEqual(
+            sorted(TestModel.objects.values_list('name', flat=True)),
+            ['five', 'four', 'one', 'three'])
+
+    def test_chunked_rejection_in_transaction(self):
+        res = self.load({'transactionsize': 3, 'chunksize': 2})
+        self.assertIn('Instance generation error in line 1', res)
+        self.assertIn('\n1 rejected', res)
+        self.assertEqual(TestModel.objects.count(), 4)
+
+    def test_slice_in_transaction(self):
+        self.load({'transactionsize': 2, 'slice_end': 2})
+        self.assertEqual(TestModel.objects.count(), 2)
+
+
+class TestParallelLoader(TransactionTestCase):
+
+    class NameLoader(Loader):
+        model_class = TestModel
+        persistence = ['name']
+
+    class MyParallelLoader(ParallelLoader):
+        loader_class = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'data.txt')
+        with open(self.filename, 'w') as fil:
+            fil.write(
+                'record\tname\tnumero\n0\tzero\tuno\n1\tone\tuno\n'
+                '2\ttwo\tuno\n3\tthree\tuno\n0\tfour\tuno\n'
+                '5\tfive\tuno\n')
+        self.MyParallelLoader.loader_class = self.NameLoader
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parallel_load(self):
+        logfilename = os.path.join(self.tmpdir, 'load.log')
+        loader = self.MyParallelLoader(self.filename, options={
+            'processes': 1, 'shards': 3, 'logfilename': logfilename})
+        with captured_output():
+            counter = loader.load()
+        self.assertEqual(counter.counter, 6)
+        self.assertEqual(counter.created, 5)
+        self.assertEqual(counter.rejected, 1)
+        self.assertEqual(TestModel.objects.count(), 5)
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir)), ['data.txt', 'load.log'])
+        with open(logfilename) as fil:
+            log = fil.read()
+        self.assertIn('in 3 shards', log)
+        self.assertIn('Start line: 4', log)
+        self.assertIn('Instance generation error in line 4', log)
+        self.assertIn('\n5 created\n', log)
+
+
+class TestFingerprints(TransactionTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = os.path.join(self.tmpdir, 'fingerprints')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, content, chunksize=None):
+        loader = Loader(
+            StringIO(text_type(content)), model_class=TestModel,
+            options={'fingerprints': self.store, 'chunksize': chunksize})
+        with captured_output() as (out, err):
+            loader.load()
+        return out.getvalue()
+
+    def test_fingerprints(self):
+        content = (
+            'record\tname\tnumero\n1\tone\tuno\n2\ttwo\tdue\n'
+            '3\tthree\ttre\n')
+        res = self.load(content)
+        self.assertIn('\n3 created\n0 updated\n', res)
+        TestModel.objects.filter(record='1').update(name='changed')
+        res = self.load(content.replace('two', 'zwei'))
+        self.assertIn('\n0 created\n1 updated\n', res)
+        self.assertIn('\n2 skipped\n', res)
+        self.assertEqual(TestModel.objects.get(record='1').name, 'changed')
+        self.assertEqual(TestModel.objects.get(record='2').name, 'zwei')
+        res = self.load(content, chunksize=2)
+        self.assertIn('\n0 created\n1 updated\n', res)
+        self.assertIn('\n2 skipped\n', res)
+        self.assertEqual(TestModel.objects.get(record='2').name, 'two')
+
+    def test_rejected_not_stored(self):
+        content = (
+            'record\tname\tnumero\n1\tone\tuno\n'
+            '2\ttwo\n')
+        # IntegrityError, numero is required
+        res = self.load(content)
+        self.assertIn('\n1 created\n', res)
+        self.assertIn('\n1 rejected\n', res)
+        with open(self.store) as fil:
+            self.assertEqual(len(fil.readlines()), 1)
+        res = self.load(content.replace('two\n', 'two\tdue\n'))
+        self.assertIn('\n1 created\n', res)
+        self.assertIn('\n1 skipped\n', res)
+        self.assertEqual(TestModel.objects.get(record='2').name, 'two')
+
+    def test_unwritten_not_stored(self):
+        content = 'record\tname\tnumero\n1\tone\tuno\n2\ttwo\tdue\n'
+        for chunksize in (None, 2):
+            loader = Loader(
+                StringIO(text_type(content)), model_class=TestModel,
+                options={'fingerprints': self.store, 'chunksize': chunksize})
+            loader.generator.create = False
+            with captured_output():
+                loader.load()
+            self.assertEqual(TestModel.objects.count(), 0)
+            with open(self.store) as fil:
+                self.assertEqual(fil.read().strip(), '')
+        res = self.load(content)
+        self.assertIn('\n2 created\n', res)
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+from six import StringIO
+
+import json
+import os
+import tracemalloc
+import warnings
+from django.test import TestCase
+from etl_sync.loaders import Loader
+from etl_sync.memory import (
+    MemoryMonitor, MemoryCeilingExceeded, format_bytes, get_peak_rss)
+from etl_sync.reporters import JSONLinesReporter
+from .models import TestModel
+from .utils import captured_output
+
+
+class TestMemoryMonitor(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), 'data.txt')
+
+    def test_check(self):
+        monitor = MemoryMonitor(top=3)
+        monitor.start()
+        self.assertTrue(tracemalloc.is_tracing())
+        data = [str(index) * 10 for index in range(0, 10000)]
+        measurement = monitor.check()
+        self.assertEqual(len(data), 10000)
+        self.assertGreater(measurement['traced'], 0)
+        self.assertGreater(get_peak_rss(), 0)
+        self.assertFalse(measurement['exceeded'])
+        self.assertLessEqual(len(measurement['growth']), 3)
+        self.assertTrue(any(
+            site.startswith(__file__.rstrip('c'))
+            for site, _, _ in measurement['growth']))
+        self.assertIn('Memory growth:', monitor.format(measurement))
+        monitor.close()
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_ceiling(self):
+        monitor = MemoryMonitor(ceiling=1, trace=False)
+        self.assertTrue(monitor.check()['exceeded'])
+        self.assertEqual(monitor.check()['growth'], [])
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            monitor.enforce()
+        self.assertEqual(len(caught), 1)
+        monitor.abort = True
+        self.assertRaises(MemoryCeilingExceeded, monitor.enforce)
+
+    def test_format_bytes(self):
+        self.assertEqual(format_bytes(512), '512.0 B')
+        self.assertEqual(format_bytes(-1536), '-1.5 kB')
+        self.assertEqual(format_bytes(3 * 1024 ** 3), '3.0 GB')
+        self.assertEqual(format_bytes(None), 'n/a')
+
+    def test_loader(self):
+        output = StringIO()
+        loader = Loader(
+            self.filename, model_class=TestModel, options={
+                'memory': True, 'feedbacksize': 2,
+                'reporters': [JSONLinesReporter(output)]})
+        with captured_output() as (out, err):
+            loader.load()
+        self.assertIn('Memory: RSS', out.getvalue())
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertGreater(lines[-1]['memory']['traced'], 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_loader_abort(self):
+        loader = Loader(
+            self.filename, model_class=TestModel, options={
+                'memory_ceiling': 1, 'memory_abort': True, 'feedbacksize': 2})
+        with captured_output() as (out, err):
+            self.assertRaises(MemoryCeilingExceeded, loader.load)
+        self.assertIn('ceiling of 1.0 B exceeded', out.getvalue())
+        self.assertEqual(TestModel.objects.count(), 2)
@@ -0,0 +1,57 @@
+from __future__ import print_function
+
+import random
+import threading
+import time
+from unittest import TestCase
+from etl_sync.pipelines import Pipeline
+
+
+class TestPipeline(TestCase):
+
+    def setUp(self):
+        self.records = iter(range(0, 50))
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def extract(self):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return next(self.records)
+
+    def transform(self, value):
+        time.sleep(random.random() / 1000)
+        if value == 30:
+            raise KeyError(value)
+        return value * 2
+
+    def collect(self, pipeline):
+        ret = []
+        try:
+            while True:
+                ret.append(pipeline.next())
+                with self.lock:
+                    self.in_flight -= 1
+        except StopIteration:
+            pass
+        finally:
+            pipeline.close()
+        return ret
+
+    def test_order(self):
+        pipeline = Pipeline(
+            self.extract, self.transform, workers=4, size=5,
+            limit=20).start()
+        self.assertEqual(
+            self.collect(pipeline), [value * 2 for value in range(0, 20)])
+        self.assertLessEqual(self.max_in_flight, 6)
+
+    def test_error(self):
+        pipeline = Pipeline(self.extract, self.transform, workers=3).start()
+        with self.assertRaises(KeyError):
+            self.collect(pipeline)
+        self.assertEqual(pipeline.index, 31)
+        self.assertTrue(all(
+            not thread.is_alive() for thread in pipeline.threads))
@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+
+import os
+from django.db import connection
+from django.test import TestCase
+from etl_sync.loaders import Loader
+from etl_sync.queries import QueryCounter, QueryAssertionsMixin
+from etl_sync.timers import StageTimers
+from .models import TestModel, Polish
+from .utils import captured_output
+
+
+class TestQueryCounter(QueryAssertionsMixin, TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), 'data.txt')
+
+    def test_counter(self):
+        timers = StageTimers()
+        queries = QueryCounter(budget=1, timers=timers)
+        queries.begin()
+        with queries.install(connection):
+            Polish.objects.count()
+            with timers.time('write'):
+                Polish.objects.create(record='1', ilosc='jeden')
+        Polish.objects.count()
+        self.assertEqual(queries.queries, 2)
+        self.assertEqual(list(queries.stages), ['other', 'write'])
+        self.assertEqual(queries.stages['write'][0], 1)
+        self.assertEqual(queries.end([10]), [(10, 2.0)])
+        queries.begin()
+        with queries.install(connection):
+            Polish.objects.count()
+        self.assertEqual(queries.end([11, 12]), [])
+        self.assertEqual(queries.records, 3)
+        self.assertEqual(queries.max_per_record, 2)
+        self.assertEqual(queries.flagged, [(10, 2.0)])
+        # queries of records in progress are not averaged
+        queries.begin()
+        with queries.install(connection):
+            Polish.objects.count()
+        self.assertIn('1.00 per record', queries.get_stats()['Queries'])
+        self.assertIn('Queries', queries.get_stats())
+
+    def test_query_budget(self):
+        loader = Loader(
+            self.filename, model_class=TestModel,
+            options={'query_budget': 1, 'logfilename': os.devnull})
+        with captured_output():
+            loader.load()
+        self.assertEqual(loader.queries.records, 3)
+        self.assertEqual(len(loader.queries.flagged), 3)
+        self.assertIn('lookup', loader.queries.stages)
+        self.assertIn('write', loader.queries.stages)
+
+    def test_savepoint_stages(self):
+        for options in ({}, {'chunksize': 2}):
+            TestModel.objects.all().delete()
+            loader = Loader(
+                self.filename, model_class=TestModel, options=dict(
+                    options, count_queries=True, transactionsize=2))
+            with captured_output():
+                loader.load()
+            self.assertNotIn('other', loader.queries.stages)
+            self.assertIn('write', loader.queries.stages)
+
+    def test_assert_max_queries(self):
+        loader = Loader(self.filename, model_class=TestModel)
+        with captured_output():
+            self.assertRaises(
+                AssertionError, self.assertMaxQueriesPerRecord, loader, 1)
+        loader = Loader(self.filename, model_class=TestModel)
+        with captured_output():
+            queries = self.assertMaxQueriesPerRecord(loader, 20)
+        self.assertEqual(queries.flagged, [])
@@ -31,3 +31,10 @@ class TestReaders(TestCase):
         self.assertEqual(dic['text'], u'three')
         dic = reader.next()
         self.assertEqual(dic['text'], u'two')
+
+    def test_ogr_reader_iteration(self):
+        reader = OGRReader(self.testfilename)
+        self.assertIs(iter(reader), reader)
+        self.assertEqual(next(reader)['text'], u'three')
+        self.assertEqual(
+            [dic['text'] for dic in reader][0], u'two')
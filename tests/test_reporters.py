@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+from six import StringIO
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from etl_sync.loaders import FeedbackCounter
+from etl_sync.reporters import JSONLinesReporter, PrometheusReporter
+from etl_sync.timers import StageTimers
+from .utils import captured_output
+
+
+class TestReporters(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.timers = StageTimers()
+        self.timers.add('read', 0.5)
+        self.timers.add_latency(0.002)
+        self.counter = FeedbackCounter(timers=self.timers)
+        for index in range(0, 4):
+            self.counter.create()
+        self.counter.reject()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_json_lines(self):
+        output = StringIO()
+        self.counter.reporters = [JSONLinesReporter(output)]
+        with captured_output() as (out, err):
+            self.counter.feedback(filename='data.txt', records=5)
+        self.assertIn('Stages: read 0.500s', out.getvalue())
+        self.assertIn('Latency: p50 2.000ms', out.getvalue())
+        self.counter.create()
+        self.counter.finish('data.txt')
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['total'], 5)
+        self.assertEqual(lines[0]['created'], 4)
+        self.assertEqual(lines[0]['stages']['read'], 0.5)
+        self.assertEqual(lines[0]['latency']['p50'], 0.002)
+        # stage timings are reset at every feedback
+        self.assertEqual(lines[1]['records'], 1)
+        self.assertEqual(lines[1]['stages']['read'], 0)
+        self.assertEqual(lines[1]['stage_totals']['read'], 0.5)
+        filename = os.path.join(self.tmp, 'feedback.jsonl')
+        reporter = JSONLinesReporter(filename)
+        reporter.report({'total': 1})
+        reporter.close()
+        with open(filename) as fil:
+            self.assertEqual(json.loads(fil.read()), {'total': 1})
+
+    def test_prometheus(self):
+        filename = os.path.join(self.tmp, 'etl.prom')
+        self.counter.reporters = [PrometheusReporter(filename)]
+        with captured_output():
+            self.counter.feedback(filename='da"ta.txt', records=5)
+        with open(filename) as fil:
+            lines = fil.read().splitlines()
+        self.assertIn('etl_sync_records_total{source="da\\"ta.txt"} 5.0', lines)
+        self.assertIn(
+            'etl_sync_results_total{source="da\\"ta.txt",result="created"} '
+            '4.0', lines)
+        self.assertIn(
+            'etl_sync_stage_seconds_total{source="da\\"ta.txt",'
+            'stage="read"} 0.5', lines)
+        self.assertIn('# TYPE etl_sync_record_latency_seconds gauge', lines)
+        self.assertFalse(os.path.exists(filename + '.tmp'))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from etl_sync.shards import get_shards, ShardFile, RecordIndex
+
+
+class ShardFileMixin(object):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'data.txt')
+        with io.open(self.filename, 'w', encoding='utf-8') as fil:
+            fil.write(u'record\tname\n')
+            for index in range(0, 10):
+                fil.write(u'{0}\tnäme{0}\n'.format(index))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class TestShards(ShardFileMixin, TestCase):
+
+    def read(self, shards):
+        ret = []
+        for begin, end, line in shards:
+            with ShardFile(
+                    self.filename, begin, end, encoding='utf-8') as fil:
+                lines = list(fil)
+            self.assertEqual(lines[0], u'record\tname\n')
+            self.assertEqual(lines[1], u'{0}\tnäme{0}\n'.format(line))
+            ret.extend(lines[1:])
+        return ret
+
+    def test_get_shards(self):
+        shards = get_shards(self.filename, 3)
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(shards[-1][1], os.path.getsize(self.filename))
+        self.assertEqual(len(self.read(shards)), 10)
+
+    def test_more_shards_than_lines(self):
+        shards = get_shards(self.filename, 50)
+        self.assertLessEqual(len(shards), 10)
+        self.assertEqual(len(self.read(shards)), 10)
+
+    def test_single_shard(self):
+        shards = get_shards(self.filename, 1)
+        self.assertEqual(shards, [(12, os.path.getsize(self.filename), 0)])
+
+
+class TestRecordIndex(ShardFileMixin, TestCase):
+
+    def test_lookup(self):
+        index = RecordIndex(self.filename, interval=4)
+        self.assertEqual(index.lookup(0), (12, 0))
+        offset, record = index.lookup(6)
+        self.assertEqual(record, 4)
+        with ShardFile(self.filename, offset, offset + 1000) as fil:
+            self.assertEqual(list(fil)[1], u'4\tnäme4\n')
+        self.assertEqual(index.lookup(100)[1], 8)
+        self.assertTrue(os.path.exists(self.filename + '.idx'))
+
+    def test_outdated(self):
+        RecordIndex(self.filename, interval=4).build()
+        self.assertTrue(RecordIndex(self.filename, interval=4).load())
+        self.assertFalse(RecordIndex(self.filename, interval=5).load())
+        with io.open(self.filename, 'a', encoding='utf-8') as fil:
+            fil.write(u'10\tnäme10\n')
+        self.assertFalse(RecordIndex(self.filename, interval=4).load())
@@ -0,0 +1,49 @@
+from __future__ import absolute_import
+
+import time
+from unittest import TestCase
+from etl_sync.timers import StageTimers, timed, percentile, NULL_TIMER
+
+
+class TestStageTimers(TestCase):
+
+    def test_nested_stages(self):
+        timers = StageTimers()
+        with timers.time('prepare'):
+            time.sleep(0.01)
+            with timers.time('lookup'):
+                time.sleep(0.02)
+        self.assertGreaterEqual(timers.totals['lookup'], 0.02)
+        self.assertGreaterEqual(timers.totals['prepare'], 0.01)
+        self.assertLess(timers.totals['prepare'], 0.02)
+        self.assertEqual(timers.interval, timers.totals)
+        timers.reset_interval()
+        self.assertEqual(timers.interval['lookup'], 0)
+        self.assertGreaterEqual(timers.totals['lookup'], 0.02)
+
+    def test_exception(self):
+        timers = StageTimers()
+        with self.assertRaises(ValueError):
+            with timers.time('write'):
+                raise ValueError
+        self.assertEqual(timers.local.stack, [])
+        self.assertGreater(timers.totals['write'], 0)
+
+    def test_latency(self):
+        timers = StageTimers()
+        self.assertEqual(
+            timers.get_latency(), {'p50': None, 'p95': None})
+        for index in range(1, 101):
+            timers.add_latency(index)
+        timers.add_latency(10, count=0)
+        self.assertEqual(timers.get_latency(), {'p50': 51, 'p95': 95})
+        timers.add_latency(4, count=4)
+        self.assertEqual(timers.latencies[-4:], [1, 1, 1, 1])
+        timers.reset_interval()
+        self.assertEqual(timers.latencies, [])
+
+    def test_timed(self):
+        self.assertIs(timed(None, 'read'), NULL_TIMER)
+        with timed(None, 'read'):
+            pass
+        self.assertEqual(percentile([1, 2, 3], 0.5), 2)
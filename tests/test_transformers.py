@@ -4,6 +4,7 @@ from __future__ import absolute_import
 from unittest import TestCase
 from etl_sync.transformations import Transformer
 from django import forms
+from django.core.exceptions import ValidationError
 from datetime import datetime
 
 
@@ -62,3 +63,29 @@ class TestTransformer(TestCase):
         self.assertIsInstance(transformer.cleaned_data['date'], datetime)
         transformer = MyTransformer({'name': 'fred'})
         self.assertFalse(transformer.is_valid())
+
+    def test_transform_record(self):
+        transformer = MyTransformer(defaults={'name': 'fred'})
+        res = transformer.transform_record({'date': '2001-01-01'})
+        self.assertEqual(res['name'], 'fred')
+        self.assertIsInstance(res['date'], datetime)
+        res = transformer.transform_record({'date': '2002-01-01'})
+        self.assertEqual(res['date'].year, 2002)
+        self.assertRaises(
+            ValidationError, transformer.transform_record, {'name': 'fred'})
+
+    def test_transform_batch(self):
+        transformer = Transformer()
+        transformer.blacklist = {'name': [r'^rubish']}
+        res = transformer.transform_batch([
+            {'name': 'fred'}, {'name': 'rubish'}, {'name': 'barney'}])
+        self.assertEqual([dic for dic, error in res], [
+            {'name': 'fred'}, None, {'name': 'barney'}])
+        self.assertIsInstance(res[1][1], ValidationError)
+        # replaced blacklists are compiled again
+        transformer.blacklist = {'name': [r'^fred']}
+        res = transformer.transform_batch([{'name': 'fred'}])
+        self.assertIsNone(res[0][0])
+        transformer.blacklist = {'name': [None]}
+        self.assertRaises(
+            ValidationError, transformer.transform_record, {'name': 'fred'})
@@ -0,0 +1,106 @@
+# Python 3.x compatibility
+from __future__ import absolute_import
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from etl_sync.transformations import Transformer
+from etl_sync.validators import Validator, get_validator
+from tests.models import WellDefinedModel, WideModel
+
+
+class RecordForm(forms.Form):
+    name = forms.CharField(max_length=5)
+    number = forms.IntegerField(min_value=0, required=False)
+    value = forms.FloatField(required=False)
+    flag = forms.BooleanField(required=False)
+    category = forms.ChoiceField(
+        choices=[('a', 'A'), ('b', 'B')], required=False)
+    date = forms.DateTimeField(required=False)
+
+
+class CustomForm(RecordForm):
+
+    def clean_name(self):
+        return self.cleaned_data['name'].upper()
+
+
+class RecordTransformer(Transformer):
+    forms = [RecordForm, CustomForm]
+    compile_forms = True
+
+
+RECORDS = [
+    {'name': 'fred'},
+    {'name': ' fred ', 'number': '12', 'value': '1.5', 'flag': 'false',
+     'category': 'a', 'date': '2001-01-01 10:00'},
+    {'name': 'fred', 'number': '1.0', 'value': 2, 'flag': '0'},
+    {'name': 'toolong'},
+    {'name': '', 'number': '-1', 'value': 'inf', 'category': 'c'},
+    {'name': 'fred', 'number': 'x', 'value': 'nan', 'date': 'tomorrow'},
+    {'name': 3, 'number': 3, 'value': ''},
+    {'flag': True}]
+
+
+class TestValidator(TestCase):
+
+    def assertSameResult(self, validator, form_class, dic):
+        form = form_class(dic.copy())
+        if form.is_valid():
+            self.assertEqual(validator.validate(dic.copy()), form.cleaned_data)
+        else:
+            with self.assertRaises(ValidationError) as cm:
+                validator.validate(dic.copy())
+            self.assertEqual(
+                cm.exception.message_dict, ValidationError(
+                    form.errors).message_dict)
+
+    def test_from_form(self):
+        validator = Validator.from_form(RecordForm)
+        self.assertEqual(
+            [name for name, field in validator.fields],
+            ['name', 'number', 'value', 'flag', 'category', 'date'])
+        for dic in RECORDS:
+            self.assertSameResult(validator, RecordForm, dic)
+
+    def test_from_model(self):
+        validator = Validator.from_model(
+            WellDefinedModel, fields=['something', 'somenumber'])
+        form_class = forms.models.modelform_factory(
+            WellDefinedModel, fields=['something', 'somenumber'])
+        for dic in [{'something': 'a', 'somenumber': '1'},
+                    {'something': 'a' * 21, 'somenumber': 'b'}, {}]:
+            self.assertSameResult(validator, form_class, dic)
+        validator = Validator.from_model(WideModel, exclude=['observed'])
+        names = [name for name, field in validator.fields]
+        self.assertIn('count_a', names)
+        self.assertNotIn('id', names)
+        self.assertNotIn('observed', names)
+        # null fields are required unless blank=True like in ModelForms
+        self.assertRaises(
+            ValidationError, validator.validate, {'record': '1'})
+        validator = Validator.from_model(
+            WideModel, fields=['record', 'count_a', 'flag'])
+        res = validator.validate({'record': '1', 'count_a': '2'})
+        self.assertEqual(res, {'record': '1', 'count_a': 2, 'flag': False})
+
+    def test_not_compilable(self):
+        self.assertRaises(ValueError, Validator.from_form, CustomForm)
+        self.assertIs(get_validator(CustomForm), CustomForm)
+        validator = get_validator(RecordForm)
+        self.assertIsInstance(validator, Validator)
+        self.assertIs(get_validator(RecordForm), validator)
+        self.assertIs(get_validator(validator), validator)
+
+    def test_compiled_transformer(self):
+        transformer = RecordTransformer()
+        self.assertIsInstance(transformer.get_forms()[0], Validator)
+        self.assertIs(transformer.get_forms()[1], CustomForm)
+        res = transformer.transform_record({'name': 'fred', 'number': '2'})
+        self.assertEqual(res['name'], 'FRED')
+        self.assertEqual(res['number'], 2)
+        transformer.compile_forms = False
+        self.assertEqual(transformer.transform_record(
+            {'name': 'fred', 'number': '2'}), res)
+        self.assertRaises(
+            ValidationError, transformer.transform_record, {'number': '2'})